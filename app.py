@@ -1,25 +1,28 @@
 import streamlit as st
 import psycopg2
-from psycopg2 import pool
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import re
+import csv
 import json
-import smtplib
 import hashlib
 import time
-import random
 import datetime
 import pytz
-import os
 import math
-from urllib.parse import urlparse, parse_qs
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import select
+import threading
 from apscheduler.schedulers.background import BackgroundScheduler
 import extra_streamlit_components as stx
 from concurrent.futures import ThreadPoolExecutor, as_completed
+# Jádro kontroly (DB, API, notifikace, monitor_job) - sdílené s worker.py
+import monitor
+from monitor import (
+    DB_URI, SMTP_EMAIL, SOUDY_MAPA, MAX_POKUSU, KANAL_DATA, KANAL_STAV, USEKY_BEHU,
+    get_secret, get_now, init_db, db_spojeni, metriky_poolu, zvys_verzi_dat, monitor_job,
+    parsuj_url, sloupce_spisu, spisova_znacka, otisk_udalosti, vloz_pripad,
+    stahni_odpoved_infosoudu_cache, AdaptivniLimiter, je_docasna_chyba, backoff_zpozdeni,
+    percentil_z_histogramu, spust_exporter_metrik,
+)
 
 # --- KONFIGURACE UI ---
 try:
@@ -27,11 +30,6 @@ try:
 except:
     pass # Ignorujeme, pokud běžíme jako worker bez prohlížeče
 
-# --- 🕰️ NASTAVENÍ ČASOVÉHO PÁSMA (CZECHIA) ---
-def get_now():
-    tz = pytz.timezone('Europe/Prague')
-    return datetime.datetime.now(tz)
-
 # --- 🔄 GLOBÁLNÍ STAV SCHEDULERU ---
 if not hasattr(st, "monitor_status"):
     st.monitor_status = {
@@ -43,103 +41,20 @@ if not hasattr(st, "monitor_status"):
         "last_finished": None
     }
 
-# --- 🔐 NAČTENÍ TAJNÝCH ÚDAJŮ (SECRETS) ---
-def get_secret(key):
-    value = os.getenv(key)
-    if value is not None:
-        return value
-    try:
-        if hasattr(st, "secrets") and key in st.secrets:
-            return st.secrets[key]
-    except Exception:
-        pass
-    return None
-
-try:
-    DB_URI = get_secret("SUPABASE_DB_URL")
-    SUPER_ADMIN_USER = get_secret("SUPER_ADMIN_USER")
-    SUPER_ADMIN_PASS = get_secret("SUPER_ADMIN_PASS")
-    SUPER_ADMIN_EMAIL = get_secret("SUPER_ADMIN_EMAIL")
-    
-    SMTP_SERVER = "smtp.gmail.com"
-    SMTP_PORT = 587
-    SMTP_EMAIL = get_secret("SMTP_EMAIL")
-    SMTP_PASSWORD = get_secret("SMTP_PASSWORD")
-
-    if not DB_URI or not SMTP_EMAIL:
-        st.error("Chybí klíčová nastavení (DB_URI nebo EMAIL). Zkontrolujte Variables.")
-        st.stop()
+# --- 🔐 KONTROLA NASTAVENÍ (secrets načítá monitor.get_secret) ---
+SUPER_ADMIN_USER = get_secret("SUPER_ADMIN_USER")
+SUPER_ADMIN_PASS = get_secret("SUPER_ADMIN_PASS")
 
-except Exception as e:
-    st.error(f"Kritická chyba konfigurace: {e}")
+if not DB_URI or not SMTP_EMAIL:
+    st.error("Chybí klíčová nastavení (DB_URI nebo EMAIL). Zkontrolujte Variables.")
     st.stop()
 
-# --- 🏗️ DATABÁZOVÝ POOL ---
-@st.cache_resource
-def init_connection_pool():
-    try:
-        return psycopg2.pool.SimpleConnectionPool(1, 10, dsn=DB_URI)
-    except Exception as e:
-        st.error(f"Nepodařilo se vytvořit DB Pool: {e}")
-        return None
-
-def get_db_connection():
-    db_pool = init_connection_pool()
-    if db_pool:
-        return db_pool.getconn(), db_pool
-    else:
-        raise Exception("DB Pool není inicializován.")
-
 # --- 🍪 SPRÁVCE COOKIES ---
 def get_cookie_manager():
     return stx.CookieManager(key="cookie_mgr")
 
 cookie_manager = get_cookie_manager()
 
-# --- KOMPLETNÍ DATABÁZE SOUDŮ ---
-SOUDY_MAPA = {
-    "NS": "Nejvyšší soud", "NSJIMBM": "Nejvyšší soud", "NSS": "Nejvyšší správní soud",
-    "VSPHAAB": "Vrchní soud v Praze", "VSOL": "Vrchní soud v Olomouci",
-    "MSPHAAB": "Městský soud v Praze", 
-    "OSPHA01": "Obvodní soud pro Prahu 1", "OSPHA02": "Obvodní soud pro Prahu 2",
-    "OSPHA03": "Obvodní soud pro Prahu 3", "OSPHA04": "Obvodní soud pro Prahu 4",
-    "OSPHA05": "Obvodní soud pro Prahu 5", "OSPHA06": "Obvodní soud pro Prahu 6",
-    "OSPHA07": "Obvodní soud pro Prahu 7", "OSPHA08": "Obvodní soud pro Prahu 8",
-    "OSPHA09": "Obvodní soud pro Prahu 9", "OSPHA10": "Obvodní soud pro Prahu 10",
-    "KSSTCAB": "Krajský soud v Praze", "OSSTCBN": "Okresní soud v Benešově", "OSBE": "Okresní soud v Berouně",
-    "OSSTCKL": "Okresní soud v Kladně", "OSSTCKO": "Okresní soud v Kolíně", "OSKH": "Okresní soud v Kutné Hoře",
-    "OSME": "Okresní soud v Mělníku", "OSSTCMB": "Okresní soud v Mladé Boleslavi", "OSSTCNB": "Okresní soud v Nymburce",
-    "OSSTCPY": "Okresní soud Praha-východ", "OSSTCPZ": "Okresní soud Praha-západ", "OSPB": "Okresní soud v Příbrami",
-    "OSSTCRA": "Okresní soud v Rakovníku", "KSJICCB": "Krajský soud v Českých Budějovicích", "KSCBTAB": "KS Č. Budějovice - pobočka Tábor",
-    "OSJICCB": "Okresní soud v Českých Budějovicích", "OSCK": "Okresní soud v Českém Krumlově", "OSJH": "Okresní soud v Jindřichově Hradci",
-    "OSJICPE": "Okresní soud v Pelhřimově", "OSJICPI": "Okresní soud v Písku", "OSPT": "Okresní soud v Prachaticích",
-    "OSST": "Okresní soud ve Strakonicích", "OSJICTA": "Okresní soud v Táboře", "KSZPCPM": "Krajský soud Plzeň",
-    "KSPLKV": "KS Plzeň - pobočka Karlovy Vary", "OSZPCDO": "Okresní soud v Domažlicích", "OSZPCCH": "Okresní soud v Chebu",
-    "OSKV": "Okresní soud v Karlových Varech", "OSZPCKV": "Okresní soud v Klatovech", "OSZPCPM": "Okresní soud Plzeň-město",
-    "OSPJ": "Okresní soud Plzeň-jih", "OSZPCPS": "Okresní soud Plzeň-sever", "OSZPCRO": "Okresní soud v Rokycanech",
-    "OSZPCSO": "Okresní soud v Sokolově", "OSZPCTC": "Okresní soud v Tachově", "KSSCEUL": "Krajský soud v Ústí nad Labem",
-    "KSULLBC": "KS Ústí n.L. - pobočka Liberec", "OSCL": "Okresní soud v České Lípě", "OSSCEDC": "Okresní soud v Děčíně",
-    "OSSCECV": "Okresní soud v Chomutově", "OSSCEJN": "Okresní soud v Jablonci nad Nisou", "OSSCELB": "Okresní soud v Liberci",
-    "OSLT": "Okresní soud v Litoměřicích", "OSSCELN": "Okresní soud v Lounech", "OSSCEMO": "Okresní soud v Mostě",
-    "OSSCETP": "Okresní soud v Teplicích", "OSSCEUL": "Okresní soud v Ústí nad Labem", "KSVYCHK": "Krajský soud v Hradci Králové",
-    "KSHKPCE": "KS Hradec Králové - pobočka Pardubice", "OSVYCHB": "Okresní soud v Havlíčkově Brodě", "OSVYCHK": "Okresní soud v Hradci Králové",
-    "OSCHR": "Okresní soud v Chrudimi", "OSJC": "Okresní soud v Jičíně", "OSNA": "Okresní soud v Náchodě",
-    "OSVYCPA": "Okresní soud v Pardubicích", "OSVYCRK": "Okresní soud v Rychnově nad Kněžnou", "OSSE": "Okresní soud v Semilech",
-    "OSVYCSY": "Okresní soud ve Svitavách", "OSTU": "Okresní soud v Trutnově", "OSUO": "Okresní soud v Ústí nad Orlicí",
-    "KSJIMBM": "Krajský soud v Brně", "KSBRJI": "KS Brno - pobočka Jihlava", "KSBRZL": "KS Brno - pobočka Zlín",
-    "OSJIMBM": "Městský soud v Brně", "OSBK": "Okresní soud v Blansku", "OSBO": "Okresní soud Brno-venkov",
-    "OSJIMBV": "Okresní soud v Břeclavi", "OSHO": "Okresní soud v Hodoníně", "OSJI": "Okresní soud v Jihlavě",
-    "OSKM": "Okresní soud v Kroměříži", "OSJIMPV": "Okresní soud v Prostějově", "OSTRB": "Okresní soud v Třebíči",
-    "OSJIMUH": "Okresní soud v Uherském Hradišti", "OSJIMVY": "Okresní soud ve Vyškově", "OSJIMZL": "Okresní soud ve Zlíně",
-    "OSJIMZN": "Okresní soud ve Znojmě", "OSJIMZR": "Okresní soud ve Žďáru nad Sázavou", "KSSEMOS": "Krajský soud v Ostravě",
-    "KSOSOL": "KS Ostrava - pobočka Olomouc", "OSBR": "Okresní soud v Bruntále", "OSSEMFM": "Okresní soud ve Frýdku-Místku",
-    "OSJE": "Okresní soud v Jeseníku", "OSSEMKA": "Okresní soud v Karviné", "OSNJ": "Okresní soud v Novém Jičíně",
-    "OSSEMOC": "Okresní soud v Olomouci", "OSSEMOP": "Okresní soud v Opavě", "OSSEMOS": "Okresní soud v Ostravě",
-    "OSSEMPR": "Okresní soud v Přerově", "OSSEMSU": "Okresní soud v Šumperku", "OSSEMVS": "Okresní soud ve Vsetíně","OSVYCNA": "Okresní soud Náchod",
-    "OSJIMHO": "Okresní soud Hodonín", "OSSTCME": "Okresní soud Mělník", "OSJICCK" : "Okresní soud Český Krumlov", "OSVYCJC" : "Okresní soud Jičín",
-    "OSSCECL": "Okresní soud Česká Lípa"
-}
-
 # -------------------------------------------------------------------------
 # 1. INITIALIZACE DATABÁZE
 # -------------------------------------------------------------------------
@@ -153,702 +68,627 @@ def check_hash(password, hashed_text):
     return False
 
 @st.cache_resource
-def init_db():
-    conn = None; db_pool = None
+def init_db_ui():
+    """Migrace schématu jednou za proces Streamlitu (samotné DDL je v monitor.init_db)."""
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        
-        # 1. Tabulka případů
-        c.execute('''CREATE TABLE IF NOT EXISTS pripady
-                     (id SERIAL PRIMARY KEY,
-                      oznaceni TEXT,
-                      url TEXT,
-                      params_json TEXT,
-                      pocet_udalosti INTEGER,
-                      posledni_udalost TEXT,
-                      ma_zmenu BOOLEAN,
-                      posledni_kontrola TIMESTAMP,
-                      realny_nazev_soudu TEXT)''')
-        
-        # 2. Tabulka uživatelů
-        c.execute('''CREATE TABLE IF NOT EXISTS uzivatele
-                     (id SERIAL PRIMARY KEY,
-                      username TEXT UNIQUE,
-                      password TEXT,
-                      email TEXT,
-                      role TEXT)''')
-
-        # 3. Tabulka historie akcí
-        c.execute('''CREATE TABLE IF NOT EXISTS historie
-                     (id SERIAL PRIMARY KEY,
-                      datum TIMESTAMP,
-                      uzivatel TEXT,
-                      akce TEXT,
-                      popis TEXT)''')
-        
-        # 4. Tabulka logů kontrol
-        c.execute('''CREATE TABLE IF NOT EXISTS system_logs
-                     (id SERIAL PRIMARY KEY,
-                      start_time TIMESTAMP,
-                      end_time TIMESTAMP,
-                      mode TEXT,
-                      processed_count INTEGER)''')
-        
-        # 5. Tabulka pro stav systému (Most mezi workerem a UI)
-        c.execute('''CREATE TABLE IF NOT EXISTS system_status
-                     (id INTEGER PRIMARY KEY,
-                      is_running BOOLEAN,
-                      progress INTEGER,
-                      total INTEGER,
-                      mode TEXT,
-                      last_update TIMESTAMP)''')
-        
-        # Inicializace stavového řádku (musí být odsazeno uvnitř try bloku)
-        c.execute("""
-            INSERT INTO system_status (id, is_running, progress, total, mode) 
-            SELECT 1, False, 0, 0, 'Spí' 
-            WHERE NOT EXISTS (SELECT 1 FROM system_status WHERE id = 1)
-        """)
-                     
-        conn.commit()
+        init_db()
     except Exception as e:
         # Pokud dojde k chybě, zobrazíme ji v aplikaci
         st.error(f"Kritická chyba při inicializaci databáze: {e}")
-    finally:
-        # Velmi důležité: Vždy vrátíme spojení do poolu, i když dojde k chybě
-        if conn and db_pool:
-            db_pool.putconn(conn)
 
 # Volání funkce pro spuštění inicializace
-init_db()
+init_db_ui()
 
 # --- SPRÁVA UŽIVATELŮ ---
 
 def create_user(username, password, email, role):
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO uzivatele (username, password, email, role) VALUES (%s, %s, %s, %s)", 
-                  (username, make_hash(password), email, role))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO uzivatele (username, password, email, role) VALUES (%s, %s, %s, %s)", 
+                      (username, make_hash(password), email, role))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Vytvoření uživatele", f"Vytvořen uživatel '{username}' ({role})")
         return True
     except psycopg2.IntegrityError:
-        if conn: conn.rollback()
         return False
     except Exception as e:
         print(f"Chyba DB: {e}")
-        if conn: conn.rollback()
         return False
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def delete_user(username):
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("DELETE FROM uzivatele WHERE username=%s", (username,))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM uzivatele WHERE username=%s", (username,))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Smazání uživatele", f"Smazán uživatel '{username}'")
     except Exception as e:
         print(f"Chyba: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def get_all_users():
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        df = pd.read_sql_query("SELECT username, email, role FROM uzivatele", conn)
-        return df
+        with db_spojeni() as conn:
+            df = pd.read_sql_query("SELECT username, email, role FROM uzivatele", conn)
+            return df
     except Exception:
         return pd.DataFrame()
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def verify_login(username, password):
     if username == SUPER_ADMIN_USER and password == SUPER_ADMIN_PASS:
         return "Super Admin"
     
-    conn = None; db_pool = None
     role = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT password, role FROM uzivatele WHERE username=%s", (username,))
-        data = c.fetchone()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT password, role FROM uzivatele WHERE username=%s", (username,))
+            data = c.fetchone()
         
-        if data:
-            stored_hash, db_role = data
-            if check_hash(password, stored_hash):
-                role = db_role
+            if data:
+                stored_hash, db_role = data
+                if check_hash(password, stored_hash):
+                    role = db_role
     except Exception:
         pass
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
     
     return role
 
 def get_user_role(username):
     if username == SUPER_ADMIN_USER: return "Super Admin"
-    conn = None; db_pool = None; role = None
+    role = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT role FROM uzivatele WHERE username=%s", (username,))
-        data = c.fetchone()
-        if data: role = data[0]
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT role FROM uzivatele WHERE username=%s", (username,))
+            data = c.fetchone()
+            if data: role = data[0]
     except: pass
-    finally: 
-        if conn and db_pool: db_pool.putconn(conn)
     return role
 
 # --- LOGOVÁNÍ ---
 
 def log_do_historie(akce, popis):
-    # Zkusíme vytáhnout uživatele. 
-    # .get() vrátí None, pokud klíč neexistuje.
-    user = st.session_state.get('current_user')
-    
-    # Pokud je user None (nepřihlášený worker) nebo prázdný řetězec, nastavíme Robota
-    if not user:
-        user = "🤖 Systém (Robot)"
-    
-    conn = None; db_pool = None
-    try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO historie (datum, uzivatel, akce, popis) VALUES (%s, %s, %s, %s)", 
-                  (get_now(), user, akce, popis))
-        conn.commit()
-    except Exception as e:
-        print(f"Chyba logování: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
+    # Akce z UI zapisujeme pod přihlášeným uživatelem (worker loguje rovnou přes monitor)
+    monitor.log_do_historie(akce, popis, st.session_state.get('current_user'))
 
 def get_historie(dny=14):
-    conn = None; db_pool = None
     try:
         datum_limit = get_now() - datetime.timedelta(days=dny)
-        conn, db_pool = get_db_connection()
-        df = pd.read_sql_query("SELECT datum, uzivatel, akce, popis FROM historie WHERE datum > %s ORDER BY datum DESC", 
-                                 conn, params=(datum_limit,))
-        return df
+        with db_spojeni() as conn:
+            df = pd.read_sql_query("SELECT datum, uzivatel, akce, popis FROM historie WHERE datum > %s ORDER BY datum DESC", 
+                                     conn, params=(datum_limit,))
+            return df
     except Exception:
         return pd.DataFrame()
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def get_system_logs(dny=3):
-    conn = None; db_pool = None
     try:
         datum_limit = get_now() - datetime.timedelta(days=dny)
-        conn, db_pool = get_db_connection()
-        df = pd.read_sql_query("SELECT start_time, end_time, mode, processed_count FROM system_logs WHERE start_time > %s ORDER BY start_time DESC", 
-                                 conn, params=(datum_limit,))
-        return df
+        with db_spojeni() as conn:
+            df = pd.read_sql_query("""SELECT id, start_time, end_time, mode, processed_count, retry_count, throttled_count, skipped_count,
+                                             success_count, failure_count, exception_count, change_count, casovani_json
+                                      FROM system_logs WHERE start_time > %s ORDER BY start_time DESC""", 
+                                     conn, params=(datum_limit,))
+            return df
     except Exception:
         return pd.DataFrame()
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
-def vycistit_stare_logy(dny=30):
-    """Smaže systémové logy a historii starší než stanovený počet dní."""
-    conn = None; db_pool = None
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def hledej_pripady(ma_zmenu, dotaz="", limit=None, offset=0):
+    """
+    Případy se změnou / beze změny, filtrované a stránkované přímo v Postgresu.
+    Hledá v názvu, soudu a poslední události (trigram index nad hledany_text)
+    a ve spisové značce bez mezer (spisova_znacka_norm). Vrací (df, celkovy_pocet).
+    """
     try:
-        limit = get_now() - datetime.timedelta(days=dny)
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        
-        # Smazání starých logů kontrol
-        c.execute("DELETE FROM system_logs WHERE start_time < %s", (limit,))
-        # Smazání staré historie akcí uživatelů
-        c.execute("DELETE FROM historie WHERE datum < %s", (limit,))
-        
-        conn.commit()
-        print(f"🧹 Úklid: Smazány záznamy starší než {dny} dní.")
+        where = "ma_zmenu = %s"; params = [ma_zmenu]
+        if dotaz:
+            q_lower = dotaz.lower()
+            where += " AND (hledany_text LIKE %s OR spisova_znacka_norm LIKE %s)"
+            params += [f"%{_escape_like(q_lower)}%", f"%{_escape_like(q_lower.replace(' ', ''))}%"]
+        sql = f"""SELECT id, oznaceni, url, soud, senat, druh, cislo, rocnik, posledni_udalost, posledni_kontrola,
+                         dalsi_kontrola, COUNT(*) OVER() AS celkem
+                  FROM pripady WHERE {where} ORDER BY id DESC"""
+        strankovani = []
+        if limit is not None:
+            sql += " LIMIT %s OFFSET %s"; strankovani = [limit, offset]
+        with db_spojeni() as conn:
+            df = pd.read_sql_query(sql, conn, params=params + strankovani)
+            if not df.empty:
+                return df.drop(columns=['celkem']), int(df['celkem'].iloc[0])
+            if not offset:
+                return df, 0
+            # Stránka za koncem výsledků -> celkový počet zjistíme zvlášť
+            c = conn.cursor()
+            c.execute(f"SELECT COUNT(*) FROM pripady WHERE {where}", params)
+            return df, c.fetchone()[0]
     except Exception as e:
-        print(f"Chyba při úklidu DB: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
+        print(f"Chyba hledání: {e}")
+        return pd.DataFrame(), 0
 
-# -------------------------------------------------------------------------
-# 2. LOGIKA ODESÍLÁNÍ
-# -------------------------------------------------------------------------
-
-def odeslat_email_notifikaci(nazev, udalost, znacka, soud, url):
-    if "novy.email" in SMTP_EMAIL: return
-
-    conn = None; db_pool = None; prijemci = []
+def get_nove_udalosti(ids):
+    """Nepotvrzené (nova) události pro dané spisy z DB, bez dotazu na Infosoud: {pripad_id: [text, ...]}."""
+    if not ids: return {}
     try:
-        conn, db_pool = get_db_connection()
-        df_users = pd.read_sql_query("SELECT email FROM uzivatele WHERE email IS NOT NULL AND email != ''", conn)
-        prijemci = df_users['email'].tolist()
-    except: prijemci = []
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
-    
-    if SUPER_ADMIN_EMAIL and "@" in SUPER_ADMIN_EMAIL:
-        prijemci.append(SUPER_ADMIN_EMAIL)
-    
-    prijemci = list(set(prijemci)) 
-    if not prijemci: return
-
-    # Získání aktuálního českého času pro patičku
-    cas_odeslani = get_now().strftime("%d.%m.%Y %H:%M")
-
-    msg = MIMEMultipart("alternative")
-    msg['From'] = SMTP_EMAIL
-    
-    # --- ZDE JE VAŠE ZMĚNA ---
-    # Předmět nyní obsahuje spisovou značku (např. "Změna ve spisu: 81 T 8 / 2020")
-    msg['Subject'] = f"🚨 Změna ve spisu: {znacka}"
-
-    # 1. Čistý text
-    text_body = f"""
-    {nazev}
-    
-    Soud: {soud}
-    Spisová značka: {znacka}
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT pripad_id, text FROM udalosti WHERE nova AND pripad_id = ANY(%s) ORDER BY datum, poradi",
+                      ([int(i) for i in ids],))
+            vysledek = {}
+            for cid, text in c.fetchall():
+                vysledek.setdefault(cid, []).append(text)
+            return vysledek
+    except Exception as e:
+        print(f"Chyba načtení událostí: {e}")
+        return {}
 
-    Nová událost:
-    {udalost}
+def get_udalosti(od_data=None, soud=None, pripad_id=None, limit=500):
+    """Události ze všech spisů: od_data ('YYYY-MM-DD'), volitelně jen pro soud nebo jeden spis."""
+    try:
+        podminky = []; params = []
+        if od_data: podminky.append("u.datum >= %s"); params.append(od_data)
+        if soud: podminky.append("u.soud = %s"); params.append(soud)
+        if pripad_id: podminky.append("u.pripad_id = %s"); params.append(pripad_id)
+        where = "WHERE " + " AND ".join(podminky) if podminky else ""
+        with db_spojeni() as conn:
+            return pd.read_sql_query(f"""SELECT u.datum, u.text, p.oznaceni, u.soud, u.pripad_id
+                                         FROM udalosti u JOIN pripady p ON p.id = u.pripad_id
+                                         {where} ORDER BY u.datum DESC, u.poradi DESC LIMIT %s""",
+                                     conn, params=(*params, limit))
+    except Exception:
+        return pd.DataFrame()
 
-    Otevřít na Infosoudu:
-    {url}
-    
-    --
-    Infosoud Monitor (Odesláno: {cas_odeslani})
+def get_nazvy_pripadu(ids):
+    """{pripad_id: oznaceni} pro výpis nejpomalejších spisů."""
+    if not ids: return {}
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, oznaceni FROM pripady WHERE id = ANY(%s)", ([int(i) for i in ids],))
+            return dict(c.fetchall())
+    except Exception:
+        return {}
+
+def zobraz_casovani(casovani, top=10):
+    """Rozpad času jednoho běhu (StatistikaBehu.casovani): úseky, nejpomalejší soudy a spisy."""
+    useky = casovani.get("useky") or {}
+    if useky:
+        df_u = pd.DataFrame([{
+            "Úsek": USEKY_BEHU.get(n, n),
+            "Počet": u["pocet"],
+            "Celkem (s)": round(u["soucet_ms"] / 1000, 1),
+            "Průměr (ms)": round(u["soucet_ms"] / u["pocet"], 1) if u["pocet"] else 0.0,
+            # Z histogramu jde jen horní hranice koše; None = nad poslední hranicí
+            "p95 (ms) ≤": percentil_z_histogramu(u["kose"], 0.95),
+            "Max (ms)": u["max_ms"],
+        } for n, u in useky.items()]).sort_values("Celkem (s)", ascending=False)
+        st.bar_chart(df_u.set_index("Úsek")["Celkem (s)"])
+        st.dataframe(df_u, use_container_width=True, hide_index=True)
+        st.caption("Úseky se překrývají (běží paralelně), jejich součet proto může být delší než běh.")
+
+    col_s, col_p = st.columns(2)
+    with col_s:
+        st.markdown("**🏛️ Nejpomalejší soudy**")
+        soudy = casovani.get("soudy") or {}
+        if soudy:
+            df_s = pd.DataFrame([{
+                "Soud": SOUDY_MAPA.get(k, k),
+                "Dotazů": v["pocet"],
+                "Průměr (ms)": round(v["soucet_ms"] / v["pocet"], 1) if v["pocet"] else 0.0,
+                "Max (ms)": v["max_ms"],
+                "Chyby": v["chyby"],
+            } for k, v in soudy.items()]).sort_values("Průměr (ms)", ascending=False).head(top)
+            st.dataframe(df_s, use_container_width=True, hide_index=True)
+    with col_p:
+        st.markdown("**🐢 Nejpomalejší spisy**")
+        nejpomalejsi = (casovani.get("nejpomalejsi") or [])[:top]
+        if nejpomalejsi:
+            nazvy = get_nazvy_pripadu([x["pripad_id"] for x in nejpomalejsi if x.get("pripad_id")])
+            df_p = pd.DataFrame([{
+                "Spis": nazvy.get(x.get("pripad_id"), f"ID {x.get('pripad_id')}"),
+                "Soud": SOUDY_MAPA.get(x.get("soud"), x.get("soud")),
+                "Dotaz (ms)": x["ms"],
+            } for x in nejpomalejsi])
+            st.dataframe(df_p, use_container_width=True, hide_index=True)
+
+# --- 🗃️ CACHE PRO UI (Streamlit reruny) ---
+VERZE_TTL = 15     # s, jak dlouho věříme naposledy přečtené verzi dat
+DATA_TTL = 300     # s, strop stáří dat i bez změny verze
+
+@st.cache_data(ttl=VERZE_TTL, show_spinner=False)
+def get_data_verze():
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT data_verze FROM system_status WHERE id = 1")
+            res = c.fetchone()
+            return res[0] if res else 0
+    except Exception:
+        # Bez verze raději načteme data znovu
+        return time.time()
+
+def zneplatni_cache():
+    """Po zápisu z tohoto procesu: další rerun si hned přečte novou verzi."""
+    get_data_verze.clear()
+
+# Načtená data jsou klíčovaná verzí -> po změně se čtou znovu, jinak je rerun obslouží z paměti
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def hledej_pripady_cache(ma_zmenu, dotaz, limit, offset, verze):
+    return hledej_pripady(ma_zmenu, dotaz, limit=limit, offset=offset)
+
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def get_nove_udalosti_cache(ids, verze):
+    return get_nove_udalosti(ids)
+
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def get_historie_cache(dny, verze):
+    return get_historie(dny)
+
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def get_system_logs_cache(dny, verze):
+    return get_system_logs(dny)
+
+@st.cache_data(ttl=DATA_TTL, show_spinner=False)
+def get_all_users_cache(verze):
+    return get_all_users()
+
+# --- 📡 PUSH STAVU (LISTEN/NOTIFY) ---
+# Zápis stavu (zapis_stav) je v monitor.py, tady jen posluchač pro UI
+def _stav_z_json(data):
+    last_upd = data.get('last_update')
+    if last_upd:
+        last_upd = datetime.datetime.fromisoformat(last_upd)
+    return (data.get('is_running'), data.get('progress'), data.get('total'), data.get('mode'), last_upd)
+
+class PosluchacStavu:
     """
-
-    # 2. HTML verze
-    html_body = f"""
-    <html>
-      <body>
-        <h3>{nazev}</h3>
-        
-        <p>
-           <b>Soud:</b> {soud}<br>
-           <b>Spisová značka:</b> {znacka}
-        </p>
-        
-        <div style="background-color: #f5f5f5; padding: 15px; border-left: 5px solid #d32f2f; margin: 15px 0;">
-            <b>Nová událost:</b><br>
-            {udalost}
-        </div>
-        
-        <br>
-        <a href="{url}" style="background-color: #d32f2f; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px; font-weight: bold;">
-           👉 Otevřít na Infosoudu
-        </a>
-        
-        <br><br>
-        <hr style="border: 0; border-top: 1px solid #eee;">
-        <small style="color: grey;">
-            Infosoud Monitor • Odesláno: {cas_odeslani}
-        </small>
-      </body>
-    </html>
+    Jeden posluchač na proces: drží vlastní spojení mimo pool (LISTEN) a poslední
+    stav systému v paměti. Všechny sessions čtou jen tento snapshot, do DB nechodí.
     """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stav = None
+        self.vlakno = threading.Thread(target=self._smycka, name="posluchac-stavu", daemon=True)
 
-    part1 = MIMEText(text_body, "plain")
-    part2 = MIMEText(html_body, "html")
-    msg.attach(part1)
-    msg.attach(part2)
+    def start(self):
+        self.vlakno.start()
+        return self
 
-    try:
-        s = smtplib.SMTP(SMTP_SERVER, int(SMTP_PORT))
-        s.starttls(); s.login(SMTP_EMAIL, SMTP_PASSWORD)
-        for p in prijemci:
-            del msg['To']; msg['To'] = p; s.sendmail(SMTP_EMAIL, p, msg.as_string())
-        s.quit()
-        log_do_historie("Odeslání notifikace", f"Odesláno na {len(prijemci)} adres.")
-    except Exception as e: print(f"Chyba emailu: {e}")
-    
-# -------------------------------------------------------------------------
-# 3. PARSOVÁNÍ A SCRAPING
-# -------------------------------------------------------------------------
+    def snapshot(self):
+        with self.lock:
+            return self.stav
 
-def parsuj_url(url):
-    try:
-        p = parse_qs(urlparse(url).query)
-        
-        # Extrakce kódu soudu ze starých i nových parametrů
-        soud = p.get('org', [None])[0] or p.get('krajOrg', [None])[0] or p.get('okresniSoud', [None])[0] or p.get('druhOrganizace', [None])[0]
-        
-        typ_org = p.get('typOrganizace', [None])[0]
-        typ = p.get('typSoudu', [None])[0]
-        
-        # Specifická logika pro Nejvyšší soud
-        if typ == 'ns' or typ_org == 'NEJVYSSI':
-            typ = 'ns'
-            soud = 'NS'
-            
-        # Dedukce typu soudu z nových parametrů (pokud chybí typSoudu)
-        if soud and not typ:
-            if 'okresniSoud' in p: typ = 'os'
-            elif 'druhOrganizace' in p:
-                if soud.startswith('VS'): typ = 'vs'
-                else: typ = 'ks'
-                
-        # Záchytná síť pro krajské/městské soudy
-        if soud and soud.upper().startswith(('KS','MS')): typ = 'ks'
-        if not typ: typ = 'os'
-
-        druh = p.get('druhVeci', p.get('druhVec', [None]))[0]
-        if druh: druh = druh.upper()
-
-        return {
-            "typ": typ, 
-            "soud": soud, 
-            "senat": p.get('cisloSenatu',[None])[0], 
-            "druh": druh, 
-            "cislo": p.get('bcVec',[p.get('cislo',[None])[0]])[0], 
-            "rocnik": p.get('rocnik',[None])[0]
-        }
-    except: 
-        return None
-
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36 Edg/119.0.0.0"
-]
-
-def stahni_data_z_infosoudu(params):
-    url = "https://infosoud.gov.cz/api/v1/rizeni/vyhledej"
-    
-    typ = params.get('typ')
-    soud = params.get('soud')
-    
-    # 1. Sestavení payloadu (přesně podle API)
-    payload = {
-        'cisloSenatu': params.get('senat', ''),
-        'druhVeci': params.get('druh', ''),
-        'bcVec': params.get('cislo', ''),
-        'rocnik': params.get('rocnik', '')
-    }
-    
-    # Správné přiřazení soudu do payloadu
-    if typ == 'ns' or soud == 'NS':
-        payload['typOrganizace'] = 'NEJVYSSI'
-    else:
-        payload['typOrganizace'] = 'VSECHNY_KRAJE'
-        if typ in ['ks', 'vs'] or (soud and soud.startswith(('KS', 'VS', 'MSPHAAB'))):
-            payload['druhOrganizace'] = soud
-        else:
-            payload['okresniSoud'] = soud
-            
-    headers = {
-        "User-Agent": random.choice(USER_AGENTS),
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    
-    try:
-        # 2. Odeslání POST požadavku
-        r = requests.post(url, json=payload, headers=headers, timeout=10)
-        
-        # Pokud API vrátí chybu (např. 404 Nenalezeno nebo 500)
-        if r.status_code != 200:
-            return None
-            
-        data = r.json()
-        
-        # Pokud API nevrátí události
-        if not data or 'udalosti' not in data:
-            return None
-            
-        udalosti_raw = data['udalosti']
-        if not udalosti_raw:
-            return []
-            
-        # 3. Zpracování a překlad dat
-        # Seřadíme pro jistotu podle data a pořadí
-        udalosti_raw.sort(key=lambda x: (x.get('datum', ''), x.get('poradi', 0)))
-
-        # Rozšířený slovník pro lidsky čitelné výpisy událostí
-        preklad_kodu = {
-            "ZAHAJ_RIZ": "Zahájení řízení",
-            "VYD_ROZH": "Vydání rozhodnutí",
-            "ST_VEC_VYR": "Vyřízení věci",
-            "VR_SP_NS": "Vrácení spisu",
-            "VRAC_SPIS": "Vrácení spisu",
-            "NAR_JED": "Nařízení jednání",
-            "DOVOL_RIZ": "Řízení o opravném prostředku na Nejvyšším soudu ČR",
-            "ODES_SPIS": "Odeslání spisu",
-            "ODVOLANI": "Řízení o opravném prostředku u krajského a vrchního soudu",
-            "POD_OP_PR": "Podán opravný prostředek",
-            "ST_VEC_ODS": "Skončení věci",
-            "VYR_OP_PR": "Vyřízení opravného prostředku",
-            "ZRUS_JED": "Zrušení jednání",
-            "ST_VEC_OBZ": "Obživnutí věci",
-            "ST_VEC_PUK": "Datum pravomocného ukončení věci"
-        }
-        
-        udalosti_formatovane = []
-        for u in udalosti_raw:
-            datum_raw = u.get('datum', '') # Z API chodí YYYY-MM-DD
+    def _nacti(self, conn):
+        with conn.cursor() as c:
+            c.execute("SELECT is_running, progress, total, mode, last_update FROM system_status WHERE id = 1")
+            res = c.fetchone()
+        with self.lock:
+            self.stav = res
+
+    def _smycka(self):
+        pauza = 1.0
+        while True:
+            conn = None
             try:
-                # Převod na náš zvyklý český formát DD.MM.YYYY
-                datum_obj = datetime.datetime.strptime(datum_raw, '%Y-%m-%d')
-                datum_str = datum_obj.strftime('%d.%m.%Y')
-            except Exception:
-                datum_str = datum_raw
-                
-            kod_udalosti = u.get('udalost', 'NEZNAMA_UDALOST')
-            
-            # Zkusíme přeložit, pokud nenajdeme, použijeme surový kód z API
-            text_udalosti = preklad_kodu.get(kod_udalosti, kod_udalosti)
-            
-            udalosti_formatovane.append(f"{datum_str} - {text_udalosti}")
-            
-        return udalosti_formatovane
-        
-    except Exception as e:
-        print(f"Chyba při komunikaci s API: {e}")
-        return None
+                conn = psycopg2.connect(DB_URI)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as c:
+                    c.execute(f"LISTEN {KANAL_STAV}; LISTEN {KANAL_DATA};")
+                # Výchozí stav (a dorovnání po případném výpadku spojení)
+                self._nacti(conn)
+                pauza = 1.0
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        # Nic nepřišlo - ověříme, že spojení žije
+                        with conn.cursor() as c: c.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        if n.channel == KANAL_STAV:
+                            stav = _stav_z_json(json.loads(n.payload))
+                            with self.lock:
+                                self.stav = stav
+                        elif n.channel == KANAL_DATA:
+                            # Worker zapsal výsledky -> UI si při dalším rerunu přečte novou verzi
+                            zneplatni_cache()
+            except Exception as e:
+                print(f"Posluchač stavu: {e} (nové připojení za {pauza:.0f}s)")
+                time.sleep(pauza)
+                pauza = min(60.0, pauza * 2)
+            finally:
+                if conn:
+                    try: conn.close()
+                    except Exception: pass
+
+@st.cache_resource
+def start_posluchac_stavu():
+    return PosluchacStavu().start()
+
+def je_spis_sledovany(p):
+    """Ověří unikátní identifikátor (soud + značka) ještě před dotazem na API."""
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            _, soud, senat, druh, cislo, rocnik = sloupce_spisu(p)
+            c.execute("""SELECT 1 FROM pripady WHERE soud IS NOT DISTINCT FROM %s AND senat IS NOT DISTINCT FROM %s
+                         AND druh IS NOT DISTINCT FROM %s AND cislo IS NOT DISTINCT FROM %s AND rocnik IS NOT DISTINCT FROM %s""",
+                      (soud, senat, druh, cislo, rocnik))
+            return c.fetchone() is not None
+    except Exception:
+        return False
 
 def pridej_pripad(url, oznaceni):
     p = parsuj_url(url)
     if not p or not p['soud']: return False, "Neplatná URL."
-    data = stahni_data_z_infosoudu(p)
-    if data is None: return False, "Spis nenalezen."
+    if je_spis_sledovany(p): return False, "Tento spis už je sledován."
+    status, raw, _ = stahni_odpoved_infosoudu_cache(p)
+    otisk = otisk_udalosti(raw) if status == 200 else None
+    if otisk is None: return False, "Spis nenalezen."
     
-    spis_zn = f"{p.get('senat')} {p.get('druh')} {p.get('cislo')} / {p.get('rocnik')}"
+    spis_zn = spisova_znacka(p)
     
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("INSERT INTO pripady (oznaceni, url, params_json, pocet_udalosti, posledni_udalost, ma_zmenu, posledni_kontrola) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                  (oznaceni, url, json.dumps(p), len(data), data[-1] if data else "", False, get_now()))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            vloz_pripad(c, oznaceni, url, p, raw, otisk)
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Přidání spisu", f"Přidán spis: {oznaceni} ({spis_zn})")
         return True, "OK"
+    except psycopg2.IntegrityError:
+        # Souběžné přidání stejného spisu - zachytí unikátní index
+        return False, "Tento spis už je sledován."
     except Exception as e:
-        if conn: conn.rollback()
         return False, f"Chyba DB: {e}"
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
+
+# --- 📥 HROMADNÝ IMPORT ---
+IMPORT_VLAKNA = 4
+URL_VZOR = re.compile(r"https?://\S+")
+HLAVICKA_IMPORTU = {"nazev", "název", "url"}
+
+def _oddelovac_importu(radky):
+    """Odhadne oddělovač sloupců (';', ',' nebo tabulátor) z prvních řádků importu."""
+    try:
+        return csv.Sniffer().sniff("\n".join(radky[:20]), delimiters=";,\t").delimiter
+    except csv.Error:
+        # Sniffer selže i na seznamu samotných URL - tam je oddělovač jedno
+        return ";" if any(";" in r for r in radky) else ","
+
+def rozpoznej_radky_importu(text):
+    """
+    Z CSV nebo vloženého seznamu vytáhne (číslo řádku, název, URL).
+    Řádek může být jen URL, nebo název a URL oddělené ';', ',' nebo tabulátorem
+    v libovolném pořadí. URL je pole, které celé odpovídá http(s) adrese,
+    název jsou ostatní neprázdná pole.
+    """
+    radky = [(i, r.strip()) for i, r in enumerate(text.splitlines(), start=1)]
+    radky = [(i, r) for i, r in radky if r and not r.startswith("#")]
+    if not radky: return []
+    oddelovac = _oddelovac_importu([r for _, r in radky])
+    vysledek = []
+    for (i, _), pole in zip(radky, csv.reader([r for _, r in radky], delimiter=oddelovac)):
+        pole = [p.strip() for p in pole]
+        j_url = next((j for j, p in enumerate(pole) if URL_VZOR.fullmatch(p)), None)
+        url = pole[j_url] if j_url is not None else None
+        nazev = " ".join(p for j, p in enumerate(pole) if p and j != j_url)
+        # Hlavička CSV ("nazev;url" apod.) se přeskočí
+        if not url and {p.lower() for p in pole if p} <= HLAVICKA_IMPORTU:
+            continue
+        vysledek.append((i, nazev, url))
+    return vysledek
+
+def _over_spis_importu(p, limiter):
+    """Dotaz na API s limiterem a opakováním dočasných chyb. Vrací (status, raw)."""
+    for pokus in range(1, MAX_POKUSU + 1):
+        time.sleep(limiter.rezervuj(p.get('soud')))
+        status, raw, latence = stahni_odpoved_infosoudu_cache(p)
+        limiter.zaznamenej(p.get('soud'), status, latence)
+        if not je_docasna_chyba(status) or pokus == MAX_POKUSU:
+            return status, raw
+        time.sleep(backoff_zpozdeni(pokus))
+
+def importuj_pripady(text, on_progress=None):
+    """
+    Hromadný import spisů. Všechny řádky se rozparsují, porovnají se sledovanými
+    (jedním dotazem) i mezi sebou, zbytek se souběžně ověří na API a vloží
+    v jedné transakci. Vrací seznam dictů (radek, nazev, url, stav, zprava).
+    """
+    report = []
+    kandidati = []   # (zaznam reportu, params)
+    videne = {}
+    for cislo_radku, nazev, url in rozpoznej_radky_importu(text):
+        zaznam = {"radek": cislo_radku, "nazev": nazev, "url": url or "", "stav": "", "zprava": ""}
+        report.append(zaznam)
+        p = parsuj_url(url) if url else None
+        if not p or not p['soud']:
+            zaznam.update(stav="chyba", zprava="Neplatná URL.")
+            continue
+        klic = tuple(sloupce_spisu(p)[1:])
+        if klic in videne:
+            zaznam.update(stav="duplicita", zprava=f"Stejný spis jako na řádku {videne[klic]}.")
+            continue
+        videne[klic] = cislo_radku
+        if not zaznam["nazev"]: zaznam["nazev"] = spisova_znacka(p)
+        kandidati.append((zaznam, p, klic))
+
+    if not kandidati: return report
+
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT soud, senat, druh, cislo, rocnik FROM pripady WHERE soud = ANY(%s)",
+                      (list({k[0] for _, _, k in kandidati}),))
+            sledovane = {tuple(r) for r in c.fetchall()}
+    except Exception as e:
+        # Bez porovnání se sledovanými nic neověřujeme ani nevkládáme
+        for zaznam, *_ in kandidati:
+            zaznam.update(stav="chyba", zprava=f"Chyba DB: {e}")
+        return report
+
+    k_overeni = []
+    for zaznam, p, klic in kandidati:
+        if klic in sledovane:
+            zaznam.update(stav="duplicita", zprava="Tento spis už je sledován.")
+        else:
+            k_overeni.append((zaznam, p))
+
+    # Ověření na API - souběžně, ale přes stejný limiter jako monitor_job
+    limiter = AdaptivniLimiter()
+    overene = []
+    hotovo = 0
+    with ThreadPoolExecutor(max_workers=IMPORT_VLAKNA) as executor:
+        futures = {executor.submit(_over_spis_importu, p, limiter): (zaznam, p) for zaznam, p in k_overeni}
+        for future in as_completed(futures):
+            zaznam, p = futures[future]
+            hotovo += 1
+            if on_progress: on_progress(hotovo, len(k_overeni))
+            try:
+                status, raw = future.result()
+            except Exception as e:
+                zaznam.update(stav="chyba", zprava=f"Chyba API: {e}"); continue
+            otisk = otisk_udalosti(raw) if status == 200 else None
+            if otisk is None:
+                zaznam.update(stav="chyba", zprava="Spis nenalezen." if status is not None and not je_docasna_chyba(status)
+                              else f"Infosoud neodpovídá (HTTP {status}).")
+                continue
+            overene.append((zaznam, p, raw, otisk))
+
+    if not overene: return report
+
+    # Vše v jedné transakci; kolize s paralelním přidáním řeší savepoint na řádek
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            pridano = 0
+            for zaznam, p, raw, otisk in sorted(overene, key=lambda x: x[0]["radek"]):
+                c.execute("SAVEPOINT import_radek")
+                try:
+                    vloz_pripad(c, zaznam["nazev"], zaznam["url"], p, raw, otisk)
+                    c.execute("RELEASE SAVEPOINT import_radek")
+                    zaznam.update(stav="přidáno", zprava="OK")
+                    pridano += 1
+                except psycopg2.IntegrityError:
+                    c.execute("ROLLBACK TO SAVEPOINT import_radek")
+                    zaznam.update(stav="duplicita", zprava="Tento spis už je sledován.")
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
+        log_do_historie("Hromadný import", f"Importováno {pridano} z {len(report)} řádků.")
+    except Exception as e:
+        for zaznam, *_ in overene:
+            if zaznam["stav"] in ("", "přidáno"):
+                zaznam.update(stav="chyba", zprava=f"Chyba DB: {e}")
+    return report
 
 def smaz_pripad(cid):
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT oznaceni FROM pripady WHERE id=%s", (cid,))
-        res = c.fetchone()
-        nazev = res[0] if res else "Neznámý"
-        c.execute("DELETE FROM pripady WHERE id=%s", (cid,))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT oznaceni FROM pripady WHERE id=%s", (cid,))
+            res = c.fetchone()
+            nazev = res[0] if res else "Neznámý"
+            c.execute("DELETE FROM pripady WHERE id=%s", (cid,))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Smazání spisu", f"Uživatel smazal spis: {nazev}")
     except Exception as e:
         print(f"Chyba při mazání: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def resetuj_upozorneni(cid):
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT oznaceni FROM pripady WHERE id=%s", (cid,))
-        res = c.fetchone()
-        nazev = res[0] if res else "Neznámý"
-        c.execute("UPDATE pripady SET ma_zmenu = %s WHERE id=%s", (False, cid))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT oznaceni FROM pripady WHERE id=%s", (cid,))
+            res = c.fetchone()
+            nazev = res[0] if res else "Neznámý"
+            c.execute("UPDATE pripady SET ma_zmenu = %s WHERE id=%s", (False, cid))
+            c.execute("UPDATE udalosti SET nova = FALSE WHERE pripad_id = %s AND nova", (cid,))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Potvrzení změny", f"Viděl jsem: {nazev}")
     except Exception as e:
         print(f"Chyba: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 def resetuj_vsechna_upozorneni():
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("UPDATE pripady SET ma_zmenu = %s WHERE ma_zmenu = %s", (False, True))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE pripady SET ma_zmenu = %s WHERE ma_zmenu = %s", (False, True))
+            c.execute("UPDATE udalosti SET nova = FALSE WHERE nova")
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Hromadné potvrzení", "Uživatel označil všechny změny jako viděné.")
     except Exception as e:
         print(f"Chyba: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
+
+def resetuj_upozorneni_hromadne(ids):
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE pripady SET ma_zmenu = FALSE WHERE id = ANY(%s)", (list(ids),))
+            c.execute("UPDATE udalosti SET nova = FALSE WHERE pripad_id = ANY(%s) AND nova", (list(ids),))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
+        log_do_historie("Hromadné potvrzení", f"Uživatel označil {len(ids)} vybraných změn jako viděné.")
+    except Exception as e:
+        print(f"Chyba: {e}")
+
+def smaz_pripady(ids):
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("DELETE FROM pripady WHERE id = ANY(%s) RETURNING oznaceni", (list(ids),))
+            nazvy = [r[0] for r in c.fetchall()]
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
+        log_do_historie("Smazání spisu", f"Uživatel hromadně smazal {len(nazvy)} spisů: {', '.join(nazvy)[:500]}")
+    except Exception as e:
+        print(f"Chyba při mazání: {e}")
 
 def prejmenuj_pripad(cid, novy_nazev):
-    conn = None; db_pool = None
     try:
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("UPDATE pripady SET oznaceni = %s WHERE id = %s", (novy_nazev, cid))
-        conn.commit()
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE pripady SET oznaceni = %s WHERE id = %s", (novy_nazev, cid))
+            zvys_verzi_dat(c)
+            conn.commit()
+        zneplatni_cache()
         log_do_historie("Přejmenování", f"Spis ID {cid} přejmenován na '{novy_nazev}'")
     except Exception as e:
         print(f"Chyba: {e}")
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
 
 # --- SCHEDULER (POZADÍ - CHYTRÝ REŽIM DEN/NOC) ---
 @st.cache_resource
 def start_scheduler():
     scheduler = BackgroundScheduler()
-    scheduler.add_job(monitor_job, 'cron', minute=40)
+    # Uvnitř procesu se běhy nepřekrývají; proti cronu a ručnímu spuštění chrání ZamekBehu
+    scheduler.add_job(monitor_job, 'cron', minute=40, max_instances=1, coalesce=True)
     scheduler.start()
     return scheduler
 
-def zkontroluj_jeden_pripad(row):
-    # PŘIDÁNO: url na konci rozbalení řádku
-    cid, params_str, old_cnt, name, _, url = row
-    
-    conn = None; db_pool = None
-    try:
-        p = json.loads(params_str)
-        
-        # PŘIDÁNO: Zjištění názvu soudu
-        kod_soudu = p.get('soud')
-        nazev_soudu = SOUDY_MAPA.get(kod_soudu, kod_soudu)
-
-        time.sleep(random.uniform(1.0, 3.0))
-        new_data = stahni_data_z_infosoudu(p)
-        
-        if new_data is not None:
-            now = get_now()
-            conn, db_pool = get_db_connection()
-            c = conn.cursor()
-            
-            if len(new_data) > old_cnt:
-                c.execute("UPDATE pripady SET pocet_udalosti=%s, posledni_udalost=%s, ma_zmenu=%s, posledni_kontrola=%s WHERE id=%s", 
-                          (len(new_data), new_data[-1], True, now, cid))
-                conn.commit()
-                try:
-                    c.execute("INSERT INTO historie (datum, uzivatel, akce, popis) VALUES (%s, %s, %s, %s)",
-                              (now, "🤖 Systém (Robot)", "Nová událost", f"Změna u {name}"))
-                    conn.commit()
-                except: pass
-                
-                spis_zn = f"{p.get('senat')} {p.get('druh')} {p.get('cislo')} / {p.get('rocnik')}"
-                
-                # UPRAVENO: Předáváme i nazev_soudu a url
-                odeslat_email_notifikaci(name, new_data[-1], spis_zn, nazev_soudu, url)
-            else:
-                c.execute("UPDATE pripady SET posledni_kontrola=%s, posledni_udalost=%s WHERE id=%s", 
-                          (now, new_data[-1], cid))
-                conn.commit()
-            return True
-            
-    except Exception as e:
-        print(f"Chyba u případu ID {cid}: {e}")
-        return False
-    finally:
-        if conn and db_pool: db_pool.putconn(conn)
-
-def je_pripad_skonceny(text_udalosti):
-    if not text_udalosti: return False
-    txt = text_udalosti.lower()
-    return "skončení věci" in txt or "pravomoc" in txt or "vyřízeno" in txt
-
-# V app.py to musí být takto:
-def monitor_job(status_hook=None):  # Přidejte tento parametr do závorky!
-    """
-    Hlavní kontrolní logika pro automatickou prověrku spisů.
-    """
-    def broadcast(is_running, progress=0, total=0, mode="Inicializace..."):
-        if status_hook:
-            status_hook(is_running, progress, total, mode)
-        else:
-            # Nouzový přímý zápis do DB, pokud by funkce nebyla předána
-            try:
-                conn_b, pool_b = get_db_connection()
-                with conn_b.cursor() as cb:
-                    cb.execute("""
-                        UPDATE system_status 
-                        SET is_running=%s, progress=%s, total=%s, mode=%s, last_update=%s 
-                        WHERE id=1
-                    """, (is_running, progress, total, mode, get_now()))
-                    conn_b.commit()
-                pool_b.putconn(conn_b)
-            except Exception as e:
-                print(f"Brodcast error: {e}")
-
-    # --- 1. START ---
-    start_ts = get_now()
-    broadcast(True, 0, 0, "Startuji proces...")
-
-    conn = None
-    db_pool = None
-    
-    try:
-        # Načteme všechny případy z DB
-        conn, db_pool = get_db_connection()
-        c = conn.cursor()
-        c.execute("SELECT id, params_json, pocet_udalosti, oznaceni, posledni_udalost, url FROM pripady")
-        all_rows = c.fetchall()
-        
-        # Uvolníme spojení z poolu před spuštěním threadů (aby měly thready volno)
-        db_pool.putconn(conn)
-        conn = None 
-
-        # --- 2. FILTRACE REŽIMU (DEN/NOC) ---
-        aktualni_hodina = get_now().hour
-        if aktualni_hodina == 2:  # Ve 2:00 ráno kontrolujeme archiv (skončené věci)
-            target_rows = [r for r in all_rows if je_pripad_skonceny(r[4])]
-            rezim_text = "🌙 Noční kontrola archivu"
-        else:                     # Zbytek dne kontrolujeme jen aktivní kauzy
-            target_rows = [r for r in all_rows if not je_pripad_skonceny(r[4])]
-            rezim_text = "☀️ Denní kontrola aktivních"
-
-        total_count = len(target_rows)
-        broadcast(True, 0, total_count, rezim_text)
-        
-        print(f"--- {rezim_text}: Spuštěno pro {total_count} spisů ---")
-
-        # --- 3. PARALELNÍ ZPRACOVÁNÍ ---
-        processed_now = 0
-        if target_rows:
-            # max_workers=3 je ideální pro Heroku Free/Basic (šetří RAM i CPU)
-            with ThreadPoolExecutor(max_workers=3) as executor:
-                futures = [executor.submit(zkontroluj_jeden_pripad, row) for row in target_rows]
-                
-                for future in as_completed(futures):
-                    processed_now += 1
-                    # Každý dokončený thread nahlásí progres do DB
-                    broadcast(True, processed_now, total_count, rezim_text)
-                    
-                    # Log do konzole pro Heroku logs
-                    if processed_now % 5 == 0 or processed_now == total_count:
-                        print(f"Progress: {processed_now}/{total_count}")
-
-        # --- 4. FINÁLNÍ LOGOVÁNÍ A ÚKLID ---
-        # Záznam o úspěšné kontrole do historie logů
-        conn, db_pool = get_db_connection()
-        with conn.cursor() as c:
-            c.execute("""
-                INSERT INTO system_logs (start_time, end_time, mode, processed_count) 
-                VALUES (%s, %s, %s, %s)
-            """, (start_ts, get_now(), rezim_text, processed_now))
-            conn.commit()
-        
-        # Automatický úklid starých záznamů (historie > 30 dní)
-        vycistit_stare_logy(dny=30)
+# start_scheduler()
 
-    except Exception as e:
-        error_msg = f"CHYBA: {str(e)[:50]}"
-        print(f"Kritická chyba v monitor_job: {e}")
-        broadcast(False, 0, 0, error_msg)
-    finally:
-        # Vždy přepneme stav do "Spí", i když to spadlo
-        broadcast(False, 0, 0, "Spí (Dokončeno)")
-        if conn and db_pool:
-            db_pool.putconn(conn)
+# --- 📊 METRIKY (jen když je nastavený METRICS_PORT) ---
+@st.cache_resource
+def start_exporter_metrik():
+    # Jednou na proces Streamlitu, ne při každém rerunu
+    return spust_exporter_metrik()
 
-# start_scheduler()
+start_exporter_metrik()
 
 # -------------------------------------------------------------------------
 # 4. FRONTEND A PŘIHLÁŠENÍ (ANTI-FLICKER)
@@ -920,11 +760,8 @@ with st.sidebar:
     def render_status():
         st.markdown("### Stav systému")
         try:
-            conn, db_pool = get_db_connection()
-            with conn.cursor() as c:
-                c.execute("SELECT is_running, progress, total, mode, last_update FROM system_status WHERE id = 1")
-                res = c.fetchone()
-            db_pool.putconn(conn)
+            # Stav z paměti procesu (plní ho LISTEN/NOTIFY), žádný dotaz do DB za session
+            res = start_posluchac_stavu().snapshot()
 
             if res:
                 is_run, prog, tot, mode, last_upd = res
@@ -996,7 +833,7 @@ with st.sidebar:
             if trvani < 5: time.sleep(5 - trvani)
             
             if ok:
-                st.cache_data.clear()
+                zneplatni_cache()
                 st.session_state['vysledek_akce'] = ("success", msg)
                 st.session_state['smazat_vstupy'] = True
             else:
@@ -1009,6 +846,24 @@ with st.sidebar:
         else: st.error(text)
         del st.session_state['vysledek_akce']
         
+    # --- HROMADNÝ IMPORT ---
+    with st.expander("📥 Hromadný import"):
+        st.caption("Jeden spis na řádek: URL, nebo 'Název;URL'. Lze nahrát i CSV.")
+        soubor = st.file_uploader("CSV soubor", type=["csv", "txt"], key="import_soubor")
+        vlozeny_text = st.text_area("Seznam URL", key="import_text", height=150)
+        if st.button("Importovat", use_container_width=True):
+            text = soubor.getvalue().decode("utf-8-sig", errors="replace") if soubor else vlozeny_text
+            progres = st.progress(0.0, text="Ověřuji spisy na Infosoudu...")
+            report = importuj_pripady(text, on_progress=lambda n, celkem: progres.progress(n / celkem, text=f"Ověřeno {n}/{celkem}"))
+            progres.empty()
+            st.session_state['import_report'] = report
+        if st.session_state.get('import_report'):
+            df_rep = pd.DataFrame(st.session_state['import_report'])
+            pocty = df_rep['stav'].value_counts()
+            st.write(f"✅ Přidáno: {pocty.get('přidáno', 0)} · ♻️ Duplicit: {pocty.get('duplicita', 0)} · ❌ Chyb: {pocty.get('chyba', 0)}")
+            st.dataframe(df_rep.rename(columns={"radek": "Řádek", "nazev": "Název", "url": "URL", "stav": "Stav", "zprava": "Zpráva"}),
+                         hide_index=True, use_container_width=True)
+
     st.divider()
 
 # 👇👇👇 SEM VLOŽ TENTO NOVÝ BLOK KÓDU 👇👇👇
@@ -1066,7 +921,7 @@ if selected_page == "👥 Správa uživatelů":
             else: st.warning("Vyplňte jméno, heslo i e-mail.")
 
     st.subheader("Seznam uživatelů")
-    users_df = get_all_users()
+    users_df = get_all_users_cache(get_data_verze())
     if not users_df.empty:
         for index, row in users_df.iterrows():
             if row['username'] == SUPER_ADMIN_USER: continue
@@ -1092,30 +947,7 @@ elif selected_page == "📊 Přehled kauz":
     if 'page' not in st.session_state:
         st.session_state['page'] = 1
 
-    # --- FUNKCE PRO NAČÍTÁNÍ DAT ---
-    def get_zmeny_all():
-        conn = None; db_pool = None
-        try:
-            conn, db_pool = get_db_connection()
-            return pd.read_sql_query("SELECT * FROM pripady WHERE ma_zmenu = TRUE ORDER BY id DESC", conn)
-        except: return pd.DataFrame()
-        finally: 
-            if conn and db_pool: db_pool.putconn(conn)
-
-    def get_all_green_cases_raw():
-        conn = None; db_pool = None
-        try:
-            conn, db_pool = get_db_connection()
-            return pd.read_sql_query("SELECT * FROM pripady WHERE ma_zmenu = FALSE ORDER BY id DESC", conn)
-        except: return pd.DataFrame()
-        finally: 
-            if conn and db_pool: db_pool.putconn(conn)
-
-    # --- 1. NAČTENÍ DAT ---
-    df_zmeny = get_zmeny_all()
-    df_all_green = get_all_green_cases_raw()
-
-    # --- 2. VYHLEDÁVACÍ LIŠTA ---
+    # --- 1. VYHLEDÁVACÍ LIŠTA ---
     c_search_input, c_search_btn = st.columns([4, 1])
     with c_search_input:
         search_query_input = st.text_input("Hledat v archivu (Název, značka, soud, text)", 
@@ -1132,103 +964,144 @@ elif selected_page == "📊 Přehled kauz":
 
     active_search_query = st.session_state['last_search']
     
-    # --- 3. FILTROVACÍ LOGIKA (PRO OBĚ SEKCE) ---
-    df_filtered_green = df_all_green
-    
-    # Pokud uživatel něco hledá, aplikujeme filtr na ČERVENÉ i ZELENÉ
-    if active_search_query:
-        q_lower = active_search_query.lower()
-        q_no_space = q_lower.replace(" ", "")
-        
-        def filter_row(row):
-            # Hledáme v názvu
-            if q_lower in str(row['oznaceni']).lower(): return True
-            # Hledáme v soudu
-            if q_lower in str(row['realny_nazev_soudu']).lower(): return True
-            # Hledáme v poslední události
-            if q_lower in str(row['posledni_udalost']).lower(): return True
-            # Hledáme ve spisové značce (i bez mezer)
-            try:
-                p = json.loads(row['params_json'])
-                znacka = f"{p.get('senat')}{p.get('druh')}{p.get('cislo')}/{p.get('rocnik')}".lower()
-                if q_no_space in znacka: return True
-            except: pass
-            return False
-
-        # Aplikace filtru na červené (Změny)
-        if not df_zmeny.empty:
-            mask_red = df_zmeny.apply(filter_row, axis=1)
-            df_zmeny = df_zmeny[mask_red]
-            
-        # Aplikace filtru na zelené (Archiv)
-        if not df_all_green.empty:
-            mask_green = df_all_green.apply(filter_row, axis=1)
-            df_filtered_green = df_all_green[mask_green]
-    
-    # --- 4. STRÁNKOVÁNÍ (Jen pro zelené) ---
-    total_green = len(df_filtered_green)
-    total_pages = math.ceil(total_green / ITEMS_PER_PAGE)
-    if total_pages < 1: total_pages = 1
-    
-    start_idx = (st.session_state['page'] - 1) * ITEMS_PER_PAGE
-    end_idx = start_idx + ITEMS_PER_PAGE
-    df_ostatni = df_filtered_green.iloc[start_idx:end_idx]
+    # Karty jsou přehlednější, tabulka zvládne i stovky změn najednou (hromadné akce)
+    rezim_zobrazeni = st.radio("Zobrazení", ["🗂️ Karty", "📋 Tabulka"], horizontal=True, key="rezim_zobrazeni",
+                               label_visibility="collapsed")
+    tabulka = rezim_zobrazeni == "📋 Tabulka"
+
+    # --- 2. NAČTENÍ DAT (filtr i stránkování řeší SQL) ---
+    # Obě sekce se stránkují, takže cena vykreslení nezávisí na počtu změn
+    if 'page_red' not in st.session_state:
+        st.session_state['page_red'] = 1
+    if active_search_query != st.session_state.get('last_search_red'):
+        st.session_state['page_red'] = 1
+        st.session_state['last_search_red'] = active_search_query
+    verze = get_data_verze()
+
+    def nacti_stranku(ma_zmenu, klic):
+        """Stránka sekce; číslo stránky se srovná do [1, počet stran] (po smazání/označení konce seznamu)."""
+        df, celkem = hledej_pripady_cache(ma_zmenu, active_search_query, ITEMS_PER_PAGE,
+                                          (st.session_state[klic] - 1) * ITEMS_PER_PAGE, verze)
+        pocet_stran = max(1, math.ceil(celkem / ITEMS_PER_PAGE))
+        strana = min(max(1, st.session_state[klic]), pocet_stran)
+        if strana != st.session_state[klic]:
+            st.session_state[klic] = strana
+            df, celkem = hledej_pripady_cache(ma_zmenu, active_search_query, ITEMS_PER_PAGE,
+                                              (strana - 1) * ITEMS_PER_PAGE, verze)
+        return df, celkem, pocet_stran
+
+    # --- 3. STRÁNKOVÁNÍ ---
+    df_zmeny, total_red, total_pages_red = nacti_stranku(True, 'page_red')
+    df_ostatni, total_green, total_pages = nacti_stranku(False, 'page')
+
+    def strankovani(klic, pocet_stran):
+        if pocet_stran <= 1: return
+        c_prev, c_info, c_next = st.columns([1, 2, 1])
+        with c_prev:
+            if st.session_state[klic] > 1:
+                if st.button("⬅️ Předchozí", key=f"prev_{klic}"):
+                    st.session_state[klic] -= 1; st.rerun()
+        with c_info:
+            st.markdown(f"<div style='text-align: center'>Strana <b>{st.session_state[klic]}</b> z {pocet_stran}</div>", unsafe_allow_html=True)
+        with c_next:
+            if st.session_state[klic] < pocet_stran:
+                if st.button("Další ➡️", key=f"next_{klic}"):
+                    st.session_state[klic] += 1; st.rerun()
 
     # --- DEFINICE AKCÍ ---
     def akce_videl_jsem(id_spisu): resetuj_upozorneni(id_spisu)
     def akce_smazat(id_spisu): smaz_pripad(id_spisu)
     def akce_videl_jsem_vse(): resetuj_vsechna_upozorneni()
 
-    # --- 5. VYKRESLENÍ: ČERVENÁ SEKCE ---
-    # Zobrazíme sekci, pokud máme data (buď nová, nebo vyfiltrovaná)
-    if not df_zmeny.empty:
+    def vykresli_tabulku(df, klic, cervena):
+        """Jedna tabulka místo stovek karet; akce se provádí nad vybranými řádky."""
+        df_tab = pd.DataFrame({
+            "Název": df['oznaceni'],
+            "Spisová značka": [spisova_znacka(r) for _, r in df.iterrows()],
+            "Soud": [SOUDY_MAPA.get(k, k) for k in df['soud']],
+            "Poslední událost": df['posledni_udalost'],
+            "Kontrolováno": pd.to_datetime(df['posledni_kontrola']).dt.strftime("%d. %m. %Y %H:%M"),
+            "Další kontrola": pd.to_datetime(df['dalsi_kontrola']).dt.strftime("%d. %m. %Y %H:%M"),
+            "Odkaz": df['url'],
+        })
+        # Klíč z id zobrazených řádků: výběr přežije zápisy workeru, které stránku nemění,
+        # ale zruší se, jakmile jsou na ní jiné spisy (jinak by akce mířila na jiné spisy)
+        obsah = hashlib.md5(",".join(map(str, df['id'])).encode()).hexdigest()[:12]
+        event = st.dataframe(df_tab, use_container_width=True, hide_index=True, key=f"tab_{klic}_{obsah}",
+                             on_select="rerun", selection_mode="multi-row",
+                             column_config={"Odkaz": st.column_config.LinkColumn("Odkaz", display_text="Otevřít")})
+        vybrane = [int(df['id'].iloc[i]) for i in event.selection.rows]
+        if not vybrane: return
+
+        c_info, c_seen, c_del = st.columns([2, 1, 1])
+        c_info.caption(f"Vybráno: {len(vybrane)}")
+        if cervena and c_seen.button("👁️ Viděl (vybrané)", key=f"seen_sel_{klic}", use_container_width=True):
+            resetuj_upozorneni_hromadne(vybrane); st.rerun()
+        with c_del.popover("🗑️ Smazat vybrané", use_container_width=True):
+            st.write(f"Opravdu smazat {len(vybrane)} spisů?")
+            if st.button("Ano", key=f"confirm_del_sel_{klic}", type="primary"):
+                smaz_pripady(vybrane); st.rerun()
+
+    # --- 4. VYKRESLENÍ: ČERVENÁ SEKCE ---
+    # Zobrazíme sekci, pokud existují změny (i když by aktuální stránka vyšla prázdná)
+    if total_red > 0:
         col_head, col_btn = st.columns([3, 1])
         with col_head: 
             if active_search_query:
-                st.subheader(f"🚨 Nalezené změny ({len(df_zmeny)})")
+                st.subheader(f"🚨 Nalezené změny ({total_red})")
             else:
-                st.subheader(f"🚨 Případy se změnou ({len(df_zmeny)})")
+                st.subheader(f"🚨 Případy se změnou ({total_red})")
                 
         with col_btn: 
             # Tlačítko "Viděl jsem vše" zobrazíme jen když se nehledá, nebo dáváme pozor
             st.button("👁️ Viděl jsem vše", on_click=akce_videl_jsem_vse, type="primary", use_container_width=True)
 
-        for index, row in df_zmeny.iterrows():
-            try:
-                p = json.loads(row['params_json'])
-                spisova_znacka = f"{p.get('senat')} {p.get('druh')} {p.get('cislo')} / {p.get('rocnik')}"
-                kod_soudu = p.get('soud')
-                nazev_soudu = SOUDY_MAPA.get(kod_soudu, kod_soudu)
-                formatted_time = pd.to_datetime(row['posledni_kontrola']).strftime("%d. %m. %Y %H:%M")
-            except:
-                spisova_znacka = "?"; nazev_soudu = "?"; formatted_time = ""
-
-            with st.container(border=True):
-                c1, c2, c3, c4 = st.columns([2, 3, 4, 1])
-                with c1:
-                    st.markdown(f"### {row['oznaceni']}")
-                    st.error("🚨 **NOVÁ UDÁLOST**") 
-                with c2:
-                    st.markdown(f"📂 **{spisova_znacka}**")
-                    st.markdown(f"🏛️ {nazev_soudu}")
-                with c3:
-                    st.write(f"📅 **{row['posledni_udalost']}**")
-                    st.caption(f"Kontrolováno: {formatted_time}")
-                with c4:
-                    st.link_button("Otevřít", row['url'])
-                    with st.popover("✏️", help="Upravit název"):
-                        novy_nazev = st.text_input("Název", value=row['oznaceni'], key=f"edit_red_{row['id']}")
-                        if st.button("Uložit", key=f"save_red_{row['id']}"):
-                            prejmenuj_pripad(row['id'], novy_nazev); st.rerun()
-                    st.button("👁️ Viděl", key=f"seen_{row['id']}", on_click=akce_videl_jsem, args=(row['id'],))
-                    with st.popover("🗑️", help="Odstranit"):
-                        st.write("Opravdu smazat?")
-                        if st.button("Ano", key=f"confirm_del_red_{row['id']}", type="primary"):
-                            akce_smazat(row['id']); st.rerun()
+        if tabulka:
+            vykresli_tabulku(df_zmeny, "red", cervena=True)
+        else:
+            # Nové události bereme z tabulky udalosti - žádný dotaz na Infosoud
+            nove_udalosti = get_nove_udalosti_cache(df_zmeny['id'].tolist(), verze)
 
-    # --- 6. VYKRESLENÍ: ZELENÁ SEKCE ---
+            for index, row in df_zmeny.iterrows():
+                try:
+                    spis_zn = spisova_znacka(row)
+                    kod_soudu = row['soud']
+                    nazev_soudu = SOUDY_MAPA.get(kod_soudu, kod_soudu)
+                    formatted_time = pd.to_datetime(row['posledni_kontrola']).strftime("%d. %m. %Y %H:%M")
+                except:
+                    spis_zn = "?"; nazev_soudu = "?"; formatted_time = ""
+
+                with st.container(border=True):
+                    c1, c2, c3, c4 = st.columns([2, 3, 4, 1])
+                    with c1:
+                        st.markdown(f"### {row['oznaceni']}")
+                        st.error("🚨 **NOVÁ UDÁLOST**") 
+                    with c2:
+                        st.markdown(f"📂 **{spis_zn}**")
+                        st.markdown(f"🏛️ {nazev_soudu}")
+                    with c3:
+                        st.write(f"📅 **{row['posledni_udalost']}**")
+                        nove = nove_udalosti.get(row['id'], [])
+                        if len(nove) > 1:
+                            st.caption("Nové: " + " • ".join(nove))
+                        st.caption(f"Kontrolováno: {formatted_time}")
+                    with c4:
+                        st.link_button("Otevřít", row['url'])
+                        with st.popover("✏️", help="Upravit název"):
+                            novy_nazev = st.text_input("Název", value=row['oznaceni'], key=f"edit_red_{row['id']}")
+                            if st.button("Uložit", key=f"save_red_{row['id']}"):
+                                prejmenuj_pripad(row['id'], novy_nazev); st.rerun()
+                        st.button("👁️ Viděl", key=f"seen_{row['id']}", on_click=akce_videl_jsem, args=(row['id'],))
+                        with st.popover("🗑️", help="Odstranit"):
+                            st.write("Opravdu smazat?")
+                            if st.button("Ano", key=f"confirm_del_red_{row['id']}", type="primary"):
+                                akce_smazat(row['id']); st.rerun()
+
+        strankovani('page_red', total_pages_red)
+
+    # --- 5. VYKRESLENÍ: ZELENÁ SEKCE ---
     # Pokud červená sekce nebyla prázdná, dáme oddělovač
-    if not df_zmeny.empty: st.markdown("---")
+    if total_red > 0: st.markdown("---")
     
     if active_search_query:
         st.subheader(f"🔍 Nalezeno v archivu ({total_green})")
@@ -1236,20 +1109,21 @@ elif selected_page == "📊 Přehled kauz":
         st.subheader(f"✅ Případy beze změn ({total_green})")
     
     if df_ostatni.empty:
-        if active_search_query and df_zmeny.empty:
+        if active_search_query and total_red == 0:
              st.warning(f"Hledání '{active_search_query}' nenašlo žádné výsledky.")
         elif not active_search_query:
              st.info("Žádné sledované případy.")
+    elif tabulka:
+        vykresli_tabulku(df_ostatni, "green", cervena=False)
     else:
         for index, row in df_ostatni.iterrows():
             try:
-                p = json.loads(row['params_json'])
-                spisova_znacka = f"{p.get('senat')} {p.get('druh')} {p.get('cislo')} / {p.get('rocnik')}"
-                kod_soudu = p.get('soud')
+                spis_zn = spisova_znacka(row)
+                kod_soudu = row['soud']
                 nazev_soudu = SOUDY_MAPA.get(kod_soudu, kod_soudu)
                 formatted_time = pd.to_datetime(row['posledni_kontrola']).strftime("%d. %m. %Y %H:%M")
             except:
-                spisova_znacka = "?"; nazev_soudu = "?"; formatted_time = ""
+                spis_zn = "?"; nazev_soudu = "?"; formatted_time = ""
 
             with st.container(border=True):
                 c1, c2, c3, c4 = st.columns([2, 3, 4, 1])
@@ -1257,7 +1131,7 @@ elif selected_page == "📊 Přehled kauz":
                     st.markdown(f"**{row['oznaceni']}**")
                     st.caption("✅ Bez změny")
                 with c2:
-                    st.markdown(f"📂 **{spisova_znacka}**")
+                    st.markdown(f"📂 **{spis_zn}**")
                     st.caption(f"🏛️ {nazev_soudu}")
                 with c3:
                     st.write(f"📅 **{row['posledni_udalost']}**")
@@ -1275,17 +1149,7 @@ elif selected_page == "📊 Přehled kauz":
 
     if total_pages > 1:
         st.markdown("---")
-        c_prev, c_info, c_next = st.columns([1, 2, 1])
-        with c_prev:
-            if st.session_state['page'] > 1:
-                if st.button("⬅️ Předchozí"):
-                    st.session_state['page'] -= 1; st.rerun()
-        with c_info:
-            st.markdown(f"<div style='text-align: center'>Strana <b>{st.session_state['page']}</b> z {total_pages}</div>", unsafe_allow_html=True)
-        with c_next:
-            if st.session_state['page'] < total_pages:
-                if st.button("Další ➡️"):
-                    st.session_state['page'] += 1; st.rerun()
+        strankovani('page', total_pages)
 
 # -------------------------------------------------------------------------
 # STRÁNKA: LOGY KONTROL
@@ -1293,7 +1157,7 @@ elif selected_page == "📊 Přehled kauz":
 elif selected_page == "⚡ Logy kontrol":
     st.header("⚡ Historie automatických kontrol (poslední 3 dny)")
     
-    df_logs = get_system_logs(dny=3)
+    df_logs = get_system_logs_cache(3, get_data_verze())
     
     if not df_logs.empty:
         # 1. Konverze na datetime objekty
@@ -1315,19 +1179,38 @@ elif selected_page == "⚡ Logy kontrol":
         df_logs['start_time'] = df_logs['start_time'].dt.strftime("%d.%m.%Y %H:%M")
         
         # 5. Výběr sloupců (IKONA ODSTRANĚNA)
-        df_display = df_logs[['start_time', 'mode', 'processed_count', 'trvani']].copy()
-        df_display.columns = ["Začátek", "Režim", "Zkontrolováno spisů", "Doba trvání"]
+        df_display = df_logs[['start_time', 'mode', 'processed_count', 'trvani', 'change_count', 'success_count',
+                              'failure_count', 'exception_count', 'retry_count', 'throttled_count', 'skipped_count']].copy()
+        df_display.columns = ["Začátek", "Režim", "Zkontrolováno spisů", "Doba trvání", "Změny", "Úspěšné dotazy",
+                              "Výpadky API", "Výjimky", "Opakování", "Throttling (429)", "Přeskočeno"]
         
         st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+        # 6. Kam šel čas - rozpad vybraného běhu
+        df_cas = df_logs[df_logs['casovani_json'].notna()]
+        if not df_cas.empty:
+            st.subheader("⏱️ Rozpad času běhu")
+            # Klíčem je id běhu - začátek je na minuty a souběžné běhy by splynuly
+            behy = {r.id: r for r in df_cas.itertuples()}
+            vybrany = st.selectbox("Běh", list(behy), format_func=lambda i: f"{behy[i].start_time} · {behy[i].mode} (#{i})")
+            casovani = json.loads(behy[vybrany].casovani_json)
+            zobraz_casovani(casovani)
     else:
         st.info("Zatím neproběhla žádná kontrola (nebo je databáze prázdná).")
 
+    # Pool tohoto procesu (webové aplikace); worker vypisuje svůj na konci běhu
+    m = metriky_poolu()
+    if m:
+        st.caption(f"🔌 DB pool: půjčeno {m['pujceno']}/{m['max']} (špička {m['spicka']}), výpůjček {m['vypujcek']}, "
+                   f"čekání prům. {m['cekani_prumer_ms']} ms / max {m['cekani_max_ms']} ms, "
+                   f"timeoutů {m['timeoutu']}, podezřelých úniků {m['uniky']}")
+
 # -------------------------------------------------------------------------
 # STRÁNKA: AUDITNÍ HISTORIE
 # -------------------------------------------------------------------------
 elif selected_page == "📜 Auditní historie":
     st.header("📜 Kdo co dělal?")
-    df_h = get_historie()
+    df_h = get_historie_cache(14, get_data_verze())
     if not df_h.empty:
         df_h['datum'] = pd.to_datetime(df_h['datum']).dt.strftime("%d.%m.%Y %H:%M")
         df_h.columns = ["Kdy", "Kdo", "Co se stalo", "Detail"]
@@ -0,0 +1,3 @@
+# benchmarks/
+# Offline měření monitor_job: lokální náhrada Infosoud API, Postgres a SMTP.
+# Spuštění z kořene repozitáře: python -m benchmarks.run --help
@@ -0,0 +1,110 @@
+# benchmarks/db_fixture.py
+# Lokální Postgres pro benchmarky + počítání round-tripů do DB
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import psycopg2
+import psycopg2.extensions
+
+# --- 📊 POČÍTÁNÍ ROUND-TRIPŮ ---
+class PocitadloDotazu:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pocet = 0
+
+    def pricti(self):
+        with self.lock:
+            self.pocet += 1
+
+    def vynuluj(self):
+        with self.lock:
+            pocet, self.pocet = self.pocet, 0
+        return pocet
+
+POCITADLO = PocitadloDotazu()
+
+class PocitanyKurzor(psycopg2.extensions.cursor):
+    # execute_values volá execute jednou za stránku, takže i dávky se počítají po skutečných dotazech
+    def execute(self, query, vars=None):
+        POCITADLO.pricti()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        for _ in vars_list:
+            POCITADLO.pricti()
+        return super().executemany(query, vars_list)
+
+class PocitaneSpojeni(psycopg2.extensions.connection):
+    """connection_factory pro BlokujiciPool: každý dotaz, commit i rollback = jeden round-trip."""
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", PocitanyKurzor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        POCITADLO.pricti()
+        return super().commit()
+
+    def rollback(self):
+        POCITADLO.pricti()
+        return super().rollback()
+
+# --- 🐘 POSTGRES ---
+def _volny_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pg_bin(nazev):
+    """Cesta k initdb/pg_ctl: PATH, jinak bindir z pg_config."""
+    cesta = shutil.which(nazev)
+    if cesta:
+        return cesta
+    pg_config = shutil.which("pg_config")
+    if pg_config:
+        bindir = subprocess.run([pg_config, "--bindir"], capture_output=True, text=True).stdout.strip()
+        kandidat = os.path.join(bindir, nazev)
+        if os.path.exists(kandidat):
+            return kandidat
+    return None
+
+class PostgresFixture:
+    """
+    S dsn (nebo env BENCH_DB_URL) použije existující databázi - POZOR, tabulky aplikace v ní
+    se mezi scénáři mažou, takže jen jednorázovou DB. Bez dsn založí dočasný cluster přes
+    initdb/pg_ctl na volném portu a po skončení ho smaže (initdb nejde spustit jako root).
+    """
+    def __init__(self, dsn=None):
+        self.dsn = dsn or os.getenv("BENCH_DB_URL")
+        self.adresar = None
+
+    def start(self):
+        if self.dsn:
+            return self
+        initdb, pg_ctl = _pg_bin("initdb"), _pg_bin("pg_ctl")
+        if not initdb or not pg_ctl:
+            raise RuntimeError("Není BENCH_DB_URL a initdb/pg_ctl nejsou k dispozici - nastavte BENCH_DB_URL.")
+        self.adresar = tempfile.mkdtemp(prefix="bench-pg-")
+        data = os.path.join(self.adresar, "data")
+        port = _volny_port()
+        subprocess.run([initdb, "-D", data, "-U", "postgres", "-A", "trust", "--no-sync"],
+                       check=True, capture_output=True)
+        subprocess.run([pg_ctl, "-D", data, "-l", os.path.join(self.adresar, "postgres.log"), "-w",
+                        "-o", f"-p {port} -k {self.adresar} -c listen_addresses=127.0.0.1", "start"],
+                       check=True, capture_output=True)
+        self.dsn = f"host=127.0.0.1 port={port} user=postgres dbname=postgres"
+        return self
+
+    def zavri(self):
+        if not self.adresar:
+            return
+        pg_ctl = _pg_bin("pg_ctl")
+        try:
+            subprocess.run([pg_ctl, "-D", os.path.join(self.adresar, "data"), "-m", "fast", "-w", "stop"],
+                           capture_output=True)
+        finally:
+            shutil.rmtree(self.adresar, ignore_errors=True)
+            self.adresar = None
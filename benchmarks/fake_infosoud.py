@@ -0,0 +1,128 @@
+# benchmarks/fake_infosoud.py
+# Lokální náhrada POST /api/v1/rizeni/vyhledej s nastavitelnou latencí, chybovostí a délkou seznamu událostí
+import json
+import time
+import random
+import hashlib
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CESTA_API = "/api/v1/rizeni/vyhledej"
+# Jen "živé" kódy - konec věci by spis odsunul v plánu, benchmark chce všechny spisy splatné
+KODY = ["ZAHAJ_RIZ", "NAR_JED", "ODES_SPIS", "VRAC_SPIS", "POD_OP_PR", "VYR_OP_PR", "ODVOLANI"]
+
+def klic_payloadu(payload):
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+def _nahodne_cislo(klic, sul=""):
+    """Deterministické číslo 0..1 z klíče (stejný spis = stejný výsledek v každém běhu)."""
+    return int(hashlib.sha1((sul + klic).encode()).hexdigest()[:8], 16) / 2 ** 32
+
+class NastaveniApi:
+    """Parametry chování API; dají se měnit mezi scénáři za běhu serveru."""
+    def __init__(self, latence=0.05, chybovost=0.0, throttling=0.0, nenalezeno=0.0,
+                 udalosti=20, podil_zmen=0.0, faze=0):
+        self.latence = latence          # s, střední latence odpovědi (rozptyl ±50 %)
+        self.chybovost = chybovost      # podíl odpovědí 503
+        self.throttling = throttling    # podíl odpovědí 429
+        self.nenalezeno = nenalezeno    # podíl spisů, které API nezná (404)
+        self.udalosti = udalosti        # průměrný počet událostí ve spisu
+        self.podil_zmen = podil_zmen    # podíl spisů, kterým ve fázi 1 přibude událost
+        self.faze = faze                # 0 = stav při založení spisů, 1 = stav při měřeném běhu
+
+def udalosti_spisu(payload, nastaveni, faze=None):
+    """
+    Surová odpověď API pro daný payload, nebo None (spis neexistuje).
+    Seznam je deterministický; ve fázi 1 přibude vybraným spisům jedna nová událost.
+    """
+    klic = klic_payloadu(payload)
+    if _nahodne_cislo(klic, "404") < nastaveni.nenalezeno:
+        return None
+    faze = nastaveni.faze if faze is None else faze
+    rng = random.Random(klic)
+    pocet = max(1, int(nastaveni.udalosti * rng.uniform(0.5, 1.5)))
+    rocnik = int(payload.get('rocnik') or 2020)
+    datum = datetime.date(rocnik, 1, 1)
+    udalosti = []
+    for poradi in range(1, pocet + 1):
+        datum += datetime.timedelta(days=rng.randint(1, 20))
+        udalosti.append({"datum": datum.isoformat(), "poradi": poradi, "udalost": rng.choice(KODY)})
+    if faze >= 1 and _nahodne_cislo(klic, "zmena") < nastaveni.podil_zmen:
+        udalosti.append({"datum": (datum + datetime.timedelta(days=1)).isoformat(),
+                         "poradi": pocet + 1, "udalost": "NAR_JED"})
+    return {"udalosti": udalosti}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive jako u skutečného API
+    # Hlavičky a tělo jdou dvěma zápisy; s Nagle by keep-alive klient čekal ~40 ms na delayed ACK
+    # u každé odpovědi, a to různě podle klienta (httpx víc než requests) - srovnání enginů by lhalo
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _odpovez(self, status, telo=None):
+        data = json.dumps(telo if telo is not None else {}, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        delka = int(self.headers.get("Content-Length") or 0)
+        telo = self.rfile.read(delka)
+        if self.path.split("?")[0] != CESTA_API:
+            return self._odpovez(404)
+        n = server.nastaveni
+        server.zapocitej("pozadavky")
+        time.sleep(max(0.0, n.latence * random.uniform(0.5, 1.5)))
+        los = random.random()
+        if los < n.throttling:
+            server.zapocitej("throttling")
+            return self._odpovez(429)
+        if los < n.throttling + n.chybovost:
+            server.zapocitej("chyby")
+            return self._odpovez(503)
+        try:
+            payload = json.loads(telo or b"{}")
+        except ValueError:
+            return self._odpovez(400)
+        data = udalosti_spisu(payload, n)
+        if data is None:
+            return self._odpovez(404)
+        self._odpovez(200, data)
+
+class FakeInfosoud(ThreadingHTTPServer):
+    """HTTP server v samostatném vlákně; url = hodnota pro INFOSOUD_API_URL."""
+    daemon_threads = True
+
+    def __init__(self, nastaveni=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.nastaveni = nastaveni or NastaveniApi()
+        self.lock = threading.Lock()
+        self.pocitadla = {}
+        self.vlakno = threading.Thread(target=self.serve_forever, name="fake-infosoud", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{CESTA_API}"
+
+    def zapocitej(self, nazev):
+        with self.lock:
+            self.pocitadla[nazev] = self.pocitadla.get(nazev, 0) + 1
+
+    def vynuluj(self):
+        with self.lock:
+            pocitadla, self.pocitadla = self.pocitadla, {}
+        return pocitadla
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def zavri(self):
+        self.shutdown()
+        self.server_close()
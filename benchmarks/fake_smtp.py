@@ -0,0 +1,78 @@
+# benchmarks/fake_smtp.py
+# Minimální SMTP "černá díra": přijme EHLO/AUTH/MAIL/RCPT/DATA a jen spočítá zprávy (bez TLS -> SMTP_STARTTLS=0)
+import threading
+import socketserver
+
+class _Relace(socketserver.StreamRequestHandler):
+    def _posli(self, radek):
+        self.wfile.write((radek + "\r\n").encode())
+
+    def handle(self):
+        self._posli("220 fake-smtp ESMTP")
+        while True:
+            radek = self.rfile.readline()
+            if not radek:
+                return
+            prikaz = radek.decode(errors="replace").strip()
+            sloveso = prikaz.split(" ", 1)[0].upper()
+            if sloveso == "EHLO":
+                self._posli("250-fake-smtp")
+                self._posli("250-AUTH PLAIN LOGIN")
+                self._posli("250 OK")
+            elif sloveso == "AUTH":
+                # AUTH PLAIN <data> v jednom řádku, AUTH LOGIN ve dvou krocích
+                if prikaz.upper().startswith("AUTH LOGIN"):
+                    for _ in range(2):
+                        self._posli("334 ")
+                        self.rfile.readline()
+                self._posli("235 Authentication successful")
+            elif sloveso == "DATA":
+                self._posli("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    radek = self.rfile.readline()
+                    if not radek or radek.rstrip(b"\r\n") == b".":
+                        break
+                self.server.zapocitej()
+                self._posli("250 OK")
+            elif sloveso == "QUIT":
+                self._posli("221 Bye")
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP...
+                self._posli("250 OK")
+
+class FakeSmtp(socketserver.ThreadingTCPServer):
+    """SMTP sink v samostatném vlákně; prijato = počet přijatých zpráv."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Relace)
+        self.lock = threading.Lock()
+        self.prijato = 0
+        self.vlakno = threading.Thread(target=self.serve_forever, name="fake-smtp", daemon=True)
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def zapocitej(self):
+        with self.lock:
+            self.prijato += 1
+
+    def vynuluj(self):
+        with self.lock:
+            prijato, self.prijato = self.prijato, 0
+        return prijato
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def zavri(self):
+        self.shutdown()
+        self.server_close()
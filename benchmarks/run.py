@@ -0,0 +1,259 @@
+# benchmarks/run.py
+"""
+Offline benchmark monitor_job - bez živého infosoud.gov.cz.
+
+Spustí lokální náhradu Infosoud API (fake_infosoud), SMTP sink (fake_smtp) a Postgres
+(db_fixture: BENCH_DB_URL, jinak dočasný cluster přes initdb). Pro každý scénář
+(počet spisů x podíl změněných spisů x engine) založí spisy, nechá proběhnout jeden
+celý monitor_job a vypíše spisy/s, p50/p99 latenci na spis, DB round-tripy a e-maily.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --pocty 1000 --zmeny 0.05 --engine threads,async --json vysledky.json
+    python -m benchmarks.run --baseline vysledky.json      # porovnání s dřívějším během
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import psycopg2
+from psycopg2.extras import execute_values
+
+from benchmarks.fake_infosoud import FakeInfosoud, NastaveniApi, udalosti_spisu
+from benchmarks.fake_smtp import FakeSmtp
+from benchmarks.db_fixture import PostgresFixture, PocitaneSpojeni, POCITADLO
+
+TABULKY = ("pripady", "udalosti", "notifikace_outbox", "system_logs", "system_status",
+           "worker_status", "run_lock", "historie", "uzivatele")
+BENCH_EMAIL = "bench@example.com"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark monitor_job")
+    parser.add_argument("--pocty", default="100,1000,10000", help="Počty spisů, oddělené čárkou")
+    parser.add_argument("--zmeny", default="0,0.05,0.5", help="Podíly spisů s novou událostí, oddělené čárkou")
+    parser.add_argument("--engine", default="threads,async", help="Enginy k porovnání (první je baseline)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Souběžnost async enginu")
+    parser.add_argument("--latence", type=float, default=0.05, help="Střední latence API v sekundách")
+    parser.add_argument("--chybovost", type=float, default=0.0, help="Podíl odpovědí 503")
+    parser.add_argument("--throttling", type=float, default=0.0, help="Podíl odpovědí 429")
+    parser.add_argument("--nenalezeno", type=float, default=0.0, help="Podíl spisů, které API nezná")
+    parser.add_argument("--udalosti", type=int, default=20, help="Průměrný počet událostí ve spisu")
+    parser.add_argument("--backoff", type=float, default=None,
+                        help="Přepíše BACKOFF_ZAKLAD (s), aby scénáře s chybami netrvaly minuty")
+    parser.add_argument("--bez-limiteru", action="store_true",
+                        help="Vypne AdaptivniLimiter - měří se jen engine, ne tempo vůči API")
+    parser.add_argument("--json", help="Uloží výsledky do souboru")
+    parser.add_argument("--baseline", help="Výsledky dřívějšího běhu (--json) k porovnání")
+    return parser.parse_args()
+
+def _seznam(text, typ):
+    return [typ(x) for x in text.split(",") if x.strip()]
+
+def percentil(hodnoty, q):
+    if not hodnoty:
+        return 0.0
+    serazene = sorted(hodnoty)
+    return serazene[min(len(serazene) - 1, int(q * len(serazene)))]
+
+# --- 🧰 PROSTŘEDÍ ---
+def priprav_prostredi(db, api, smtp):
+    """Nasměruje monitor.py na lokální služby. Musí proběhnout před importem monitoru."""
+    os.environ.update({
+        "SUPABASE_DB_URL": db.dsn,
+        "INFOSOUD_API_URL": api.url,
+        "SMTP_SERVER": smtp.host,
+        "SMTP_PORT": str(smtp.port),
+        "SMTP_STARTTLS": "0",
+        "SMTP_EMAIL": "monitor@example.com",
+        "SMTP_PASSWORD": "bench",
+        "SUPER_ADMIN_EMAIL": "",
+        "NOTIFIKACE_DIGEST": "0",
+    })
+    import monitor
+    monitor.init_db()
+    return monitor
+
+def novy_pool(monitor):
+    """Čerstvý pool pro každý scénář (metriky od nuly) s počítáním round-tripů."""
+    with monitor._db_pool_lock:
+        if monitor._db_pool is not None:
+            monitor._db_pool.closeall()
+        monitor._db_pool = monitor.BlokujiciPool(monitor.DB_POOL_MIN, monitor.DB_POOL_MAX, dsn=monitor.DB_URI,
+                                                 connection_factory=PocitaneSpojeni)
+
+def _typ_soudu(soud):
+    if soud.startswith("VS"): return "vs"
+    if soud.startswith(("KS", "MS")): return "ks"
+    return "os"
+
+def zaloz_spisy(monitor, dsn, pocet, nastaveni):
+    """Smaže data aplikace a založí `pocet` spisů se stavem API ve fázi 0; všechny jsou hned splatné."""
+    soudy = [s for s in monitor.SOUDY_MAPA if not s.startswith("NS")]
+    now = monitor.get_now()
+    pripady, odpovedi = [], []
+    for i in range(pocet):
+        soud = soudy[i % len(soudy)]
+        p = {"typ": _typ_soudu(soud), "soud": soud, "senat": str(1 + i % 50), "druh": "C",
+             "cislo": str(i + 1), "rocnik": str(2015 + i % 10)}
+        raw = udalosti_spisu(monitor.sestav_payload(p), nastaveni, faze=0)
+        otisk = monitor.otisk_udalosti(raw) or (None, None, None, 0)
+        url = (f"https://infosoud.gov.cz/?typSoudu={p['typ']}&org={soud}&cisloSenatu={p['senat']}"
+               f"&druhVeci=C&bcVec={p['cislo']}&rocnik={p['rocnik']}")
+        pripady.append((f"Bench {i + 1}", url, json.dumps(p), otisk[3], monitor.posledni_udalost(raw) or "", False, now,
+                        otisk[0], otisk[1], otisk[2], monitor.SOUDY_MAPA.get(soud, soud),
+                        *monitor.sloupce_spisu(p)))
+        odpovedi.append((soud, raw))
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as c:
+            c.execute(f"TRUNCATE {', '.join(TABULKY)} RESTART IDENTITY CASCADE")
+            c.execute("INSERT INTO uzivatele (username, password, email, role) VALUES ('bench', '', %s, 'user')",
+                      (BENCH_EMAIL,))
+            ids = execute_values(c, """
+                INSERT INTO pripady (oznaceni, url, params_json, pocet_udalosti, posledni_udalost, ma_zmenu,
+                                     posledni_kontrola, otisk_udalosti, posledni_datum_udalosti, posledni_poradi,
+                                     realny_nazev_soudu, typ, soud, senat, druh, cislo, rocnik)
+                VALUES %s RETURNING id""", pripady, page_size=1000, fetch=True)
+            radky = []
+            for (cid,), (soud, raw) in zip(ids, odpovedi):
+                radky.extend(monitor.radky_udalosti(cid, soud, raw, nova=False, vlozeno=now))
+            monitor.uloz_udalosti(c, radky, page_size=1000)
+        conn.commit()
+    finally:
+        conn.close()
+
+# --- ⏱️ MĚŘENÍ ---
+class LatenceSpisu:
+    """Obalí kontrolu jedné skupiny v monitoru a zapíše její dobu každému spisu skupiny."""
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.hodnoty = []
+        self.puvodni = (monitor.zkontroluj_jeden_pripad, monitor.zkontroluj_jeden_pripad_async)
+
+    def __enter__(self):
+        vlakna, asynchronni = self.puvodni
+        hodnoty = self.hodnoty
+
+        def zkontroluj(skupina, *args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return vlakna(skupina, *args, **kwargs)
+            finally:
+                hodnoty.extend([time.perf_counter() - t0] * len(skupina))
+
+        async def zkontroluj_async(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return await asynchronni(*args, **kwargs)
+            finally:
+                hodnoty.extend([time.perf_counter() - t0] * len(args[-1]))
+
+        self.monitor.zkontroluj_jeden_pripad = zkontroluj
+        self.monitor.zkontroluj_jeden_pripad_async = zkontroluj_async
+        return self
+
+    def __exit__(self, *exc):
+        self.monitor.zkontroluj_jeden_pripad, self.monitor.zkontroluj_jeden_pripad_async = self.puvodni
+
+def zmer_beh(monitor, api, smtp, engine, concurrency):
+    import worker
+    novy_pool(monitor)
+    api.vynuluj(); smtp.vynuluj(); POCITADLO.vynuluj()
+    with LatenceSpisu(monitor) as latence:
+        t0 = time.perf_counter()
+        monitor.monitor_job(status_hook=worker.set_db_status, engine=engine, concurrency=concurrency,
+                            politika_zamku="skip")
+        doba = time.perf_counter() - t0
+    round_tripy = POCITADLO.vynuluj()
+    pool = monitor.metriky_poolu()
+    with monitor.db_spojeni() as conn, conn.cursor() as c:
+        c.execute("SELECT processed_count FROM system_logs ORDER BY id DESC LIMIT 1")
+        radek = c.fetchone()
+    zpracovano = radek[0] if radek else 0
+    return {
+        "zpracovano": zpracovano,
+        "doba_s": round(doba, 2),
+        "spisu_za_s": round(zpracovano / doba, 1) if doba else 0.0,
+        "p50_ms": round(1000 * percentil(latence.hodnoty, 0.50), 1),
+        "p99_ms": round(1000 * percentil(latence.hodnoty, 0.99), 1),
+        "api_dotazu": api.vynuluj().get("pozadavky", 0),
+        "db_round_tripu": round_tripy,
+        "emailu": smtp.vynuluj(),
+        "pool_spicka": pool.get("spicka", 0),
+        "pool_cekani_max_ms": pool.get("cekani_max_ms", 0.0),
+    }
+
+# --- 📋 VÝSTUP ---
+SLOUPCE = [("pocet", "Spisů"), ("zmeny", "Změny"), ("engine", "Engine"), ("doba_s", "Doba s"),
+           ("spisu_za_s", "Spisů/s"), ("p50_ms", "p50 ms"), ("p99_ms", "p99 ms"), ("api_dotazu", "API"),
+           ("db_round_tripu", "DB RT"), ("emailu", "E-maily"), ("pool_spicka", "Pool"), ("srovnani", "vs. baseline")]
+
+def _klic(v):
+    return (v["pocet"], v["zmeny"], v["engine"])
+
+def vypis_tabulku(vysledky):
+    radky = [[str(v.get(k, "")) for k, _ in SLOUPCE] for v in vysledky]
+    sirky = [max(len(h), *(len(r[i]) for r in radky)) for i, (_, h) in enumerate(SLOUPCE)]
+    print("  ".join(h.rjust(s) for (_, h), s in zip(SLOUPCE, sirky)))
+    for r in radky:
+        print("  ".join(x.rjust(s) for x, s in zip(r, sirky)))
+
+def dopln_srovnani(vysledky, enginy, baseline=None):
+    """Poměr spisů/s: vůči uloženému baseline souboru, jinak vůči prvnímu enginu ve stejném scénáři."""
+    puvodni = {_klic(v): v for v in baseline or []}
+    ve_behu = {_klic(v): v for v in vysledky}
+    for v in vysledky:
+        zaklad = puvodni.get(_klic(v)) if baseline else ve_behu.get((v["pocet"], v["zmeny"], enginy[0]))
+        if zaklad and zaklad is not v and zaklad.get("spisu_za_s"):
+            v["srovnani"] = f"{v['spisu_za_s'] / zaklad['spisu_za_s']:.2f}x"
+
+def main():
+    args = parse_args()
+    pocty, zmeny, enginy = _seznam(args.pocty, int), _seznam(args.zmeny, float), _seznam(args.engine, str)
+    nastaveni = NastaveniApi(latence=args.latence, chybovost=args.chybovost, throttling=args.throttling,
+                             nenalezeno=args.nenalezeno, udalosti=args.udalosti)
+    db = PostgresFixture().start()
+    api = FakeInfosoud(nastaveni).start()
+    smtp = FakeSmtp().start()
+    vysledky = []
+    monitor = None
+    try:
+        monitor = priprav_prostredi(db, api, smtp)
+        if args.backoff is not None:
+            monitor.BACKOFF_ZAKLAD = args.backoff
+        if args.bez_limiteru:
+            class BezLimitu(monitor.AdaptivniLimiter):
+                def rezervuj(self, soud):
+                    return 0.0
+            monitor.AdaptivniLimiter = BezLimitu
+
+        for pocet in pocty:
+            for podil in zmeny:
+                for engine in enginy:
+                    nastaveni.faze, nastaveni.podil_zmen = 0, podil
+                    zaloz_spisy(monitor, db.dsn, pocet, nastaveni)
+                    nastaveni.faze = 1
+                    print(f"▶️ {pocet} spisů, změny {podil:.0%}, engine {engine}...", file=sys.stderr)
+                    v = {"pocet": pocet, "zmeny": podil, "engine": engine}
+                    v.update(zmer_beh(monitor, api, smtp, engine, args.concurrency))
+                    vysledky.append(v)
+    finally:
+        if monitor is not None and monitor._db_pool is not None:
+            monitor._db_pool.closeall()
+        smtp.zavri(); api.zavri(); db.zavri()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["vysledky"]
+    dopln_srovnani(vysledky, enginy, baseline)
+    vypis_tabulku(vysledky)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cas": datetime.datetime.now().isoformat(timespec="seconds"), "parametry": vars(args),
+                       "vysledky": vysledky}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2440 @@
+# monitor.py
+# Jádro kontroly spisů bez UI: konfigurace, DB pool, schéma, Infosoud API,
+# plánování, notifikace a monitor_job. Importuje ho app.py (Streamlit) i worker.py;
+# samo nic nespouští a Streamlit ani pandas nenačítá.
+import psycopg2
+import psycopg2.pool
+from psycopg2.extras import execute_values
+import json
+import contextlib
+import smtplib
+import hashlib
+import time
+import random
+import datetime
+import pytz
+import os
+import sys
+import socket
+import heapq
+import collections
+import threading
+import queue
+import asyncio
+import requests
+import httpx
+from urllib.parse import urlparse, parse_qs
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- 🕰️ NASTAVENÍ ČASOVÉHO PÁSMA (CZECHIA) ---
+def get_now():
+    tz = pytz.timezone('Europe/Prague')
+    return datetime.datetime.now(tz)
+
+# --- 🔐 NAČTENÍ TAJNÝCH ÚDAJŮ (SECRETS) ---
+def get_secret(key):
+    value = os.getenv(key)
+    if value is not None:
+        return value
+    # st.secrets jen pokud Streamlit už načetl app.py - worker ho kvůli tomu neimportuje
+    st = sys.modules.get("streamlit")
+    try:
+        if st is not None and hasattr(st, "secrets") and key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return None
+
+DB_URI = get_secret("SUPABASE_DB_URL")
+SUPER_ADMIN_EMAIL = get_secret("SUPER_ADMIN_EMAIL")
+
+SMTP_SERVER = get_secret("SMTP_SERVER") or "smtp.gmail.com"
+SMTP_PORT = get_secret("SMTP_PORT") or 587
+# Lokální SMTP (benchmarky, vývoj) bez TLS: SMTP_STARTTLS=0
+SMTP_STARTTLS = str(get_secret("SMTP_STARTTLS") or "1").lower() not in ("0", "false", "ne", "no")
+SMTP_EMAIL = get_secret("SMTP_EMAIL")
+SMTP_PASSWORD = get_secret("SMTP_PASSWORD")
+
+# --- 🏗️ DATABÁZOVÝ POOL ---
+DB_POOL_MIN = int(get_secret("DB_POOL_MIN") or 1)
+DB_POOL_MAX = int(get_secret("DB_POOL_MAX") or 10)
+# Jak dlouho (s) čekat na volné spojení, než se to vzdá chybou místo "connection pool exhausted"
+DB_CHECKOUT_TIMEOUT = float(get_secret("DB_CHECKOUT_TIMEOUT") or 30)
+# Spojení držené déle než tohle (s) se počítá jako podezřelý únik
+DB_LEAK_SEKUND = float(get_secret("DB_LEAK_SEKUND") or 600)
+
+class PoolVycerpan(Exception):
+    """Na volné spojení se nepodařilo dočkat v limitu DB_CHECKOUT_TIMEOUT."""
+
+class BlokujiciPool:
+    """
+    Thread-safe pool nad ThreadedConnectionPool. Když jsou všechna spojení rozebraná,
+    getconn() počká (nejdéle timeout) místo okamžité výjimky. Zároveň si vede metriky:
+    čekání na spojení, počet výpůjček, špičku, timeouty a spojení držená podezřele dlouho.
+    """
+    def __init__(self, minconn, maxconn, dsn, timeout=DB_CHECKOUT_TIMEOUT, **kwargs):
+        # kwargs jdou do psycopg2.connect (např. connection_factory v benchmarcích)
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn=dsn, **kwargs)
+        self._volna = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._pujcene = {}  # id(conn) -> (čas výpůjčky, jméno vlákna)
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.vypujcek = 0
+        self.timeoutu = 0
+        self.cekani_celkem = 0.0
+        self.cekani_max = 0.0
+        self.spicka = 0
+
+    def getconn(self, timeout=None):
+        t0 = time.monotonic()
+        if not self._volna.acquire(timeout=self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeoutu += 1
+            raise PoolVycerpan(f"Žádné volné DB spojení do {self.timeout if timeout is None else timeout} s "
+                               f"(pool {self.maxconn}, půjčeno {len(self._pujcene)})")
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._volna.release()
+            raise
+        cekal = time.monotonic() - t0
+        with self._lock:
+            self.vypujcek += 1
+            self.cekani_celkem += cekal
+            self.cekani_max = max(self.cekani_max, cekal)
+            self._pujcene[id(conn)] = (time.monotonic(), threading.current_thread().name)
+            self.spicka = max(self.spicka, len(self._pujcene))
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            vraceno = self._pujcene.pop(id(conn), None) is not None
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            if vraceno: self._volna.release()
+
+    def uniky(self):
+        """Spojení půjčená déle než DB_LEAK_SEKUND: [(vlákno, sekund)]."""
+        now = time.monotonic()
+        with self._lock:
+            return [(vlakno, round(now - od)) for od, vlakno in self._pujcene.values() if now - od > DB_LEAK_SEKUND]
+
+    def metriky(self):
+        with self._lock:
+            m = {
+                "max": self.maxconn,
+                "pujceno": len(self._pujcene),
+                "spicka": self.spicka,
+                "vypujcek": self.vypujcek,
+                "timeoutu": self.timeoutu,
+                "cekani_prumer_ms": round(1000 * self.cekani_celkem / self.vypujcek, 1) if self.vypujcek else 0.0,
+                "cekani_max_ms": round(1000 * self.cekani_max, 1),
+                "cekani_celkem_s": round(self.cekani_celkem, 3),
+            }
+        m["uniky"] = len(self.uniky())
+        return m
+
+    def closeall(self):
+        self._pool.closeall()
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def init_connection_pool():
+    """Jeden pool na proces, vytvořený až při prvním dotazu."""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = BlokujiciPool(DB_POOL_MIN, DB_POOL_MAX, dsn=DB_URI)
+        return _db_pool
+
+def get_db_connection(timeout=None):
+    db_pool = init_connection_pool()
+    return db_pool.getconn(timeout), db_pool
+
+@contextlib.contextmanager
+def db_spojeni(timeout=None):
+    """
+    Spojení z poolu na dobu bloku `with`. Při výjimce se transakce vrátí (rollback),
+    spojení se do poolu vrací vždy - i když blok spadne nebo skončí returnem.
+    timeout = kratší čekání na volné spojení než DB_CHECKOUT_TIMEOUT.
+    """
+    conn, db_pool = get_db_connection(timeout)
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        db_pool.putconn(conn)
+
+def metriky_poolu():
+    """Metriky DB poolu tohoto procesu (prázdné, dokud pool nevznikl)."""
+    return _db_pool.metriky() if _db_pool is not None else {}
+
+# --- 📊 METRIKY (PROMETHEUS / OPENMETRICS) ---
+# Exportér je volitelný: bez prometheus_client nebo bez METRICS_PORT se metriky jen zahodí.
+try:
+    import prometheus_client as prom
+    from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+except ImportError:
+    prom = None
+
+METRICS_PORT = get_secret("METRICS_PORT")
+
+class _BezMetrik:
+    """Náhrada metriky, když prometheus_client není nainstalovaný."""
+    def labels(self, *args, **kwargs): return self
+    def inc(self, *args): pass
+    def observe(self, *args): pass
+    def set(self, *args): pass
+    def set_to_current_time(self): pass
+
+def _metrika(typ, *args, **kwargs):
+    return getattr(prom, typ)(*args, **kwargs) if prom is not None else _BezMetrik()
+
+M_API_DOTAZY = _metrika("Counter", "infosoud_api_requests", "Dotazy na Infosoud API podle HTTP statusu (timeout = chyba sítě) a soudu",
+                        ["status", "soud"])
+M_API_LATENCE = _metrika("Histogram", "infosoud_api_latency_seconds", "Latence dotazu na Infosoud API",
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+M_SPISY = _metrika("Counter", "monitor_cases_checked", "Zkontrolované spisy (včetně přeskočených po opakováních)")
+M_UDALOSTI_BEHU = _metrika("Counter", "monitor_run_events", "Počítadla běhů (opakovani, preskoceno, sdileno, vyjimky, zmeny, chyby_zapisu)",
+                           ["udalost"])
+M_NOTIFIKACE = _metrika("Counter", "monitor_notifications", "Odeslání e-mailových notifikací podle výsledku", ["vysledek"])
+M_FRONTA = _metrika("Gauge", "monitor_queue_depth", "Hloubka front běhu: proud = zabrané spisy čekající na engine, "
+                    "zapis = výsledky čekající na dávkový zápis", ["fronta"])
+M_BEH_BEZI = _metrika("Gauge", "monitor_run_in_progress", "1, pokud v tomto procesu běží monitor_job")
+M_BEH_DOBA = _metrika("Histogram", "monitor_run_duration_seconds", "Doba běhu monitor_job",
+                      buckets=(60, 300, 600, 1200, 1800, 3600, 7200, 10800))
+M_BEH_KONEC = _metrika("Gauge", "monitor_run_last_end_timestamp_seconds", "Konec posledního běhu v tomto procesu")
+
+def zaznamenej_api(params, status, latence):
+    M_API_DOTAZY.labels("timeout" if status is None else str(status), (params or {}).get('soud') or "?").inc()
+    M_API_LATENCE.observe(latence)
+
+class KolektorStavu:
+    """
+    Metriky čtené až při scrape: DB pool tohoto procesu, backlog outboxu a poslední běh
+    ze system_logs (ten vidí i webová aplikace, když kontrolu dělá jiný proces).
+    """
+    def collect(self):
+        m = metriky_poolu()
+        if m:
+            yield GaugeMetricFamily("db_pool_connections_in_use", "Půjčená DB spojení", value=m["pujceno"])
+            yield GaugeMetricFamily("db_pool_connections_max", "Velikost DB poolu", value=m["max"])
+            yield GaugeMetricFamily("db_pool_connections_peak", "Nejvíc současně půjčených spojení", value=m["spicka"])
+            yield GaugeMetricFamily("db_pool_connections_leaked", "Spojení půjčená déle než DB_LEAK_SEKUND", value=m["uniky"])
+            yield CounterMetricFamily("db_pool_checkouts", "Výpůjčky spojení", value=m["vypujcek"])
+            yield CounterMetricFamily("db_pool_checkout_timeouts", "Výpůjčky, které vypršely", value=m["timeoutu"])
+            yield CounterMetricFamily("db_pool_checkout_wait_seconds", "Celkové čekání na volné spojení", value=m["cekani_celkem_s"])
+        try:
+            # Krátký timeout - scrape nesmí viset na vyčerpaném poolu
+            with db_spojeni(timeout=2.0) as conn, conn.cursor() as c:
+                c.execute("""SELECT stav, COUNT(*), EXTRACT(EPOCH FROM (%s - MIN(vytvoreno)))
+                             FROM notifikace_outbox WHERE stav IN ('ceka', 'chyba') GROUP BY stav""", (get_now(),))
+                backlog = GaugeMetricFamily("monitor_outbox_backlog", "Neodeslané notifikace v outboxu", labels=["stav"])
+                stari = GaugeMetricFamily("monitor_outbox_oldest_seconds", "Stáří nejstarší neodeslané notifikace", labels=["stav"])
+                for stav, pocet, sekund in c.fetchall():
+                    backlog.add_metric([stav], pocet)
+                    stari.add_metric([stav], float(sekund or 0))
+                yield backlog
+                yield stari
+                c.execute("""SELECT EXTRACT(EPOCH FROM (%s - end_time)), EXTRACT(EPOCH FROM (end_time - start_time)),
+                                    processed_count, request_count, throttled_count, error_count
+                             FROM system_logs WHERE processed_count > 0 ORDER BY id DESC LIMIT 1""", (get_now(),))
+                r = c.fetchone()
+                conn.rollback()
+            if r:
+                # Stáří místo časové značky: system_logs drží čas bez zóny, rozdíl počítá DB ve stejné session
+                yield GaugeMetricFamily("monitor_last_run_age_seconds", "Sekund od konce posledního běhu (system_logs)",
+                                        value=float(r[0] or 0))
+                yield GaugeMetricFamily("monitor_last_run_duration_seconds", "Doba posledního běhu (system_logs)", value=float(r[1] or 0))
+                yield GaugeMetricFamily("monitor_last_run_processed", "Spisy zkontrolované posledním během", value=r[2] or 0)
+                yield GaugeMetricFamily("monitor_last_run_throughput", "Spisy za sekundu v posledním běhu",
+                                        value=(r[2] or 0) / float(r[1]) if r[1] else 0.0)
+                yield GaugeMetricFamily("monitor_last_run_throttled", "Odpovědi 429 v posledním běhu", value=r[4] or 0)
+                yield GaugeMetricFamily("monitor_last_run_api_errors", "Dočasné chyby API v posledním běhu", value=r[5] or 0)
+        except Exception as e:
+            print(f"Metriky: stav z DB nenačten: {e}")
+
+_exporter_lock = threading.Lock()
+_exporter_port = None
+
+def spust_exporter_metrik(port=None):
+    """HTTP endpoint /metrics v tomto procesu (jednou na proces). Vrací port, nebo None, když je vypnutý."""
+    global _exporter_port
+    port = port or METRICS_PORT
+    if not port or prom is None:
+        return None
+    with _exporter_lock:
+        if _exporter_port is None:
+            prom.REGISTRY.register(KolektorStavu())
+            prom.start_http_server(int(port))
+            _exporter_port = int(port)
+        return _exporter_port
+
+# --- KOMPLETNÍ DATABÁZE SOUDŮ ---
+SOUDY_MAPA = {
+    "NS": "Nejvyšší soud", "NSJIMBM": "Nejvyšší soud", "NSS": "Nejvyšší správní soud",
+    "VSPHAAB": "Vrchní soud v Praze", "VSOL": "Vrchní soud v Olomouci",
+    "MSPHAAB": "Městský soud v Praze", 
+    "OSPHA01": "Obvodní soud pro Prahu 1", "OSPHA02": "Obvodní soud pro Prahu 2",
+    "OSPHA03": "Obvodní soud pro Prahu 3", "OSPHA04": "Obvodní soud pro Prahu 4",
+    "OSPHA05": "Obvodní soud pro Prahu 5", "OSPHA06": "Obvodní soud pro Prahu 6",
+    "OSPHA07": "Obvodní soud pro Prahu 7", "OSPHA08": "Obvodní soud pro Prahu 8",
+    "OSPHA09": "Obvodní soud pro Prahu 9", "OSPHA10": "Obvodní soud pro Prahu 10",
+    "KSSTCAB": "Krajský soud v Praze", "OSSTCBN": "Okresní soud v Benešově", "OSBE": "Okresní soud v Berouně",
+    "OSSTCKL": "Okresní soud v Kladně", "OSSTCKO": "Okresní soud v Kolíně", "OSKH": "Okresní soud v Kutné Hoře",
+    "OSME": "Okresní soud v Mělníku", "OSSTCMB": "Okresní soud v Mladé Boleslavi", "OSSTCNB": "Okresní soud v Nymburce",
+    "OSSTCPY": "Okresní soud Praha-východ", "OSSTCPZ": "Okresní soud Praha-západ", "OSPB": "Okresní soud v Příbrami",
+    "OSSTCRA": "Okresní soud v Rakovníku", "KSJICCB": "Krajský soud v Českých Budějovicích", "KSCBTAB": "KS Č. Budějovice - pobočka Tábor",
+    "OSJICCB": "Okresní soud v Českých Budějovicích", "OSCK": "Okresní soud v Českém Krumlově", "OSJH": "Okresní soud v Jindřichově Hradci",
+    "OSJICPE": "Okresní soud v Pelhřimově", "OSJICPI": "Okresní soud v Písku", "OSPT": "Okresní soud v Prachaticích",
+    "OSST": "Okresní soud ve Strakonicích", "OSJICTA": "Okresní soud v Táboře", "KSZPCPM": "Krajský soud Plzeň",
+    "KSPLKV": "KS Plzeň - pobočka Karlovy Vary", "OSZPCDO": "Okresní soud v Domažlicích", "OSZPCCH": "Okresní soud v Chebu",
+    "OSKV": "Okresní soud v Karlových Varech", "OSZPCKV": "Okresní soud v Klatovech", "OSZPCPM": "Okresní soud Plzeň-město",
+    "OSPJ": "Okresní soud Plzeň-jih", "OSZPCPS": "Okresní soud Plzeň-sever", "OSZPCRO": "Okresní soud v Rokycanech",
+    "OSZPCSO": "Okresní soud v Sokolově", "OSZPCTC": "Okresní soud v Tachově", "KSSCEUL": "Krajský soud v Ústí nad Labem",
+    "KSULLBC": "KS Ústí n.L. - pobočka Liberec", "OSCL": "Okresní soud v České Lípě", "OSSCEDC": "Okresní soud v Děčíně",
+    "OSSCECV": "Okresní soud v Chomutově", "OSSCEJN": "Okresní soud v Jablonci nad Nisou", "OSSCELB": "Okresní soud v Liberci",
+    "OSLT": "Okresní soud v Litoměřicích", "OSSCELN": "Okresní soud v Lounech", "OSSCEMO": "Okresní soud v Mostě",
+    "OSSCETP": "Okresní soud v Teplicích", "OSSCEUL": "Okresní soud v Ústí nad Labem", "KSVYCHK": "Krajský soud v Hradci Králové",
+    "KSHKPCE": "KS Hradec Králové - pobočka Pardubice", "OSVYCHB": "Okresní soud v Havlíčkově Brodě", "OSVYCHK": "Okresní soud v Hradci Králové",
+    "OSCHR": "Okresní soud v Chrudimi", "OSJC": "Okresní soud v Jičíně", "OSNA": "Okresní soud v Náchodě",
+    "OSVYCPA": "Okresní soud v Pardubicích", "OSVYCRK": "Okresní soud v Rychnově nad Kněžnou", "OSSE": "Okresní soud v Semilech",
+    "OSVYCSY": "Okresní soud ve Svitavách", "OSTU": "Okresní soud v Trutnově", "OSUO": "Okresní soud v Ústí nad Orlicí",
+    "KSJIMBM": "Krajský soud v Brně", "KSBRJI": "KS Brno - pobočka Jihlava", "KSBRZL": "KS Brno - pobočka Zlín",
+    "OSJIMBM": "Městský soud v Brně", "OSBK": "Okresní soud v Blansku", "OSBO": "Okresní soud Brno-venkov",
+    "OSJIMBV": "Okresní soud v Břeclavi", "OSHO": "Okresní soud v Hodoníně", "OSJI": "Okresní soud v Jihlavě",
+    "OSKM": "Okresní soud v Kroměříži", "OSJIMPV": "Okresní soud v Prostějově", "OSTRB": "Okresní soud v Třebíči",
+    "OSJIMUH": "Okresní soud v Uherském Hradišti", "OSJIMVY": "Okresní soud ve Vyškově", "OSJIMZL": "Okresní soud ve Zlíně",
+    "OSJIMZN": "Okresní soud ve Znojmě", "OSJIMZR": "Okresní soud ve Žďáru nad Sázavou", "KSSEMOS": "Krajský soud v Ostravě",
+    "KSOSOL": "KS Ostrava - pobočka Olomouc", "OSBR": "Okresní soud v Bruntále", "OSSEMFM": "Okresní soud ve Frýdku-Místku",
+    "OSJE": "Okresní soud v Jeseníku", "OSSEMKA": "Okresní soud v Karviné", "OSNJ": "Okresní soud v Novém Jičíně",
+    "OSSEMOC": "Okresní soud v Olomouci", "OSSEMOP": "Okresní soud v Opavě", "OSSEMOS": "Okresní soud v Ostravě",
+    "OSSEMPR": "Okresní soud v Přerově", "OSSEMSU": "Okresní soud v Šumperku", "OSSEMVS": "Okresní soud ve Vsetíně","OSVYCNA": "Okresní soud Náchod",
+    "OSJIMHO": "Okresní soud Hodonín", "OSSTCME": "Okresní soud Mělník", "OSJICCK" : "Okresní soud Český Krumlov", "OSVYCJC" : "Okresní soud Jičín",
+    "OSSCECL": "Okresní soud Česká Lípa"
+}
+
+# -------------------------------------------------------------------------
+# 1. SCHÉMA DATABÁZE
+# -------------------------------------------------------------------------
+
+def _odmitni_konstantu(nazev):
+    """parse_constant pro json.loads: NaN/Infinity Python přijme, Postgres jsonb ne."""
+    raise ValueError(f"{nazev} není platný JSON")
+
+def init_db():
+    """Vytvoří/doplní tabulky a indexy (idempotentní migrace). Chybu ukáže volající (UI přes st.error, worker ve výpisu)."""
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        
+        # 1. Tabulka případů
+        c.execute('''CREATE TABLE IF NOT EXISTS pripady
+                     (id SERIAL PRIMARY KEY,
+                      oznaceni TEXT,
+                      url TEXT,
+                      params_json TEXT,
+                      pocet_udalosti INTEGER,
+                      posledni_udalost TEXT,
+                      ma_zmenu BOOLEAN,
+                      posledni_kontrola TIMESTAMP,
+                      realny_nazev_soudu TEXT)''')
+        
+        # 2. Tabulka uživatelů
+        c.execute('''CREATE TABLE IF NOT EXISTS uzivatele
+                     (id SERIAL PRIMARY KEY,
+                      username TEXT UNIQUE,
+                      password TEXT,
+                      email TEXT,
+                      role TEXT)''')
+
+        # 3. Tabulka historie akcí
+        c.execute('''CREATE TABLE IF NOT EXISTS historie
+                     (id SERIAL PRIMARY KEY,
+                      datum TIMESTAMP,
+                      uzivatel TEXT,
+                      akce TEXT,
+                      popis TEXT)''')
+        
+        # 4. Tabulka logů kontrol
+        c.execute('''CREATE TABLE IF NOT EXISTS system_logs
+                     (id SERIAL PRIMARY KEY,
+                      start_time TIMESTAMP,
+                      end_time TIMESTAMP,
+                      mode TEXT,
+                      processed_count INTEGER)''')
+        
+        # 5. Tabulka pro stav systému (Most mezi workerem a UI)
+        c.execute('''CREATE TABLE IF NOT EXISTS system_status
+                     (id INTEGER PRIMARY KEY,
+                      is_running BOOLEAN,
+                      progress INTEGER,
+                      total INTEGER,
+                      mode TEXT,
+                      last_update TIMESTAMP)''')
+        
+        # Otisk posledního seznamu událostí (rychlá detekce změn bez formátování)
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS otisk_udalosti TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS posledni_datum_udalosti TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS posledni_poradi INTEGER")
+
+        # 6. Historie událostí jednotlivých spisů (plní se inkrementálně)
+        c.execute('''CREATE TABLE IF NOT EXISTS udalosti
+                     (pripad_id INTEGER REFERENCES pripady(id) ON DELETE CASCADE,
+                      soud TEXT,
+                      datum TEXT,
+                      poradi INTEGER,
+                      kod TEXT,
+                      text TEXT,
+                      nova BOOLEAN DEFAULT FALSE,
+                      vlozeno TIMESTAMP,
+                      PRIMARY KEY (pripad_id, datum, poradi))''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_udalosti_datum ON udalosti (datum)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_udalosti_soud_datum ON udalosti (soud, datum)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_udalosti_vlozeno ON udalosti (vlozeno)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_udalosti_nove ON udalosti (pripad_id) WHERE nova")
+
+        # 7. Outbox notifikací (plní se ve stejné transakci jako změna spisu)
+        c.execute('''CREATE TABLE IF NOT EXISTS notifikace_outbox
+                     (id SERIAL PRIMARY KEY,
+                      klic TEXT UNIQUE,
+                      pripad_id INTEGER,
+                      nazev TEXT,
+                      udalost TEXT,
+                      znacka TEXT,
+                      soud TEXT,
+                      url TEXT,
+                      stav TEXT DEFAULT 'ceka',
+                      pokusy INTEGER DEFAULT 0,
+                      vytvoreno TIMESTAMP,
+                      dalsi_pokus TIMESTAMP,
+                      odeslano TIMESTAMP)''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_ceka ON notifikace_outbox (dalsi_pokus) WHERE stav = 'ceka'")
+        # Příjemci, kterým při minulém pokusu zpráva nedošla (JSON seznam) - opakuje se jen jim
+        c.execute("ALTER TABLE notifikace_outbox ADD COLUMN IF NOT EXISTS prijemci_zbyva TEXT")
+
+        # Strukturovaná spisová značka (místo parsování params_json)
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS typ TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS soud TEXT")
+        # senat/cislo/rocnik jako TEXT: API je chce přesně tak, jak byly v URL (vč. úvodních nul)
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS senat TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS druh TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS cislo TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS rocnik TEXT")
+        c.execute("SELECT data_type FROM information_schema.columns WHERE table_name = 'pripady' AND column_name = 'senat'")
+        if c.fetchone()[0] == 'integer':
+            # Dřívější INTEGER sloupce (nečíselné hodnoty = NULL, ztracené nuly) -> TEXT a nové doplnění níže
+            c.execute("DROP INDEX IF EXISTS uq_pripady_spis")
+            c.execute("""ALTER TABLE pripady ALTER COLUMN senat TYPE TEXT, ALTER COLUMN cislo TYPE TEXT,
+                                             ALTER COLUMN rocnik TYPE TEXT""")
+            c.execute("UPDATE pripady SET soud = NULL WHERE params_json IS NOT NULL")
+        # Neplatný params_json by shodil ::jsonb v doplnění níže - takové řádky se opraví z URL
+        c.execute("SELECT id, url, params_json FROM pripady WHERE soud IS NULL AND params_json IS NOT NULL")
+        opravy = []
+        for cid, url, params_json in c.fetchall():
+            try:
+                json.loads(params_json, parse_constant=_odmitni_konstantu)
+                continue
+            except ValueError:
+                p = parsuj_url(url) if url else None
+                opravy.append((cid, json.dumps(p) if p else None))
+        if opravy:
+            print(f"Neplatný params_json u {len(opravy)} spisů, doplněn z URL.")
+            execute_values(c, """UPDATE pripady AS p SET params_json = v.params
+                                 FROM (VALUES %s) AS v(id, params) WHERE p.id = v.id""", opravy)
+        c.execute("""
+            UPDATE pripady SET
+                typ = params_json::jsonb->>'typ',
+                soud = params_json::jsonb->>'soud',
+                senat = params_json::jsonb->>'senat',
+                druh = params_json::jsonb->>'druh',
+                cislo = params_json::jsonb->>'cislo',
+                rocnik = params_json::jsonb->>'rocnik'
+            WHERE soud IS NULL AND params_json IS NOT NULL
+        """)
+
+        # Hledání: normalizovaná spisová značka a text pro trigram index.
+        # Značka se skládá z typových sloupců; dřívější verze četla params_json::jsonb (padala na neplatném JSON)
+        c.execute("""SELECT generation_expression FROM information_schema.columns
+                     WHERE table_name = 'pripady' AND column_name = 'spisova_znacka_norm'""")
+        vyraz = c.fetchone()
+        if vyraz and 'params_json' in (vyraz[0] or ''):
+            c.execute("ALTER TABLE pripady DROP COLUMN spisova_znacka_norm")
+        c.execute("""ALTER TABLE pripady ADD COLUMN IF NOT EXISTS spisova_znacka_norm TEXT GENERATED ALWAYS AS (
+                         lower(coalesce(senat, '') || coalesce(druh, '') || coalesce(cislo, '') || '/' || coalesce(rocnik, ''))
+                     ) STORED""")
+        c.execute("""ALTER TABLE pripady ADD COLUMN IF NOT EXISTS hledany_text TEXT GENERATED ALWAYS AS (
+                         lower(coalesce(oznaceni, '') || ' ' || coalesce(realny_nazev_soudu, '') || ' ' || coalesce(posledni_udalost, ''))
+                     ) STORED""")
+        # Název soudu pro hledání (SOUDY_MAPA) - doplnění starších řádků
+        execute_values(c, """
+            UPDATE pripady AS p SET realny_nazev_soudu = m.nazev
+            FROM (VALUES %s) AS m(kod, nazev)
+            WHERE p.realny_nazev_soudu IS NULL AND p.soud = m.kod
+        """, list(SOUDY_MAPA.items()))
+
+        # Plánovač: kdy má být spis znovu zkontrolován (NULL = hned)
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS dalsi_kontrola TIMESTAMP")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pripady_dalsi_kontrola ON pripady (dalsi_kontrola)")
+
+        # Lease pro souběžné workery (kdo spis právě kontroluje a do kdy)
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS lease_worker TEXT")
+        c.execute("ALTER TABLE pripady ADD COLUMN IF NOT EXISTS lease_do TIMESTAMP")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pripady_lease ON pripady (lease_worker) WHERE lease_worker IS NOT NULL")
+
+        # Stav jednotlivých workerů; system_status (id=1) je jejich souhrn pro UI
+        c.execute('''CREATE TABLE IF NOT EXISTS worker_status
+                     (worker_id TEXT PRIMARY KEY,
+                      is_running BOOLEAN,
+                      progress INTEGER,
+                      total INTEGER,
+                      mode TEXT,
+                      last_update TIMESTAMP)''')
+
+        # Kdo drží zámek běhu (samotný zámek je advisory lock, tady jen údaje pro převzetí)
+        c.execute('''CREATE TABLE IF NOT EXISTS run_lock
+                     (nazev TEXT PRIMARY KEY,
+                      drzitel TEXT,
+                      pid INTEGER,
+                      ziskano TIMESTAMP,
+                      heartbeat TIMESTAMP)''')
+
+        # Verze dat pro cache v UI
+        c.execute("ALTER TABLE system_status ADD COLUMN IF NOT EXISTS data_verze BIGINT DEFAULT 0")
+
+        # Statistiky API k logům kontrol (limiter / retry, výsledky kontrol)
+        for sloupec in ("request_count", "retry_count", "throttled_count", "error_count", "skipped_count",
+                        "success_count", "failure_count", "exception_count", "change_count"):
+            c.execute(f"ALTER TABLE system_logs ADD COLUMN IF NOT EXISTS {sloupec} INTEGER DEFAULT 0")
+        # Časování běhu: histogramy úseků, soudy, nejpomalejší spisy (StatistikaBehu.casovani)
+        c.execute("ALTER TABLE system_logs ADD COLUMN IF NOT EXISTS casovani_json TEXT")
+        
+        # Inicializace stavového řádku (musí být odsazeno uvnitř try bloku)
+        c.execute("""
+            INSERT INTO system_status (id, is_running, progress, total, mode) 
+            SELECT 1, False, 0, 0, 'Spí' 
+            WHERE NOT EXISTS (SELECT 1 FROM system_status WHERE id = 1)
+        """)
+                     
+        conn.commit()
+
+        # Trigram indexy pro hledání (pg_trgm nemusí být na každém serveru povolené -> bez něj jen pomalejší hledání)
+        try:
+            c.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_pripady_hledani ON pripady USING gin (hledany_text gin_trgm_ops)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_pripady_znacka ON pripady USING gin (spisova_znacka_norm gin_trgm_ops)")
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Trigram indexy nevytvořeny: {e}")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_pripady_zmena_id ON pripady (ma_zmenu, id DESC)")
+        conn.commit()
+
+        # Jeden spis = jeden řádek. Pokud už v DB duplicity jsou, index nevznikne, dokud se nesmažou.
+        try:
+            c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS uq_pripady_spis ON pripady
+                         (soud, coalesce(senat, ''), coalesce(druh, ''), coalesce(cislo, ''), coalesce(rocnik, ''))""")
+            conn.commit()
+        except psycopg2.IntegrityError as e:
+            conn.rollback()
+            print(f"Unikátní index spisů nevytvořen (duplicitní spisy v DB): {e}")
+
+# --- LOGOVÁNÍ ---
+
+def log_do_historie(akce, popis, user=None):
+    # Pokud je user None (nepřihlášený worker) nebo prázdný řetězec, nastavíme Robota
+    if not user:
+        user = "🤖 Systém (Robot)"
+    
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO historie (datum, uzivatel, akce, popis) VALUES (%s, %s, %s, %s)", 
+                      (get_now(), user, akce, popis))
+            conn.commit()
+    except Exception as e:
+        print(f"Chyba logování: {e}")
+
+def zvys_verzi_dat(c):
+    """Volá každá zapisující funkce ve své transakci -> ostatní sessions poznají změnu jedním malým dotazem."""
+    c.execute("UPDATE system_status SET data_verze = COALESCE(data_verze, 0) + 1 WHERE id = 1")
+    c.execute(f"NOTIFY {KANAL_DATA}")
+
+# --- 📡 PUSH STAVU (LISTEN/NOTIFY) ---
+KANAL_STAV = "monitor_status"
+KANAL_DATA = "monitor_data"
+
+# Identita procesu pro worker_status a lease (na Heroku jméno dyna, jinak host:pid)
+ID_WORKERU = f"{os.getenv('DYNO') or socket.gethostname()}:{os.getpid()}"
+WORKER_TIMEOUT = 180  # s bez heartbeatu = worker se nepočítá mezi běžící
+
+def zapis_stav(c, is_running, progress, total, mode, worker_id=None):
+    """
+    Zapíše stav workeru do worker_status a přepočítá souhrn v system_status (id=1):
+    součet progresu i totalu běžících workerů (total = co si worker zabral), mód naposledy aktivního.
+    Souhrn jde i jako NOTIFY (doručí se až po commitu).
+    """
+    now = get_now()
+    c.execute("""
+        INSERT INTO worker_status (worker_id, is_running, progress, total, mode, last_update)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (worker_id) DO UPDATE SET is_running = EXCLUDED.is_running, progress = EXCLUDED.progress,
+            total = EXCLUDED.total, mode = EXCLUDED.mode, last_update = EXCLUDED.last_update
+    """, (worker_id or ID_WORKERU, is_running, progress, total, mode, now))
+    c.execute("""
+        WITH a AS (
+            SELECT COUNT(*) AS bezi, COALESCE(SUM(progress), 0) AS progress, COALESCE(SUM(total), 0) AS total,
+                   (ARRAY_AGG(mode ORDER BY last_update DESC))[1] AS mode
+            FROM worker_status WHERE is_running AND last_update > %s
+        ), s AS (
+            UPDATE system_status SET
+                is_running = a.bezi > 0,
+                progress = CASE WHEN a.bezi > 0 THEN a.progress ELSE %s END,
+                total = CASE WHEN a.bezi > 0 THEN a.total ELSE %s END,
+                mode = CASE WHEN a.bezi > 1 THEN a.mode || ' · workerů: ' || a.bezi
+                            WHEN a.bezi = 1 THEN a.mode ELSE %s END,
+                last_update = %s
+            FROM a WHERE id = 1
+            RETURNING system_status.is_running, system_status.progress, system_status.total,
+                      system_status.mode, system_status.last_update
+        )
+        SELECT pg_notify(%s, row_to_json(s)::text) FROM s
+    """, (now - datetime.timedelta(seconds=WORKER_TIMEOUT), progress, total, mode, now, KANAL_STAV))
+
+def vycistit_stare_logy(dny=30):
+    """Smaže systémové logy a historii starší než stanovený počet dní."""
+    try:
+        limit = get_now() - datetime.timedelta(days=dny)
+        with db_spojeni() as conn:
+            c = conn.cursor()
+        
+            # Smazání starých logů kontrol
+            c.execute("DELETE FROM system_logs WHERE start_time < %s", (limit,))
+            # Smazání staré historie akcí uživatelů
+            c.execute("DELETE FROM historie WHERE datum < %s", (limit,))
+            # Workery, které se dlouho neozvaly (zaniklá dyna)
+            c.execute("DELETE FROM worker_status WHERE NOT is_running AND last_update < %s", (limit,))
+            # Odeslané notifikace už v outboxu nepotřebujeme
+            c.execute("DELETE FROM notifikace_outbox WHERE stav = 'odeslano' AND odeslano < %s", (limit,))
+        
+            conn.commit()
+            print(f"🧹 Úklid: Smazány záznamy starší než {dny} dní.")
+    except Exception as e:
+        print(f"Chyba při úklidu DB: {e}")
+
+# -------------------------------------------------------------------------
+# 2. LOGIKA ODESÍLÁNÍ
+# -------------------------------------------------------------------------
+
+# Digest = jeden souhrnný e-mail na příjemce za celý běh místo e-mailu za každý spis
+NOTIFIKACE_DIGEST = str(get_secret("NOTIFIKACE_DIGEST") or "").lower() in ("1", "true", "ano", "yes")
+
+def nacti_prijemce():
+    prijemci = []
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("SELECT email FROM uzivatele WHERE email IS NOT NULL AND email != ''")
+            prijemci = [r[0] for r in c.fetchall()]
+    except: prijemci = []
+    
+    if SUPER_ADMIN_EMAIL and "@" in SUPER_ADMIN_EMAIL:
+        prijemci.append(SUPER_ADMIN_EMAIL)
+    
+    return list(set(prijemci))
+
+def sestav_email_zmeny(nazev, udalost, znacka, soud, url, cas_odeslani):
+    msg = MIMEMultipart("alternative")
+    msg['From'] = SMTP_EMAIL
+    
+    # Předmět obsahuje spisovou značku (např. "Změna ve spisu: 81 T 8 / 2020")
+    msg['Subject'] = f"🚨 Změna ve spisu: {znacka}"
+
+    # Více nových událostí najednou -> každá na vlastním řádku
+    udalost_html = udalost.replace("\n", "<br>")
+
+    # 1. Čistý text
+    text_body = f"""
+    {nazev}
+    
+    Soud: {soud}
+    Spisová značka: {znacka}
+
+    Nová událost:
+    {udalost}
+
+    Otevřít na Infosoudu:
+    {url}
+    
+    --
+    Infosoud Monitor (Odesláno: {cas_odeslani})
+    """
+
+    # 2. HTML verze
+    html_body = f"""
+    <html>
+      <body>
+        <h3>{nazev}</h3>
+        
+        <p>
+           <b>Soud:</b> {soud}<br>
+           <b>Spisová značka:</b> {znacka}
+        </p>
+        
+        <div style="background-color: #f5f5f5; padding: 15px; border-left: 5px solid #d32f2f; margin: 15px 0;">
+            <b>Nová událost:</b><br>
+            {udalost_html}
+        </div>
+        
+        <br>
+        <a href="{url}" style="background-color: #d32f2f; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px; font-weight: bold;">
+           👉 Otevřít na Infosoudu
+        </a>
+        
+        <br><br>
+        <hr style="border: 0; border-top: 1px solid #eee;">
+        <small style="color: grey;">
+            Infosoud Monitor • Odesláno: {cas_odeslani}
+        </small>
+      </body>
+    </html>
+    """
+
+    msg.attach(MIMEText(text_body, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+def sestav_email_digest(zmeny, cas_odeslani):
+    """Souhrn všech změn z jednoho běhu; zmeny = [(nazev, udalost, znacka, soud, url), ...]."""
+    msg = MIMEMultipart("alternative")
+    msg['From'] = SMTP_EMAIL
+    msg['Subject'] = f"🚨 Změny ve spisech ({len(zmeny)})"
+
+    text_casti = []; html_casti = []
+    for nazev, udalost, znacka, soud, url in zmeny:
+        text_casti.append(f"{nazev}\n    Soud: {soud}\n    Spisová značka: {znacka}\n    Nová událost: {udalost}\n    {url}")
+        html_casti.append(f"""
+        <div style="background-color: #f5f5f5; padding: 10px 15px; border-left: 5px solid #d32f2f; margin: 10px 0;">
+            <b>{nazev}</b> &nbsp; <a href="{url}">👉 Otevřít na Infosoudu</a><br>
+            <small>{soud} • {znacka}</small><br>
+            {udalost.replace(chr(10), "<br>")}
+        </div>""")
+
+    text_body = "\n\n    ".join(text_casti)
+    text_body = f"""
+    Změny ve sledovaných spisech ({len(zmeny)}):
+
+    {text_body}
+
+    --
+    Infosoud Monitor (Odesláno: {cas_odeslani})
+    """
+    html_body = f"""
+    <html>
+      <body>
+        <h3>Změny ve sledovaných spisech ({len(zmeny)})</h3>
+        {"".join(html_casti)}
+        <hr style="border: 0; border-top: 1px solid #eee;">
+        <small style="color: grey;">
+            Infosoud Monitor • Odesláno: {cas_odeslani}
+        </small>
+      </body>
+    </html>
+    """
+    msg.attach(MIMEText(text_body, "plain"))
+    msg.attach(MIMEText(html_body, "html"))
+    return msg
+
+class Notifikator:
+    """
+    Rozesílá notifikace jednoho běhu monitor_job přes jedno přihlášené SMTP spojení.
+    Seznam příjemců se načte jednou za běh. V režimu digest se změny sbírají
+    a při zavri() odejde jeden souhrnný e-mail na příjemce.
+    """
+    def __init__(self, digest=None, stats=None):
+        self.digest = NOTIFIKACE_DIGEST if digest is None else digest
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.smtp = None
+        self.prijemci = None
+        self.zmeny = []
+        self.odeslano = 0
+
+    def _prijemci(self):
+        if self.prijemci is None:
+            self.prijemci = nacti_prijemce()
+        return self.prijemci
+
+    def _spojeni(self):
+        if self.smtp is None:
+            s = smtplib.SMTP(SMTP_SERVER, int(SMTP_PORT))
+            if SMTP_STARTTLS: s.starttls()
+            s.login(SMTP_EMAIL, SMTP_PASSWORD)
+            self.smtp = s
+        return self.smtp
+
+    def _odesli(self, msg, prijemci):
+        with mer_usek(self.stats, "smtp"):
+            nedoruceno = self._odesli_smtp(msg, prijemci)
+        M_NOTIFIKACE.labels("chyba" if nedoruceno else "odeslano").inc()
+        return nedoruceno
+
+    def _odesli_smtp(self, msg, prijemci):
+        """
+        Pošle zprávu každému příjemci zvlášť. Vrací ty, kterým nedošla ([] = všem).
+        Po výpadku spojení se pokračuje jen se zbývajícími - kdo už zprávu dostal, nedostane ji znovu.
+        """
+        zbyva = list(prijemci)
+        nedoruceno = []
+        for pokus in range(2):
+            try:
+                s = self._spojeni()
+                while zbyva:
+                    p = zbyva[0]
+                    del msg['To']; msg['To'] = p
+                    try:
+                        s.sendmail(SMTP_EMAIL, p, msg.as_string())
+                    except smtplib.SMTPRecipientsRefused:
+                        # Odmítnutá adresa - ostatním se pošle i tak
+                        nedoruceno.append(p)
+                    zbyva.pop(0)
+                break
+            except smtplib.SMTPServerDisconnected:
+                # Server spojení mezitím zavřel (idle timeout) -> jedno nové přihlášení, zbytek příjemců
+                self.smtp = None
+            except Exception as e:
+                print(f"Chyba emailu: {e}")
+                self._zavri_spojeni()
+                break
+        else:
+            print("Chyba emailu: SMTP spojení opakovaně ukončeno serverem")
+        nedoruceno.extend(zbyva)
+        doruceno = len(prijemci) - len(nedoruceno)
+        if doruceno:
+            self.odeslano += 1
+            log_do_historie("Odeslání notifikace", f"Odesláno na {doruceno} adres.")
+        return nedoruceno
+
+    def _zavri_spojeni(self):
+        if self.smtp is not None:
+            try: self.smtp.quit()
+            except Exception: pass
+            self.smtp = None
+
+    def pridej(self, nazev, udalost, znacka, soud, url, prijemci=None):
+        """
+        Odešle (nebo v digestu zařadí) jednu změnu. Vrací příjemce, kterým se nedoručilo
+        ([] = hotovo) - jen jim se má odeslání zopakovat. prijemci = dokončení dřívějšího
+        částečného odeslání: pošle se hned a jen jim, i v režimu digest.
+        """
+        if "novy.email" in SMTP_EMAIL: return []
+        with self.lock:
+            if self.digest and prijemci is None:
+                self.zmeny.append((nazev, udalost, znacka, soud, url))
+                return []
+            if prijemci is None:
+                prijemci = self._prijemci()
+            if not prijemci: return []
+            # Získání aktuálního českého času pro patičku
+            cas_odeslani = get_now().strftime("%d.%m.%Y %H:%M")
+            return self._odesli(sestav_email_zmeny(nazev, udalost, znacka, soud, url, cas_odeslani), prijemci)
+
+    def zavri(self):
+        """Odešle případný digest a ukončí SMTP spojení. Vrací příjemce, kterým digest nedošel."""
+        nedoruceno = []
+        with self.lock:
+            if self.zmeny:
+                prijemci = self._prijemci()
+                if prijemci:
+                    cas_odeslani = get_now().strftime("%d.%m.%Y %H:%M")
+                    nedoruceno = self._odesli(sestav_email_digest(self.zmeny, cas_odeslani), prijemci)
+                self.zmeny = []
+            self._zavri_spojeni()
+        return nedoruceno
+
+def odeslat_email_notifikaci(nazev, udalost, znacka, soud, url):
+    """Jednorázová notifikace mimo běh monitor_job (vlastní spojení, bez digestu)."""
+    notifikator = Notifikator(digest=False)
+    try:
+        notifikator.pridej(nazev, udalost, znacka, soud, url)
+    finally:
+        notifikator.zavri()
+    
+# --- 📮 OUTBOX NOTIFIKACÍ ---
+OUTBOX_MAX_POKUSU = 6          # pak zůstane ve stavu 'chyba' pro ruční kontrolu
+OUTBOX_INTERVAL = 15.0         # s, jak často odesílač kontroluje outbox během běhu
+OUTBOX_DAVKA = 50
+
+OUTBOX_ZABRANI = 600           # s, na jak dlouho si odesílač řádky zabere (pak je po pádu převezme jiný)
+
+def _zaber_outbox(limit):
+    """
+    Zabere dávku čekajících notifikací: posune jim dalsi_pokus o OUTBOX_ZABRANI a hned commitne.
+    Ostatní odesílače je pak nevidí, přitom se během SMTP nedrží žádný zámek ani spojení z poolu.
+    """
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        now = get_now()
+        c.execute("""
+            WITH k AS (
+                SELECT id FROM notifikace_outbox
+                WHERE stav = 'ceka' AND dalsi_pokus <= %s
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+            )
+            UPDATE notifikace_outbox AS o SET dalsi_pokus = %s FROM k WHERE o.id = k.id
+            RETURNING o.id, o.nazev, o.udalost, o.znacka, o.soud, o.url, o.pokusy, o.prijemci_zbyva
+        """, (now, limit, now + datetime.timedelta(seconds=OUTBOX_ZABRANI)))
+        radky = sorted(c.fetchall())
+        conn.commit()
+    return radky
+
+def _vyhodnot_outbox(vysledky):
+    """
+    Zapíše výsledek odeslání zabraných řádků [(radek, nedoruceno)]. Nedoručení příjemci se
+    uloží do prijemci_zbyva - další pokus půjde jen jim. Vrací počet dokončených řádků.
+    """
+    if not vysledky:
+        return 0
+    odeslano = 0
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        now = get_now()
+        for r, nedoruceno in vysledky:
+            cid, pokusy = r[0], r[6] + 1
+            if not nedoruceno:
+                c.execute("""UPDATE notifikace_outbox SET stav = 'odeslano', odeslano = %s, pokusy = %s, prijemci_zbyva = NULL
+                             WHERE id = %s""", (now, pokusy, cid))
+                odeslano += 1
+            else:
+                stav = 'chyba' if pokusy >= OUTBOX_MAX_POKUSU else 'ceka'
+                c.execute("""UPDATE notifikace_outbox SET stav = %s, pokusy = %s, dalsi_pokus = %s, prijemci_zbyva = %s
+                             WHERE id = %s""",
+                          (stav, pokusy, now + datetime.timedelta(minutes=2 ** pokusy), json.dumps(nedoruceno), cid))
+        conn.commit()
+    return odeslano
+
+def odesli_outbox(notifikator=None, limit=OUTBOX_DAVKA):
+    """
+    Odešle všechny čekající notifikace z outboxu (po dávkách, dokud výběr nevrátí méně než limit).
+    Řádky se nejdřív zaberou a commitnou (viz _zaber_outbox), SMTP běží mimo transakci,
+    takže dva odesílače stejnou zprávu neodešlou dvakrát. Vrací počet odeslaných.
+    V režimu digest jdou všechny čekající řádky do jednoho souhrnného e-mailu.
+    Předaný notifikator (a jeho SMTP spojení) zůstává otevřený pro další volání.
+    """
+    vlastni = notifikator is None
+    notifikator = notifikator or Notifikator()
+    odeslano = 0
+    zabrane = []  # digest: řádky čekající na jedno společné odeslání
+    try:
+        while True:
+            radky = _zaber_outbox(limit)
+            vysledky = []
+            for r in radky:
+                # Po částečném odeslání jen zbývajícím příjemcům (ti už doručení by dostali duplikát)
+                zbyva = json.loads(r[7]) if r[7] else None
+                nedoruceno = notifikator.pridej(*r[1:6], prijemci=zbyva)
+                if notifikator.digest and zbyva is None:
+                    zabrane.append(r)
+                else:
+                    vysledky.append((r, nedoruceno))
+            odeslano += _vyhodnot_outbox(vysledky)
+            if len(radky) < limit:
+                break
+        if zabrane:
+            # V režimu digest se skutečně odesílá až tady - výsledek platí pro všechny řádky
+            nedoruceno = notifikator.zavri()
+            odeslano += _vyhodnot_outbox([(r, nedoruceno) for r in zabrane])
+    except Exception as e:
+        # Zabrané a nevyhodnocené řádky se vrátí do hry po OUTBOX_ZABRANI
+        print(f"Chyba odesílání outboxu: {e}")
+    finally:
+        if vlastni: notifikator.zavri()
+    return odeslano
+
+class OdesilacOutboxu:
+    """
+    Vlákno, které během běhu monitor_job průběžně vyprazdňuje outbox,
+    takže pomalé SMTP nikdy nebrzdí dotazy na Infosoud.
+    V režimu digest se posílá jen jednou na konci běhu.
+    """
+    def __init__(self, digest=None, interval=OUTBOX_INTERVAL, stats=None):
+        self.digest = NOTIFIKACE_DIGEST if digest is None else digest
+        # Jedno SMTP spojení pro celý běh
+        self.notifikator = Notifikator(digest=self.digest, stats=stats)
+        self.interval = interval
+        self.stop = threading.Event()
+        self.odeslano = 0
+        self.vlakno = threading.Thread(target=self._smycka, name="odesilac-outboxu", daemon=True)
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def _vyprazdni(self):
+        # odesli_outbox bere dávky, dokud outbox není prázdný (digest = jeden e-mail na všechno)
+        self.odeslano += odesli_outbox(self.notifikator, limit=OUTBOX_DAVKA)
+
+    def _smycka(self):
+        while not self.stop.wait(self.interval):
+            if not self.digest:
+                self._vyprazdni()
+        # Finální odeslání po dopsání posledních dávek
+        self._vyprazdni()
+        self.notifikator.zavri()
+
+    def zavri(self):
+        self.stop.set()
+        self.vlakno.join()
+
+# -------------------------------------------------------------------------
+# 3. PARSOVÁNÍ A SCRAPING
+# -------------------------------------------------------------------------
+
+def parsuj_url(url):
+    try:
+        p = parse_qs(urlparse(url).query)
+        
+        # Extrakce kódu soudu ze starých i nových parametrů
+        soud = p.get('org', [None])[0] or p.get('krajOrg', [None])[0] or p.get('okresniSoud', [None])[0] or p.get('druhOrganizace', [None])[0]
+        
+        typ_org = p.get('typOrganizace', [None])[0]
+        typ = p.get('typSoudu', [None])[0]
+        
+        # Specifická logika pro Nejvyšší soud
+        if typ == 'ns' or typ_org == 'NEJVYSSI':
+            typ = 'ns'
+            soud = 'NS'
+            
+        # Dedukce typu soudu z nových parametrů (pokud chybí typSoudu)
+        if soud and not typ:
+            if 'okresniSoud' in p: typ = 'os'
+            elif 'druhOrganizace' in p:
+                if soud.startswith('VS'): typ = 'vs'
+                else: typ = 'ks'
+                
+        # Záchytná síť pro krajské/městské soudy
+        if soud and soud.upper().startswith(('KS','MS')): typ = 'ks'
+        if not typ: typ = 'os'
+
+        druh = p.get('druhVeci', p.get('druhVec', [None]))[0]
+        if druh: druh = druh.upper()
+
+        return {
+            "typ": typ, 
+            "soud": soud, 
+            "senat": p.get('cisloSenatu',[None])[0], 
+            "druh": druh, 
+            "cislo": p.get('bcVec',[p.get('cislo',[None])[0]])[0], 
+            "rocnik": p.get('rocnik',[None])[0]
+        }
+    except: 
+        return None
+
+def spisova_znacka(p):
+    """Lidsky čitelná spisová značka ze slovníku/řádku s klíči senat, druh, cislo, rocnik."""
+    return f"{p.get('senat')} {p.get('druh')} {p.get('cislo')} / {p.get('rocnik')}"
+
+def sloupce_spisu(p):
+    """params z parsuj_url -> hodnoty pro sloupce (typ, soud, senat, druh, cislo, rocnik), beze změny."""
+    return (p.get('typ'), p.get('soud'), p.get('senat'), p.get('druh'), p.get('cislo'), p.get('rocnik'))
+
+# Řádek pro kontrolu spisu - params se skládají ze sloupců, ne z params_json
+RadekPripadu = collections.namedtuple("RadekPripadu", [
+    "id", "pocet_udalosti", "oznaceni", "posledni_udalost", "url",
+    "otisk_udalosti", "posledni_datum_udalosti", "posledni_poradi",
+    "typ", "soud", "senat", "druh", "cislo", "rocnik"])
+
+def params_z_radku(row):
+    """Stejný tvar jako parsuj_url (sloupce jsou TEXT, hodnoty jdou do API tak, jak přišly z URL)."""
+    return {"typ": row.typ, "soud": row.soud, "senat": row.senat, "druh": row.druh,
+            "cislo": row.cislo, "rocnik": row.rocnik}
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36 Edg/119.0.0.0"
+]
+
+# Přepsatelné kvůli benchmarkům proti lokální náhradě API (benchmarks/fake_infosoud.py)
+INFOSOUD_API_URL = get_secret("INFOSOUD_API_URL") or "https://infosoud.gov.cz/api/v1/rizeni/vyhledej"
+
+def sestav_payload(params):
+    typ = params.get('typ')
+    soud = params.get('soud')
+    
+    # Sestavení payloadu (přesně podle API)
+    payload = {
+        'cisloSenatu': params.get('senat', ''),
+        'druhVeci': params.get('druh', ''),
+        'bcVec': params.get('cislo', ''),
+        'rocnik': params.get('rocnik', '')
+    }
+    
+    # Správné přiřazení soudu do payloadu
+    if typ == 'ns' or soud == 'NS':
+        payload['typOrganizace'] = 'NEJVYSSI'
+    else:
+        payload['typOrganizace'] = 'VSECHNY_KRAJE'
+        if typ in ['ks', 'vs'] or (soud and soud.startswith(('KS', 'VS', 'MSPHAAB'))):
+            payload['druhOrganizace'] = soud
+        else:
+            payload['okresniSoud'] = soud
+    return payload
+
+def sestav_hlavicky():
+    return {
+        "User-Agent": random.choice(USER_AGENTS),
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+
+# Rozšířený slovník pro lidsky čitelné výpisy událostí (doplňuje se přes registruj_kody_udalosti)
+PREKLAD_KODU = {
+    "ZAHAJ_RIZ": "Zahájení řízení",
+    "VYD_ROZH": "Vydání rozhodnutí",
+    "ST_VEC_VYR": "Vyřízení věci",
+    "VR_SP_NS": "Vrácení spisu",
+    "VRAC_SPIS": "Vrácení spisu",
+    "NAR_JED": "Nařízení jednání",
+    "DOVOL_RIZ": "Řízení o opravném prostředku na Nejvyšším soudu ČR",
+    "ODES_SPIS": "Odeslání spisu",
+    "ODVOLANI": "Řízení o opravném prostředku u krajského a vrchního soudu",
+    "POD_OP_PR": "Podán opravný prostředek",
+    "ST_VEC_ODS": "Skončení věci",
+    "VYR_OP_PR": "Vyřízení opravného prostředku",
+    "ZRUS_JED": "Zrušení jednání",
+    "ST_VEC_OBZ": "Obživnutí věci",
+    "ST_VEC_PUK": "Datum pravomocného ukončení věci"
+}
+
+# Kódy, které API vrátilo a slovník je nezná (vypíšou se na konci běhu). Plní je i vlákna UI,
+# proto jen pod zámkem; běh si je na konci vybere přes vyber_nezname_kody.
+NEZNAME_KODY = set()
+_NEZNAME_KODY_LOCK = threading.Lock()
+
+def registruj_kody_udalosti(preklady):
+    """Doplní nebo přepíše překlady kódů událostí, např. {"NOVY_KOD": "Text"}."""
+    PREKLAD_KODU.update(preklady)
+    with _NEZNAME_KODY_LOCK:
+        NEZNAME_KODY.difference_update(preklady)
+
+def vyber_nezname_kody():
+    """Seřazený snímek nepřeložených kódů; množina se tím vyprázdní (další běh hlásí jen své)."""
+    with _NEZNAME_KODY_LOCK:
+        kody = sorted(map(str, NEZNAME_KODY))
+        NEZNAME_KODY.clear()
+    return kody
+
+def formatuj_datum(datum_raw):
+    """'YYYY-MM-DD' z API -> 'DD.MM.YYYY' přímo z řetězce (bez strptime); jiný tvar vrátí beze změny."""
+    if isinstance(datum_raw, str) and len(datum_raw) == 10 and datum_raw[4] == '-' and datum_raw[7] == '-':
+        return f"{datum_raw[8:10]}.{datum_raw[5:7]}.{datum_raw[:4]}"
+    return datum_raw
+
+def formatuj_udalost(u):
+    """Jedna událost z API -> 'DD.MM.YYYY - Text'."""
+    kod_udalosti = u.get('udalost', 'NEZNAMA_UDALOST')
+    # Zkusíme přeložit, pokud nenajdeme, použijeme surový kód z API
+    text_udalosti = PREKLAD_KODU.get(kod_udalosti)
+    if text_udalosti is None:
+        with _NEZNAME_KODY_LOCK:
+            NEZNAME_KODY.add(kod_udalosti)
+        text_udalosti = kod_udalosti
+    return f"{formatuj_datum(u.get('datum', ''))} - {text_udalosti}"
+
+def _klic_udalosti(u):
+    return (u.get('datum') or '', u.get('poradi') or 0)
+
+def zpracuj_odpoved_api(data):
+    """Převede JSON odpověď API na seznam událostí 'DD.MM.YYYY - Text' (None = spis nenalezen)."""
+    # Pokud API nevrátí události
+    if not data or 'udalosti' not in data:
+        return None
+    # Seřadíme pro jistotu podle data a pořadí (API je vrací seřazené, Timsort pak jen projde seznam)
+    return [formatuj_udalost(u) for u in sorted(data['udalosti'] or [], key=_klic_udalosti)]
+
+def posledni_udalost(data):
+    """
+    Jen poslední událost (podle data a pořadí) pro posledni_udalost - bez řazení a formátování
+    celého seznamu. '' = spis bez událostí, None = spis nenalezen.
+    """
+    if not data or 'udalosti' not in data:
+        return None
+    posledni = None; klic_max = None
+    for u in data['udalosti'] or []:
+        klic = _klic_udalosti(u)
+        # >= jako stabilní řazení: při shodě vyhrává pozdější záznam
+        if klic_max is None or klic >= klic_max:
+            posledni, klic_max = u, klic
+    return formatuj_udalost(posledni) if posledni is not None else ""
+
+def radky_udalosti(cid, soud, data, od=None, nova=True, vlozeno=None):
+    """
+    Řádky pro tabulku udalosti z odpovědi API. od=(datum, poradi) vrátí jen události po něm.
+    Duplicitní (datum, poradi) v jedné odpovědi se slučují, aby INSERT ... ON CONFLICT nespadl.
+    """
+    radky = {}
+    for u in (data or {}).get('udalosti') or []:
+        klic = (u.get('datum') or '', u.get('poradi') or 0)
+        if od is not None and klic <= od:
+            continue
+        radky[klic] = (cid, soud, klic[0], klic[1], u.get('udalost'), formatuj_udalost(u), nova, vlozeno)
+    return [radky[k] for k in sorted(radky)]
+
+def souhrn_udalosti(data):
+    """(posledni_datum, posledni_poradi, pocet) jedním průchodem bez serializace, None = spis nenalezen."""
+    if not data or 'udalosti' not in data:
+        return None
+    udalosti_raw = data['udalosti'] or []
+    posledni = max(((u.get('datum') or '', u.get('poradi') or 0) for u in udalosti_raw), default=(None, None))
+    return posledni[0], posledni[1], len(udalosti_raw)
+
+def hash_udalosti(data):
+    """
+    Hash seznamu událostí jedním json.dumps celého seznamu. API je vrací seřazené;
+    jinak se nejdřív seřadí podle (datum, poradi), aby hash na pořadí v odpovědi nezávisel.
+    """
+    udalosti_raw = (data or {}).get('udalosti') or []
+    klice = [(u.get('datum') or '', u.get('poradi') or 0) for u in udalosti_raw]
+    if any(a > b for a, b in zip(klice, klice[1:])):
+        udalosti_raw = [u for _, u in sorted(zip(klice, udalosti_raw), key=lambda x: x[0])]
+    return hashlib.sha1(json.dumps(udalosti_raw, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def otisk_udalosti(data):
+    """
+    Levný otisk surové odpovědi: (hash, posledni_datum, posledni_poradi, pocet), None = spis nenalezen.
+    Počítá se před jakýmkoli formátováním.
+    """
+    souhrn = souhrn_udalosti(data)
+    return None if souhrn is None else (hash_udalosti(data), *souhrn)
+
+# --- ⏱️ PLÁNOVÁNÍ KONTROL ---
+# Intervaly v hodinách; běh je jednou za hodinu, takže PLAN_MIN = každý běh
+PLAN_MIN = 1          # živý spis (víc událostí za poslední měsíc) nebo nařízené jednání
+PLAN_AKTIVNI = 3      # událost za poslední měsíc nebo čerstvě založený spis
+PLAN_KLIDNY = 8       # událost za posledního půl roku
+PLAN_SPICI = 24       # starý spis bez pohybu
+PLAN_SKONCENY = 72    # skončená / pravomocná věc
+PLAN_NENALEZEN = 24   # API spis nezná
+PLAN_REZERVA_MIN = 10 # min, běh vezme i spisy splatné krátce po něm
+KODY_KONCE = {"ST_VEC_ODS", "ST_VEC_PUK", "ST_VEC_VYR"}
+KODY_ZRUSENI_JEDNANI = {"ZRUS_JED", "VYD_ROZH"}
+
+def interval_kontroly(data, dnes):
+    """Počet hodin do další kontroly podle surových událostí (datumy YYYY-MM-DD se porovnávají jako text)."""
+    udalosti_raw = (data or {}).get('udalosti') or []
+    if not udalosti_raw:
+        return PLAN_AKTIVNI
+    serazene = sorted((u.get('datum') or '', u.get('poradi') or 0, u.get('udalost')) for u in udalosti_raw)
+    pred = lambda dny: (dnes - datetime.timedelta(days=dny)).isoformat()
+
+    skonceno = False; jednani = None
+    for datum, _, kod in serazene:
+        if kod in KODY_KONCE: skonceno = True
+        elif kod == "ST_VEC_OBZ": skonceno = False
+        if kod == "NAR_JED": jednani = datum
+        elif kod in KODY_ZRUSENI_JEDNANI or kod in KODY_KONCE: jednani = None
+
+    # API nevrací termín jednání, jen datum nařízení -> hlídáme hustě ještě čtyři měsíce
+    if jednani and jednani >= pred(120):
+        return PLAN_MIN
+    if skonceno:
+        return PLAN_SKONCENY
+    za_mesic = sum(1 for datum, _, _ in serazene if datum >= pred(30))
+    if za_mesic >= 3: return PLAN_MIN
+    if za_mesic >= 1 or serazene[0][0] >= pred(90): return PLAN_AKTIVNI
+    if serazene[-1][0] >= pred(180): return PLAN_KLIDNY
+    return PLAN_SPICI
+
+def naplanuj_kontrolu(data, now):
+    """Čas další kontroly; jitter rozprostře zátěž, ale interval nikdy neprodlouží."""
+    hodiny = interval_kontroly(data, now.date()) if data is not None else PLAN_NENALEZEN
+    return now + datetime.timedelta(hours=hodiny * random.uniform(0.85, 1.0))
+
+def je_docasna_chyba(status):
+    """Timeout/výpadek sítě (None), 429 a 5xx má smysl zkusit znovu, 404 apod. ne."""
+    return status is None or status == 429 or status >= 500
+
+def stahni_odpoved_infosoudu(params):
+    """Vrací (http_status, surový JSON, latence_s). http_status None = timeout nebo chyba sítě."""
+    zacatek = time.monotonic()
+    try:
+        # Odeslání POST požadavku
+        r = requests.post(INFOSOUD_API_URL, json=sestav_payload(params), headers=sestav_hlavicky(), timeout=10)
+        latence = time.monotonic() - zacatek
+        
+        # Pokud API vrátí chybu (např. 404 Nenalezeno nebo 500)
+        zaznamenej_api(params, r.status_code, latence)
+        if r.status_code != 200:
+            return r.status_code, None, latence
+            
+        return 200, r.json(), latence
+        
+    except Exception as e:
+        print(f"Chyba při komunikaci s API: {e}")
+        latence = time.monotonic() - zacatek
+        zaznamenej_api(params, None, latence)
+        return None, None, latence
+
+def stahni_data_z_infosoudu(params):
+    status, data, _ = stahni_odpoved_infosoudu(params)
+    return zpracuj_odpoved_api(data) if status == 200 else None
+
+# --- ♻️ SDÍLENÍ DOTAZŮ ---
+ODPOVEDI_TTL = 120.0   # s, jak dlouho platí odpověď pro dotazy z UI (přidání, import)
+_odpovedi_cache = {}
+_odpovedi_lock = threading.Lock()
+
+def klic_dotazu(params):
+    """Normalizovaný klíč dotazu - stejný spis pod různými názvy má stejný klíč."""
+    return json.dumps(sestav_payload(params), sort_keys=True)
+
+def seskup_podle_dotazu(rows):
+    """
+    Rozdělí řádky jedné dávky lease do skupin se stejným dotazem na API (pořadí podle
+    prvního výskytu). Stejné dotazy z různých dávek sdílí odpověď přes OdpovediBehu.
+    """
+    skupiny = {}
+    for row in rows:
+        skupiny.setdefault(klic_dotazu(params_z_radku(row)), []).append(row)
+    return list(skupiny.values())
+
+class OdpovediBehu:
+    """
+    Odpovědi API sdílené v rámci jednoho běhu mezi skupinami se stejným dotazem, které
+    padly do různých dávek lease. Pamatuje si jen dotazy z klice (viz duplicitni_dotazy),
+    takže paměť neroste s počtem spisů. Stejný dotaz rozpracovaný ve dvou dávkách
+    souběžně se na API zeptá dvakrát - sdílí se jen už hotová odpověď.
+    """
+    def __init__(self, klice=()):
+        self.klice = set(klice)
+        self.lock = threading.Lock()
+        self.odpovedi = {}  # klic_dotazu -> raw (None = spis nenalezen)
+
+    def ziskej(self, params):
+        """(True, raw), pokud už odpověď v tomto běhu přišla, jinak (False, None)."""
+        if not self.klice: return False, None
+        klic = klic_dotazu(params)
+        with self.lock:
+            if klic in self.odpovedi:
+                return True, self.odpovedi[klic]
+        return False, None
+
+    def uloz(self, params, raw):
+        klic = klic_dotazu(params)
+        if klic in self.klice:
+            with self.lock:
+                self.odpovedi[klic] = raw
+
+def stahni_odpoved_infosoudu_cache(params):
+    """Jako stahni_odpoved_infosoudu, ale s krátkou pamětí; dočasné chyby se neukládají."""
+    klic = klic_dotazu(params)
+    with _odpovedi_lock:
+        zaznam = _odpovedi_cache.get(klic)
+        if zaznam and time.monotonic() - zaznam[0] < ODPOVEDI_TTL:
+            return zaznam[1], zaznam[2], 0.0
+    status, raw, latence = stahni_odpoved_infosoudu(params)
+    if not je_docasna_chyba(status):
+        with _odpovedi_lock:
+            now = time.monotonic()
+            for k in [k for k, z in _odpovedi_cache.items() if now - z[0] >= ODPOVEDI_TTL]:
+                del _odpovedi_cache[k]
+            _odpovedi_cache[klic] = (now, status, raw)
+    return status, raw, latence
+
+async def stahni_odpoved_infosoudu_async(client, params):
+    """Asynchronní varianta pro sdílený httpx klient (keep-alive pool)."""
+    zacatek = time.monotonic()
+    try:
+        r = await client.post(INFOSOUD_API_URL, json=sestav_payload(params), headers=sestav_hlavicky())
+        latence = time.monotonic() - zacatek
+        zaznamenej_api(params, r.status_code, latence)
+        if r.status_code != 200:
+            return r.status_code, None, latence
+        return 200, r.json(), latence
+    except Exception as e:
+        print(f"Chyba při komunikaci s API: {e}")
+        latence = time.monotonic() - zacatek
+        zaznamenej_api(params, None, latence)
+        return None, None, latence
+
+# --- 🚦 ADAPTIVNÍ LIMITER A BACKOFF ---
+class AdaptivniLimiter:
+    """
+    Token bucket pro každý soud + jeden globální (celé API).
+    Rychlost se řídí AIMD: úspěch s nízkou latencí ji pomalu zvyšuje,
+    429/5xx/timeout ji půlí, vysoká latence ji mírně sníží.
+    """
+    GLOBALNI = "*"
+
+    def __init__(self, rychlost_soud=1.0, rychlost_globalni=2.0, max_soud=5.0, max_globalni=20.0,
+                 min_rychlost=0.1, cilova_latence=2.0, burst=2.0):
+        self.lock = threading.Lock()
+        self.cilova_latence = cilova_latence
+        self.min_rychlost = min_rychlost
+        self.burst = burst
+        self.vychozi = {"soud": (rychlost_soud, max_soud), "globalni": (rychlost_globalni, max_globalni)}
+        self.buckets = {}
+
+    def _bucket(self, klic):
+        b = self.buckets.get(klic)
+        if b is None:
+            rychlost, strop = self.vychozi["globalni" if klic == self.GLOBALNI else "soud"]
+            b = {"rychlost": rychlost, "strop": strop, "tokeny": self.burst, "ts": time.monotonic()}
+            self.buckets[klic] = b
+        return b
+
+    def _vezmi_token(self, b, now):
+        b["tokeny"] = min(self.burst, b["tokeny"] + (now - b["ts"]) * b["rychlost"])
+        b["ts"] = now
+        b["tokeny"] -= 1.0
+        # Záporný stav = rezervace do budoucna, volající počká
+        return max(0.0, -b["tokeny"] / b["rychlost"])
+
+    def rezervuj(self, soud):
+        """Rezervuje slot pro jeden dotaz a vrátí, kolik sekund má volající počkat."""
+        with self.lock:
+            now = time.monotonic()
+            cekani_soud = self._vezmi_token(self._bucket(soud or "?"), now)
+            cekani_global = self._vezmi_token(self._bucket(self.GLOBALNI), now)
+        return max(cekani_soud, cekani_global)
+
+    def zaznamenej(self, soud, status, latence):
+        with self.lock:
+            for klic in (soud or "?", self.GLOBALNI):
+                b = self._bucket(klic)
+                if je_docasna_chyba(status):
+                    b["rychlost"] = max(self.min_rychlost, b["rychlost"] * 0.5)
+                elif latence > self.cilova_latence:
+                    b["rychlost"] = max(self.min_rychlost, b["rychlost"] * 0.9)
+                else:
+                    b["rychlost"] = min(b["strop"], b["rychlost"] + 0.1)
+
+# --- ⏱️ ČASOVÁNÍ BĚHU ---
+# Horní hranice košů histogramu v ms (poslední koš = nad 10 s)
+HISTOGRAM_HRANICE_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+NEJPOMALEJSI_POCET = 20
+# Úseky běhu: název -> popisek v UI
+USEKY_BEHU = {
+    "api": "Dotaz na Infosoud",
+    "limiter": "Čekání na limiter",
+    "backoff": "Backoff před opakováním",
+    "db_lease": "DB: výběr spisů (lease)",
+    "db_zapis": "DB: dávkový zápis výsledků",
+    "db_stav": "DB: zápis progresu",
+    "smtp": "SMTP: odeslání e-mailu",
+}
+
+def percentil_z_histogramu(kose, q):
+    """Odhad percentilu v ms = horní hranice koše, do kterého spadne (nad poslední hranicí None)."""
+    celkem = sum(kose)
+    if not celkem:
+        return None
+    hranice = celkem * q
+    soucet = 0
+    for i, pocet in enumerate(kose):
+        soucet += pocet
+        if soucet >= hranice:
+            return HISTOGRAM_HRANICE_MS[i] if i < len(HISTOGRAM_HRANICE_MS) else None
+    return None
+
+class StatistikaBehu:
+    """
+    Počítadla a časování jednoho běhu monitor_job (ukládají se vedle řádku v system_logs).
+    Úseky (USEKY_BEHU) se sčítají do histogramů, dotazy na API navíc po soudech
+    a do žebříčku nejpomalejších spisů.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pozadavky = 0
+        self.opakovani = 0
+        self.throttling = 0
+        self.chyby_api = 0
+        self.preskoceno = 0
+        self.sdileno = 0    # řádky, které převzaly odpověď jiného řádku se stejným dotazem
+        self.uspechy = 0    # odpovědi 200
+        self.vypadky = 0    # timeout / chyba sítě (status None)
+        self.vyjimky = 0    # výjimky při kontrole nebo vyhodnocení spisu
+        self.chyby_zapisu = 0  # spisy, jejichž výsledek se nepodařilo zapsat do DB
+        self.zmeny = 0      # spisy se změnou (zařazená notifikace)
+        self.useky = {}     # název -> {"pocet", "soucet_ms", "max_ms", "kose"}
+        self.soudy = {}     # soud -> {"pocet", "soucet_ms", "max_ms", "chyby"}
+        self.nejpomalejsi = []  # min-halda (ms, id spisu, soud)
+
+    def pricti(self, nazev, n=1):
+        with self.lock:
+            setattr(self, nazev, getattr(self, nazev) + n)
+        M_UDALOSTI_BEHU.labels(nazev).inc(n)
+
+    def _zapis_dobu(self, nazev, ms):
+        u = self.useky.get(nazev)
+        if u is None:
+            u = self.useky[nazev] = {"pocet": 0, "soucet_ms": 0.0, "max_ms": 0.0,
+                                     "kose": [0] * (len(HISTOGRAM_HRANICE_MS) + 1)}
+        u["pocet"] += 1
+        u["soucet_ms"] += ms
+        u["max_ms"] = max(u["max_ms"], ms)
+        u["kose"][next((i for i, h in enumerate(HISTOGRAM_HRANICE_MS) if ms <= h), len(HISTOGRAM_HRANICE_MS))] += 1
+
+    def zaznamenej_dobu(self, nazev, sekundy):
+        with self.lock:
+            self._zapis_dobu(nazev, 1000.0 * sekundy)
+
+    @contextlib.contextmanager
+    def mer(self, nazev):
+        """with stats.mer("db_zapis"): ... - doba bloku se započítá do úseku (i když spadne)."""
+        zacatek = time.monotonic()
+        try:
+            yield
+        finally:
+            self.zaznamenej_dobu(nazev, time.monotonic() - zacatek)
+
+    def zaznamenej_odpoved(self, status, latence=None, soud=None, cid=None):
+        with self.lock:
+            self.pozadavky += 1
+            if status == 200: self.uspechy += 1
+            elif status is None: self.vypadky += 1
+            if status == 429: self.throttling += 1
+            elif je_docasna_chyba(status): self.chyby_api += 1
+            if latence is None:
+                return
+            ms = 1000.0 * latence
+            self._zapis_dobu("api", ms)
+            s = self.soudy.get(soud or "?")
+            if s is None:
+                s = self.soudy[soud or "?"] = {"pocet": 0, "soucet_ms": 0.0, "max_ms": 0.0, "chyby": 0}
+            s["pocet"] += 1
+            s["soucet_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            if je_docasna_chyba(status): s["chyby"] += 1
+            polozka = (round(ms, 1), cid or 0, soud or "")
+            if len(self.nejpomalejsi) < NEJPOMALEJSI_POCET:
+                heapq.heappush(self.nejpomalejsi, polozka)
+            elif polozka > self.nejpomalejsi[0]:
+                heapq.heapreplace(self.nejpomalejsi, polozka)
+
+    def casovani(self):
+        """Souhrn pro sloupec system_logs.casovani_json."""
+        with self.lock:
+            useky = {n: {**u, "soucet_ms": round(u["soucet_ms"], 1), "max_ms": round(u["max_ms"], 1), "kose": list(u["kose"])}
+                     for n, u in self.useky.items()}
+            soudy = {k: {**v, "soucet_ms": round(v["soucet_ms"], 1), "max_ms": round(v["max_ms"], 1)}
+                     for k, v in self.soudy.items()}
+            nejpomalejsi = sorted(self.nejpomalejsi, reverse=True)
+        return {"hranice_ms": list(HISTOGRAM_HRANICE_MS), "useky": useky, "soudy": soudy,
+                "nejpomalejsi": [{"ms": ms, "pripad_id": cid or None, "soud": soud or None} for ms, cid, soud in nejpomalejsi]}
+
+def mer_usek(stats, nazev):
+    """stats.mer(nazev), nebo nic, když se časování nesbírá (volání mimo monitor_job)."""
+    return stats.mer(nazev) if stats is not None else contextlib.nullcontext()
+
+BACKOFF_ZAKLAD = 5.0      # s, první opakování
+BACKOFF_MAX = 300.0       # s, strop jednoho čekání
+MAX_POKUSU = 4            # včetně prvního pokusu
+
+def backoff_zpozdeni(pokus):
+    """Exponenciální backoff s jitterem pro n-tý neúspěšný pokus (od 1)."""
+    return min(BACKOFF_MAX, BACKOFF_ZAKLAD * (2 ** (pokus - 1))) * random.uniform(0.5, 1.5)
+
+def vloz_pripad(c, oznaceni, url, p, raw, otisk):
+    """INSERT jednoho spisu i s jeho událostmi (bez commitu - transakci řídí volající)."""
+    c.execute("""INSERT INTO pripady (oznaceni, url, params_json, pocet_udalosti, posledni_udalost, ma_zmenu, posledni_kontrola,
+                                      otisk_udalosti, posledni_datum_udalosti, posledni_poradi, realny_nazev_soudu,
+                                      typ, soud, senat, druh, cislo, rocnik, dalsi_kontrola)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
+              (oznaceni, url, json.dumps(p), otisk[3], posledni_udalost(raw) or "", False, get_now(), otisk[0], otisk[1], otisk[2],
+               SOUDY_MAPA.get(p['soud'], p['soud']), *sloupce_spisu(p), naplanuj_kontrolu(raw, get_now())))
+    cid = c.fetchone()[0]
+    uloz_udalosti(c, radky_udalosti(cid, p.get('soud'), raw, nova=False, vlozeno=get_now()))
+    return cid
+
+
+# --- 📦 WRITE-BEHIND: DÁVKOVÉ ZÁPISY VÝSLEDKŮ ---
+ZAPIS_DAVKA = 200         # max. případů v jedné transakci
+ZAPIS_INTERVAL = 5.0      # s, nejdelší doba, po kterou výsledek čeká v paměti
+
+class ZapisovaFronta:
+    """
+    Sbírá výsledky kontrol z workerů a zapisuje je po dávkách v jedné transakci
+    (UPDATE ... FROM (VALUES ...) + vícesloupcový INSERT do historie).
+    Flush proběhne při naplnění dávky nebo nejpozději po ZAPIS_INTERVAL sekundách,
+    takže při pádu procesu se ztratí nejvýše jedna nedopsaná dávka.
+    Notifikace jdou do outboxu ve stejné transakci jako změna v pripady.
+    Když dávka selže, zapíše se znovu po jednotlivých spisech; co neprojde ani tak,
+    počítá se do stats.chyby_zapisu a lease spisu na konci běhu vrátí uvolni_lease.
+    """
+    def __init__(self, davka=ZAPIS_DAVKA, interval=ZAPIS_INTERVAL, stats=None):
+        self.davka = davka
+        self.interval = interval
+        self.stats = stats
+        self.cond = threading.Condition()
+        # id -> [aktualizace, historie, udalosti, notifikace]; aktualizace =
+        # (id, pocet|None, posledni_udalost|None, zmena, kontrola, otisk, datum, poradi, dalsi)
+        self.polozky = {}
+        self.konec = False
+        self.pocet_davek = 0
+        self.vlakno = threading.Thread(target=self._smycka, name="zapisova-fronta", daemon=True)
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def pridej(self, aktualizace, historie=None, notifikace=None, udalosti=None):
+        # Notifikace se zařazuje právě u spisů se změnou
+        if notifikace and self.stats: self.stats.pricti("zmeny")
+        with self.cond:
+            polozka = self.polozky.setdefault(aktualizace[0], [None, [], [], []])
+            polozka[0] = aktualizace
+            if historie: polozka[1].append(historie)
+            if udalosti: polozka[2].extend(udalosti)
+            if notifikace: polozka[3].append(notifikace)
+            M_FRONTA.labels("zapis").set(len(self.polozky))
+            if len(self.polozky) >= self.davka:
+                self.cond.notify()
+
+    def zavri(self):
+        """Dopíše zbytek a ukončí vlákno (volat vždy na konci běhu)."""
+        with self.cond:
+            self.konec = True
+            self.cond.notify()
+        self.vlakno.join()
+
+    def _smycka(self):
+        while True:
+            with self.cond:
+                if not self.konec and len(self.polozky) < self.davka:
+                    self.cond.wait(timeout=self.interval)
+                konec = self.konec
+                # Řazení podle id = stejné pořadí zámků jako heartbeat lease
+                polozky = [self.polozky[k] for k in sorted(self.polozky)]; self.polozky = {}
+                M_FRONTA.labels("zapis").set(0)
+            if polozky:
+                self._flush(polozky)
+            if konec:
+                return
+
+    def _flush(self, polozky):
+        try:
+            self._zapis(polozky)
+            return
+        except Exception as e:
+            print(f"Chyba dávkového zápisu ({len(polozky)} případů): {e}")
+        if len(polozky) == 1:
+            if self.stats: self.stats.pricti("chyby_zapisu")
+            return
+        # Jeden vadný spis nesmí vzít s sebou celou dávku - zbytek se zapíše po jednom
+        chyby = 0
+        for polozka in polozky:
+            try:
+                self._zapis([polozka])
+            except Exception as e:
+                chyby += 1
+                print(f"Chyba zápisu případu {polozka[0][0]}: {e}")
+        if chyby and self.stats: self.stats.pricti("chyby_zapisu", chyby)
+
+    def _zapis(self, polozky):
+        aktualizace = [p[0] for p in polozky]
+        historie = [h for p in polozky for h in p[1]]
+        udalosti = [u for p in polozky for u in p[2]]
+        notifikace = [n for p in polozky for n in p[3]]
+        with mer_usek(self.stats, "db_zapis"), db_spojeni() as conn:
+            c = conn.cursor()
+            if aktualizace:
+                execute_values(c, """
+                    UPDATE pripady AS p SET
+                        pocet_udalosti = COALESCE(v.pocet, p.pocet_udalosti),
+                        posledni_udalost = COALESCE(v.posledni_udalost, p.posledni_udalost),
+                        ma_zmenu = CASE WHEN v.zmena THEN TRUE ELSE p.ma_zmenu END,
+                        posledni_kontrola = v.kontrola,
+                        otisk_udalosti = v.otisk,
+                        posledni_datum_udalosti = v.datum,
+                        posledni_poradi = v.poradi,
+                        dalsi_kontrola = v.dalsi,
+                        lease_worker = NULL,
+                        lease_do = NULL
+                    FROM (VALUES %s) AS v(id, pocet, posledni_udalost, zmena, kontrola, otisk, datum, poradi, dalsi)
+                    WHERE p.id = v.id
+                """, aktualizace, template="(%s::int, %s::int, %s::text, %s::boolean, %s::timestamptz, %s::text, %s::text, %s::int, %s::timestamptz)",
+                   page_size=self.davka)
+            if historie:
+                execute_values(c, "INSERT INTO historie (datum, uzivatel, akce, popis) VALUES %s",
+                               historie, page_size=self.davka)
+            if udalosti:
+                uloz_udalosti(c, udalosti, page_size=self.davka)
+            if notifikace:
+                # Stejný klíč (spis + otisk) = stejná změna, podruhé se nezařadí
+                execute_values(c, """
+                    INSERT INTO notifikace_outbox (klic, pripad_id, nazev, udalost, znacka, soud, url, vytvoreno, dalsi_pokus)
+                    VALUES %s ON CONFLICT (klic) DO NOTHING
+                """, [(*n, n[-1]) for n in notifikace], page_size=self.davka)
+            zvys_verzi_dat(c)
+            conn.commit()
+            self.pocet_davek += 1
+
+def uloz_udalosti(c, radky, page_size=200):
+    """Vloží nové události; upravené (stejné datum+pořadí, jiný kód) přepíše."""
+    execute_values(c, """
+        INSERT INTO udalosti (pripad_id, soud, datum, poradi, kod, text, nova, vlozeno) VALUES %s
+        ON CONFLICT (pripad_id, datum, poradi) DO UPDATE
+            SET kod = EXCLUDED.kod, text = EXCLUDED.text, nova = EXCLUDED.nova, vlozeno = EXCLUDED.vlozeno
+            WHERE udalosti.kod IS DISTINCT FROM EXCLUDED.kod
+    """, radky, page_size=page_size)
+
+def uloz_vysledek_pripadu(row, p, raw, zapisova_fronta):
+    """Vyhodnotí výsledek kontroly a předá ho do write-behind fronty (společné pro oba enginy)."""
+    cid, old_cnt, name, url, old_otisk = row.id, row.pocet_udalosti, row.oznaceni, row.url, row.otisk_udalosti
+    old_posledni = (row.posledni_datum_udalosti or '', row.posledni_poradi or 0)
+    souhrn = souhrn_udalosti(raw)
+    now = get_now()
+    if souhrn is None:
+        # Spis nenalezen - data necháme, jen odložíme další pokus
+        zapisova_fronta.pridej((cid, None, None, False, now, old_otisk, row.posledni_datum_udalosti, row.posledni_poradi,
+                                naplanuj_kontrolu(None, now)))
+        return None
+
+    datum, poradi, pocet = souhrn
+    dalsi = naplanuj_kontrolu(raw, now)
+    # Jiný počet nebo poslední (datum, poradi) = změna jistě; hash rozhoduje jen při shodě
+    # (úprava/smazání události), pro uložení se ale počítá v obou případech
+    stejny_souhrn = old_otisk is not None and pocet == old_cnt and (datum or '', poradi or 0) == old_posledni
+    otisk = hash_udalosti(raw)
+    if stejny_souhrn and otisk == old_otisk:
+        # Nic nového - jen čas kontroly, bez formátování událostí
+        zapisova_fronta.pridej((cid, None, None, False, now, otisk, datum, poradi, dalsi))
+        return True
+
+    # Z celého seznamu se formátuje jen poslední událost; nové řádky formátuje radky_udalosti
+    posledni = posledni_udalost(raw)
+    kod_soudu = p.get('soud')
+    # Bez uloženého otisku (starší řádky) rozhoduje počet; jinak i úprava/smazání události
+    ma_zmenu = pocet > old_cnt if old_otisk is None else True
+    if ma_zmenu:
+        # Posun posledního (datum, poradi) = přibyla událost; jinak byla existující upravena/odebrána
+        pribyla = pocet > old_cnt or (datum or '', poradi or 0) > old_posledni
+        akce = "Nová událost" if pribyla else "Úprava událostí"
+        # Do tabulky udalosti jen to, co je za posledním známým (datum, poradi); při úpravě celý seznam (upsert)
+        od = old_posledni if pribyla and old_otisk is not None else None
+        if old_otisk is None:
+            # Starší řádek bez otisku (tabulka udalosti prázdná): prvních old_cnt událostí je známá
+            # historie a jde tam bez příznaku; nové jsou jen ty za nimi
+            radky = radky_udalosti(cid, kod_soudu, raw, nova=False, vlozeno=now)
+            hranice = min(old_cnt, len(radky))
+            nove = [r[:6] + (True,) + r[7:] for r in radky[hranice:]]
+            udalosti = radky[:hranice] + nove
+        else:
+            nove = udalosti = radky_udalosti(cid, kod_soudu, raw, od=od, nova=True, vlozeno=now)
+        # Zjištění názvu soudu
+        nazev_soudu = SOUDY_MAPA.get(kod_soudu, kod_soudu)
+        spis_zn = spisova_znacka(p)
+        text_udalosti = "\n".join(r[5] for r in nove) if pribyla and (od is not None or old_otisk is None) and nove else posledni
+        zapisova_fronta.pridej(
+            (cid, pocet, posledni, True, now, otisk, datum, poradi, dalsi),
+            historie=(now, "🤖 Systém (Robot)", akce, f"Změna u {name}"),
+            notifikace=(f"{cid}:{otisk}", cid, name, text_udalosti, spis_zn, nazev_soudu, url, now),
+            udalosti=udalosti)
+    else:
+        # První otisk u staršího řádku: doplníme historii událostí (bez příznaku nová);
+        # počet se uloží taky, jinak by příští souhrn nesouhlasil a hlásil falešnou změnu
+        zapisova_fronta.pridej((cid, pocet, posledni, False, now, otisk, datum, poradi, dalsi),
+                               udalosti=radky_udalosti(cid, kod_soudu, raw, nova=False, vlozeno=now))
+    return True
+
+# --- 📈 HLÁŠENÍ PROGRESU (SLUČOVANÉ ZÁPISY) ---
+PROGRES_INTERVAL = 10.0   # s, nejčastější zápis progresu do system_status
+PROGRES_KROK = 5.0        # %, dřívější zápis při skoku o tolik procent
+
+class ReporterPostupu:
+    """
+    Drží progres běhu v paměti a do system_status ho propisuje nejvýše jednou
+    za PROGRES_INTERVAL sekund nebo po posunu o PROGRES_KROK procent.
+    Zápis dělá vlastní vlákno, takže aktualizuj() nikdy neblokuje workery ani event loop.
+    na_postup se volá při každém zápisu, kdy se progres posunul (heartbeat zámku běhu).
+    """
+    def __init__(self, broadcast, total, mode, interval=PROGRES_INTERVAL, krok=PROGRES_KROK, stats=None, na_postup=None):
+        self.broadcast = broadcast
+        self.stats = stats
+        self.na_postup = na_postup
+        self.total = total
+        self.mode = mode
+        self.interval = interval
+        self.krok = krok
+        self.cond = threading.Condition()
+        self.processed = 0
+        self.zapsano = 0
+        self.konec = False
+        self.pocet_zapisu = 0
+        self.vlakno = threading.Thread(target=self._smycka, name="reporter-postupu", daemon=True)
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def _procenta(self, n):
+        return 100.0 * n / self.total if self.total else 100.0
+
+    def pridej_celkem(self, n):
+        """Total roste s tím, co si worker zabral (víc workerů = každý má svůj díl)."""
+        with self.cond:
+            self.total += n
+
+    def aktualizuj(self, processed):
+        with self.cond:
+            self.processed = processed
+            if self._procenta(processed) - self._procenta(self.zapsano) >= self.krok:
+                self.cond.notify()
+
+    def zavri(self):
+        """Finální zápis a ukončení vlákna."""
+        with self.cond:
+            self.konec = True
+            self.cond.notify()
+        self.vlakno.join()
+
+    def _smycka(self):
+        while True:
+            with self.cond:
+                if not self.konec:
+                    self.cond.wait(timeout=self.interval)
+                konec = self.konec
+                processed = self.processed
+                total = self.total
+                zmena = processed != self.zapsano
+                self.zapsano = processed
+            if zmena or konec:
+                with mer_usek(self.stats, "db_stav"):
+                    self.broadcast(True, processed, total, self.mode)
+                if zmena and self.na_postup:
+                    self.na_postup()
+                self.pocet_zapisu += 1
+                # Log do konzole pro Heroku logs
+                print(f"Progress: {processed}/{total}")
+            if konec:
+                return
+
+# --- 🔒 LEASE SPISŮ (VÍCE WORKERŮ) ---
+LEASE_DAVKA = 100         # kolik splatných spisů si worker zabere najednou
+LEASE_SEKUND = 300        # platnost lease bez heartbeatu (pak si spis vezme jiný worker)
+HEARTBEAT_INTERVAL = 30.0 # s
+
+def _podminka_splatnosti():
+    """Splatné spisy: dalsi_kontrola do konce rezervy (viz PLAN_REZERVA_MIN)."""
+    return "(dalsi_kontrola IS NULL OR dalsi_kontrola <= %s)", get_now() + datetime.timedelta(minutes=PLAN_REZERVA_MIN)
+
+def pocet_splatnych():
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        podminka, do = _podminka_splatnosti()
+        c.execute(f"SELECT COUNT(*) FROM pripady WHERE {podminka}", (do,))
+        return c.fetchone()[0]
+
+def duplicitni_dotazy():
+    """Klíče dotazů (klic_dotazu), které mezi splatnými spisy sdílí víc řádků (starší duplicity)."""
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        podminka, do = _podminka_splatnosti()
+        c.execute(f"""SELECT typ, soud, senat, druh, cislo, rocnik FROM pripady WHERE {podminka}
+                      GROUP BY typ, soud, senat, druh, cislo, rocnik HAVING COUNT(*) > 1""", (do,))
+        return {klic_dotazu(dict(zip(("typ", "soud", "senat", "druh", "cislo", "rocnik"), r))) for r in c.fetchall()}
+
+def zaber_davku(worker_id, limit=LEASE_DAVKA):
+    """
+    Zabere dávku splatných spisů, které nikdo nedrží (nebo jejich lease vypršel).
+    SKIP LOCKED zajistí, že dva workery nikdy nedostanou stejný řádek.
+    Lease uvolní až zápis výsledku (ZapisovaFronta) nebo uvolni_lease().
+    """
+    with db_spojeni() as conn:
+        c = conn.cursor()
+        now = get_now()
+        podminka, do = _podminka_splatnosti()
+        sloupce = ", ".join(f"p.{s}" for s in RadekPripadu._fields)
+        c.execute(f"""
+            WITH k AS (
+                SELECT id FROM pripady
+                WHERE {podminka} AND (lease_do IS NULL OR lease_do < %s)
+                ORDER BY dalsi_kontrola NULLS FIRST, id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE pripady AS p SET lease_worker = %s, lease_do = %s
+            FROM k WHERE p.id = k.id
+            RETURNING {sloupce}
+        """, (do, now, limit, worker_id, now + datetime.timedelta(seconds=LEASE_SEKUND)))
+        rows = [RadekPripadu(*r) for r in c.fetchall()]
+        conn.commit()
+    return rows
+
+def uvolni_lease(worker_id):
+    """Uvolní vše, co worker ještě drží (přeskočené spisy, konec běhu)."""
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE pripady SET lease_worker = NULL, lease_do = NULL WHERE lease_worker = %s", (worker_id,))
+            conn.commit()
+    except Exception as e:
+        print(f"Chyba při uvolnění lease: {e}")
+
+PROUD_MAX_CEKA = LEASE_DAVKA  # max. skupin zabraných dopředu (čekajících v paměti)
+
+class ProudSpisu:
+    """
+    Iterátor skupin splatných spisů pro enginy. Vlákno si bere dávky přes lease
+    (zaber_davku) a plní omezenou frontu: další dávku zabere, až je ve frontě místo.
+    Paměť tak nezávisí na počtu spisů a první dotazy na API jdou hned po první dávce.
+    Bezpečný pro souběžné next() z více vláken.
+    """
+    _KONEC = object()
+
+    def __init__(self, worker_id, stats, max_ceka=PROUD_MAX_CEKA, na_davku=None):
+        self.worker_id = worker_id
+        self.stats = stats
+        self.na_davku = na_davku  # callback(počet zabraných řádků), např. ReporterPostupu.pridej_celkem
+        self.zabrano = 0
+        self.fronta = queue.Queue(maxsize=max_ceka)
+        self.konec = threading.Event()
+        self.chyba = None
+        self.vycerpano = False
+        self.vlakno = threading.Thread(target=self._plnic, name="proud-spisu", daemon=True)
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def _vloz(self, polozka):
+        while not self.konec.is_set():
+            try:
+                self.fronta.put(polozka, timeout=1.0)
+                M_FRONTA.labels("proud").set(self.fronta.qsize())
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _plnic(self):
+        try:
+            while not self.konec.is_set():
+                with self.stats.mer("db_lease"):
+                    davka = zaber_davku(self.worker_id)
+                if not davka: break
+                self.zabrano += len(davka)
+                if self.na_davku: self.na_davku(len(davka))
+                # Stejný spis sledovaný vícekrát = jeden dotaz na API, výsledek dostanou všechny řádky
+                skupiny = seskup_podle_dotazu(davka)
+                self.stats.pricti("sdileno", len(davka) - len(skupiny))
+                for skupina in skupiny:
+                    if not self._vloz(skupina): return
+        except Exception as e:
+            print(f"Chyba při výběru spisů: {e}")
+            self.chyba = e
+        finally:
+            self._vloz(self._KONEC)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.vycerpano:
+            raise StopIteration
+        polozka = self.fronta.get()
+        M_FRONTA.labels("proud").set(self.fronta.qsize())
+        if polozka is self._KONEC:
+            self.vycerpano = True
+            # Konec vrátíme do fronty i pro ostatní čtenáře
+            self.fronta.put(polozka)
+            raise StopIteration
+        return polozka
+
+    def preruse(self):
+        """
+        Zastaví výdej uprostřed běhu: nové dávky se nezabírají a čekající skupiny se zahodí
+        (jejich lease vrátí uvolni_lease). Rozdané skupiny doběhnou, pak enginy dostanou konec.
+        """
+        self.konec.set()
+        while True:
+            try: self.fronta.get_nowait()
+            except queue.Empty: break
+        self.fronta.put(self._KONEC)
+
+    def zavri(self):
+        self.konec.set()
+        self.vlakno.join()
+
+class HeartbeatLeasu:
+    """Vlákno, které workeru průběžně prodlužuje lease a hlásí, že žije."""
+    def __init__(self, worker_id, interval=HEARTBEAT_INTERVAL):
+        self.worker_id = worker_id
+        self.interval = interval
+        self.konec = threading.Event()
+        self.vlakno = threading.Thread(target=self._smycka, name="heartbeat-lease", daemon=True)
+
+    def start(self):
+        self.vlakno.start()
+        return self
+
+    def zavri(self):
+        self.konec.set()
+        self.vlakno.join()
+
+    def _smycka(self):
+        while not self.konec.wait(self.interval):
+            try:
+                with db_spojeni() as conn:
+                    c = conn.cursor()
+                    now = get_now()
+                    # Zámky v pořadí id a bez čekání na řádky, které právě zapisuje ZapisovaFronta
+                    # (jinak by se s jejím UPDATE ... FROM (VALUES) mohly zablokovat navzájem).
+                    # Přeskočený řádek dostane prodloužení v dalším kole, nebo ho flush rovnou uvolní.
+                    c.execute("""
+                        UPDATE pripady SET lease_do = %s
+                        WHERE id IN (SELECT id FROM pripady WHERE lease_worker = %s
+                                     ORDER BY id FOR UPDATE SKIP LOCKED)
+                    """, (now + datetime.timedelta(seconds=LEASE_SEKUND), self.worker_id))
+                    conn.commit()
+                    c.execute("UPDATE worker_status SET last_update = %s WHERE worker_id = %s", (now, self.worker_id))
+                    conn.commit()
+            except Exception as e:
+                print(f"Heartbeat: {e}")
+
+VYSLEDEK_OPAKOVAT = "opakovat"
+
+def uloz_vysledek_skupiny(skupina, raw, zapisova_fronta):
+    """Jedna odpověď API se rozdělí všem řádkům se stejným dotazem."""
+    for row in skupina:
+        try:
+            uloz_vysledek_pripadu(row, params_z_radku(row), raw, zapisova_fronta)
+        except Exception as e:
+            if zapisova_fronta.stats: zapisova_fronta.stats.pricti("vyjimky")
+            print(f"Chyba u případu ID {row.id}: {e}")
+    return True
+
+def zkontroluj_jeden_pripad(skupina, limiter, stats, zapisova_fronta, odpovedi=None):
+    """
+    skupina = řádky se stejným dotazem (viz seskup_podle_dotazu); API se volá jednou.
+    odpovedi = OdpovediBehu; dotaz, na který už v běhu odpověď přišla, se neopakuje.
+    """
+    cid = skupina[0].id
+    try:
+        p = params_z_radku(skupina[0])
+        if odpovedi:
+            hotovo, raw = odpovedi.ziskej(p)
+            if hotovo:
+                stats.pricti("sdileno", len(skupina))
+                return uloz_vysledek_skupiny(skupina, raw, zapisova_fronta)
+        soud = p.get('soud')
+        # Tempo určuje limiter místo pevného sleepu
+        cekani = limiter.rezervuj(soud)
+        stats.zaznamenej_dobu("limiter", cekani)
+        time.sleep(cekani)
+        status, raw, latence = stahni_odpoved_infosoudu(p)
+        limiter.zaznamenej(soud, status, latence)
+        stats.zaznamenej_odpoved(status, latence, soud, cid)
+        if je_docasna_chyba(status):
+            return VYSLEDEK_OPAKOVAT
+        if odpovedi: odpovedi.uloz(p, raw)
+        return uloz_vysledek_skupiny(skupina, raw, zapisova_fronta)
+    except Exception as e:
+        stats.pricti("vyjimky")
+        print(f"Chyba u případu ID {cid}: {e}")
+        return False
+
+async def zkontroluj_jeden_pripad_async(client, semafor, limiter, stats, zapisova_fronta, skupina, odpovedi=None):
+    cid = skupina[0].id
+    try:
+        p = params_z_radku(skupina[0])
+        if odpovedi:
+            hotovo, raw = odpovedi.ziskej(p)
+            if hotovo:
+                stats.pricti("sdileno", len(skupina))
+                return uloz_vysledek_skupiny(skupina, raw, zapisova_fronta)
+        soud = p.get('soud')
+        for pokus in range(1, MAX_POKUSU + 1):
+            async with semafor:
+                # Čekání na token běží v event loopu, neblokuje žádné vlákno
+                cekani = limiter.rezervuj(soud)
+                stats.zaznamenej_dobu("limiter", cekani)
+                await asyncio.sleep(cekani)
+                status, raw, latence = await stahni_odpoved_infosoudu_async(client, p)
+            limiter.zaznamenej(soud, status, latence)
+            stats.zaznamenej_odpoved(status, latence, soud, cid)
+            if not je_docasna_chyba(status):
+                if odpovedi: odpovedi.uloz(p, raw)
+                # Jen vložení do write-behind fronty, DB zápis proběhne v jejím vlákně
+                return uloz_vysledek_skupiny(skupina, raw, zapisova_fronta)
+            if pokus < MAX_POKUSU:
+                stats.pricti("opakovani")
+                # Případ se vrací do fronty: čeká mimo semafor, slot mezitím slouží ostatním
+                zpozdeni = backoff_zpozdeni(pokus)
+                stats.zaznamenej_dobu("backoff", zpozdeni)
+                await asyncio.sleep(zpozdeni)
+        stats.pricti("preskoceno", len(skupina))
+        return VYSLEDEK_OPAKOVAT
+    except Exception as e:
+        stats.pricti("vyjimky")
+        print(f"Chyba u případu ID {cid}: {e}")
+        return False
+
+# --- ⚙️ ENGINY PRO PARALELNÍ ZPRACOVÁNÍ ---
+MONITOR_ENGINES = ("threads", "async")
+
+def _spust_engine_vlakna(skupiny, on_progress, limiter, stats, zapisova_fronta, max_workers=3, odpovedi=None):
+    """skupiny = libovolný iterátor (i ProudSpisu); rozpracovaných je vždy nejvýš max_workers."""
+    processed = 0
+    zdroj = iter(skupiny)
+    vycerpano = False
+    fronta = collections.deque()  # opakování připravená ke spuštění
+    odlozene = []  # halda (cas_pripravy, poradi, skupina, pokus) - fronta opakování s backoffem
+    poradi = 0
+    bezici = {}
+    # max_workers=3 je ideální pro Heroku Free/Basic (šetří RAM i CPU)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while not vycerpano or fronta or odlozene or bezici:
+            now = time.monotonic()
+            while odlozene and odlozene[0][0] <= now:
+                _, _, skupina, pokus = heapq.heappop(odlozene)
+                fronta.append((skupina, pokus))
+            while len(bezici) < max_workers:
+                if fronta:
+                    skupina, pokus = fronta.popleft()
+                elif not vycerpano:
+                    skupina, pokus = next(zdroj, None), 1
+                    if skupina is None:
+                        vycerpano = True
+                        break
+                else:
+                    break
+                bezici[executor.submit(zkontroluj_jeden_pripad, skupina, limiter, stats, zapisova_fronta,
+                                       odpovedi=odpovedi)] = (skupina, pokus)
+            if not bezici:
+                if not odlozene: continue
+                # Zbývají jen odložená opakování
+                time.sleep(max(0.0, odlozene[0][0] - now))
+                continue
+
+            timeout = max(0.0, odlozene[0][0] - now) if odlozene else None
+            hotove, _ = wait(bezici, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in hotove:
+                skupina, pokus = bezici.pop(future)
+                if future.result() == VYSLEDEK_OPAKOVAT:
+                    if pokus < MAX_POKUSU:
+                        stats.pricti("opakovani")
+                        poradi += 1
+                        zpozdeni = backoff_zpozdeni(pokus)
+                        stats.zaznamenej_dobu("backoff", zpozdeni)
+                        heapq.heappush(odlozene, (time.monotonic() + zpozdeni, poradi, skupina, pokus + 1))
+                        continue
+                    stats.pricti("preskoceno", len(skupina))
+                processed += len(skupina)
+                M_SPISY.inc(len(skupina))
+                on_progress(processed)
+    return processed
+
+async def _monitor_async(skupiny, on_progress, limiter, stats, zapisova_fronta, concurrency, odpovedi=None):
+    """
+    Pevný počet konzumentů čte ze sdíleného iterátoru - tasky nevznikají pro všechny
+    spisy předem. Konzumentů je víc než slotů semaforu, aby čekání na backoff
+    (mimo semafor) nebrzdilo ostatní.
+    """
+    processed = 0
+    zdroj = iter(skupiny)
+    zamek_zdroje = asyncio.Lock()
+    semafor = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+        async def konzument():
+            nonlocal processed
+            while True:
+                async with zamek_zdroje:
+                    # next() může blokovat (čeká na dávku z DB), proto mimo event loop
+                    skupina = await asyncio.to_thread(next, zdroj, None)
+                if skupina is None:
+                    return
+                await zkontroluj_jeden_pripad_async(client, semafor, limiter, stats, zapisova_fronta, skupina,
+                                                    odpovedi=odpovedi)
+                processed += len(skupina)
+                M_SPISY.inc(len(skupina))
+                # Jen zápis do paměti, DB zápis dělá vlákno reporteru
+                on_progress(processed)
+
+        await asyncio.gather(*(konzument() for _ in range(concurrency * 2)))
+    return processed
+
+def _spust_engine_async(skupiny, on_progress, limiter, stats, zapisova_fronta, concurrency, odpovedi=None):
+    return asyncio.run(_monitor_async(skupiny, on_progress, limiter, stats, zapisova_fronta, concurrency, odpovedi))
+
+# --- 🔐 ZÁMEK BĚHU ---
+# Stejně pojmenované běhy se nepřekrývají (APScheduler, cron na worker.py, ruční spuštění).
+# Víc workerů najednou (lease) = každý s vlastním MONITOR_LOCK, např. "monitor_job:$DYNO".
+POLITIKY_ZAMKU = ("skip", "queue", "takeover")
+ZAMEK_FRONTA_MAX = 1800   # s, jak dlouho "queue" čeká na doběhnutí předchozího běhu
+ZAMEK_STALE = 300         # s bez heartbeatu = držitel visí
+ZAMEK_MAX_BEH = 3 * 3600  # s, běh delší než tohle se při "takeover" považuje za zaseknutý
+
+def zapis_udalost_behu(mode):
+    """Záznam do system_logs pro běh, který se kvůli zámku nespustil nebo převzal cizí zámek."""
+    try:
+        with db_spojeni() as conn:
+            c = conn.cursor()
+            now = get_now()
+            c.execute("INSERT INTO system_logs (start_time, end_time, mode, processed_count) VALUES (%s, %s, %s, 0)",
+                      (now, now, mode))
+            zvys_verzi_dat(c)
+            conn.commit()
+    except Exception as e:
+        print(f"Chyba zápisu do system_logs: {e}")
+
+class ZamekZtracen(Exception):
+    """Zámek běhu během kontroly převzal někdo jiný (nebo spadlo jeho spojení)."""
+
+class ZamekBehu:
+    """
+    Postgres advisory lock na vlastním spojení mimo pool. Při pádu procesu ho Postgres
+    uvolní sám; pro zaseknutý proces (živé spojení bez heartbeatu) slouží politika "takeover".
+    skip = běží-li jiný běh, tento se přeskočí; queue = počká (max ZAMEK_FRONTA_MAX);
+    takeover = zaseknutému držiteli ukončí spojení a zámek převezme, jinak jako skip.
+    Heartbeat nejde z vlastního vlákna, ale z postupu běhu (heartbeat() volá ReporterPostupu):
+    běh, který se nehýbe, přestane heartbeatovat a dá se převzít.
+    """
+    def __init__(self, nazev, politika, drzitel=None):
+        self.nazev = nazev
+        self.politika = politika
+        self.drzitel = drzitel or ID_WORKERU
+        self.conn = None
+        self.posledni_heartbeat = 0.0
+        self.ztracen = False
+        self.na_ztratu = None  # callback při ztrátě zámku, např. ProudSpisu.preruse
+
+    def _cizi_drzitel(self, c):
+        """(drzitel, pid, zaseknuty) - časy porovnává Postgres, stejně jak je uložil."""
+        now = get_now()
+        c.execute("""SELECT drzitel, pid, heartbeat IS NULL OR heartbeat < %s OR ziskano < %s
+                     FROM run_lock WHERE nazev = %s""",
+                  (now - datetime.timedelta(seconds=ZAMEK_STALE), now - datetime.timedelta(seconds=ZAMEK_MAX_BEH), self.nazev))
+        return c.fetchone()
+
+    def ziskej(self):
+        self.conn = psycopg2.connect(DB_URI)
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        c = self.conn.cursor()
+        c.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (self.nazev,))
+        ziskano = c.fetchone()[0]
+        if not ziskano:
+            drzitel = self._cizi_drzitel(c)
+            kdo = drzitel[0] if drzitel else "?"
+            if self.politika == "queue":
+                print(f"🔐 Zámek '{self.nazev}' drží {kdo}, čekám...")
+                zacatek = time.monotonic()
+                c.execute(f"SET lock_timeout = '{int(ZAMEK_FRONTA_MAX)}s'")
+                try:
+                    c.execute("SELECT pg_advisory_lock(hashtext(%s))", (self.nazev,))
+                    ziskano = True
+                    zapis_udalost_behu(f"⏳ Běh čekal {time.monotonic() - zacatek:.0f} s na doběhnutí ({kdo})")
+                except psycopg2.errors.LockNotAvailable:
+                    pass
+                c.execute("SET lock_timeout = 0")
+            elif self.politika == "takeover" and drzitel and drzitel[1] and drzitel[2]:
+                c.execute("SELECT pg_terminate_backend(%s)", (drzitel[1],))
+                c.execute("SET lock_timeout = '30s'")
+                try:
+                    c.execute("SELECT pg_advisory_lock(hashtext(%s))", (self.nazev,))
+                    ziskano = True
+                    zapis_udalost_behu(f"🔓 Převzat zaseknutý zámek běhu od {kdo}")
+                except psycopg2.errors.LockNotAvailable:
+                    pass
+                c.execute("SET lock_timeout = 0")
+            if not ziskano:
+                zapis_udalost_behu(f"⏭️ Běh přeskočen - předchozí ještě běží ({kdo})")
+                print(f"⏭️ Zámek '{self.nazev}' drží {kdo}, běh přeskočen.")
+                self.conn.close(); self.conn = None
+                return False
+
+        now = get_now()
+        c.execute("""
+            INSERT INTO run_lock (nazev, drzitel, pid, ziskano, heartbeat) VALUES (%s, %s, pg_backend_pid(), %s, %s)
+            ON CONFLICT (nazev) DO UPDATE SET drzitel = EXCLUDED.drzitel, pid = EXCLUDED.pid,
+                ziskano = EXCLUDED.ziskano, heartbeat = EXCLUDED.heartbeat
+        """, (self.nazev, self.drzitel, now, now))
+        self.posledni_heartbeat = time.monotonic()
+        return True
+
+    def heartbeat(self):
+        """
+        Prodlouží heartbeat (nejvýše jednou za HEARTBEAT_INTERVAL). Když řádek zámku už
+        nepatří tomuto držiteli (převzetí) nebo spadlo spojení se zámkem, zámek je ztracen:
+        nastaví se ztracen a zavolá na_ztratu.
+        """
+        if self.ztracen or time.monotonic() - self.posledni_heartbeat < HEARTBEAT_INTERVAL:
+            return
+        self.posledni_heartbeat = time.monotonic()
+        try:
+            # Spojení se zámkem (autocommit) - po pg_terminate_backend při převzetí selže samo
+            c = self.conn.cursor()
+            c.execute("UPDATE run_lock SET heartbeat = %s WHERE nazev = %s AND drzitel = %s",
+                      (get_now(), self.nazev, self.drzitel))
+            drzi = c.rowcount > 0
+        except Exception as e:
+            print(f"Heartbeat zámku: {e}")
+            drzi = False
+        if not drzi:
+            self.ztracen = True
+            print(f"🔓 Zámek '{self.nazev}' ztracen, běh se ukončuje.")
+            if self.na_ztratu: self.na_ztratu()
+
+    def uvolni(self):
+        if self.conn:
+            try:
+                c = self.conn.cursor()
+                c.execute("UPDATE run_lock SET drzitel = NULL, pid = NULL, heartbeat = NULL WHERE nazev = %s AND drzitel = %s",
+                          (self.nazev, self.drzitel))
+                c.execute("SELECT pg_advisory_unlock(hashtext(%s))", (self.nazev,))
+            except Exception as e:
+                print(f"Uvolnění zámku: {e}")
+            finally:
+                self.conn.close(); self.conn = None
+
+def monitor_job(status_hook=None, engine=None, concurrency=None, politika_zamku=None):
+    """
+    Spustí kontrolu pod zámkem běhu (viz ZamekBehu). Vrací False, pokud se běh
+    kvůli jinému běžícímu přeskočil.
+    """
+    politika = politika_zamku or get_secret("MONITOR_LOCK_POLITIKA") or "skip"
+    if politika not in POLITIKY_ZAMKU:
+        print(f"Neznámá politika zámku '{politika}', používám 'skip'.")
+        politika = "skip"
+    zamek = ZamekBehu(get_secret("MONITOR_LOCK") or "monitor_job", politika)
+    if not zamek.ziskej():
+        return False
+    try:
+        _proved_kontrolu(status_hook, engine, concurrency, zamek)
+        return True
+    finally:
+        zamek.uvolni()
+
+def _proved_kontrolu(status_hook=None, engine=None, concurrency=None, zamek=None):
+    """
+    Hlavní kontrolní logika pro automatickou prověrku spisů.
+    engine: "threads" (ThreadPoolExecutor) nebo "async" (asyncio + sdílený httpx klient).
+    zamek: ZamekBehu, jehož heartbeat se posílá s postupem; při jeho ztrátě se běh přeruší.
+    """
+    engine = engine or get_secret("MONITOR_ENGINE") or "threads"
+    if engine not in MONITOR_ENGINES:
+        print(f"Neznámý engine '{engine}', používám 'threads'.")
+        engine = "threads"
+    concurrency = int(concurrency or get_secret("MONITOR_CONCURRENCY") or 10)
+
+    worker_id = ID_WORKERU
+
+    def broadcast(is_running, progress=0, total=0, mode="Inicializace..."):
+        if status_hook:
+            status_hook(is_running, progress, total, mode)
+        else:
+            # Nouzový přímý zápis do DB, pokud by funkce nebyla předána
+            try:
+                # Spojení se vrací do poolu i při chybě zápisu (dřív tu při výjimce unikalo)
+                with db_spojeni() as conn_b, conn_b.cursor() as cb:
+                    zapis_stav(cb, is_running, progress, total, mode)
+                    conn_b.commit()
+            except Exception as e:
+                print(f"Brodcast error: {e}")
+
+    # --- 1. START ---
+    start_ts = get_now()
+    stats = StatistikaBehu()
+    # Kódy nasbírané mimo běh (UI, předchozí přerušený běh) se do hlášení tohoto běhu nepočítají
+    vyber_nezname_kody()
+    M_BEH_BEZI.set(1)
+    broadcast(True, 0, 0, "Startuji proces...")
+
+    try:
+        # --- 2. VÝBĚR SPLATNÝCH SPISŮ ---
+        # Každý spis má vlastní dalsi_kontrola (viz naplanuj_kontrolu). Workery si splatné
+        # spisy berou po dávkách přes lease, takže jich může běžet víc najednou.
+        rezim_text = "⏱️ Plánovaná kontrola"
+        # Jen orientačně a jako rozhodnutí, jestli vůbec startovat - progres počítá, co si tento worker zabral
+        total_count = pocet_splatnych()
+        broadcast(True, 0, 0, rezim_text)
+        
+        print(f"--- {rezim_text}: splatných {total_count} spisů (engine: {engine}, worker: {worker_id}) ---")
+
+        # --- 3. PARALELNÍ ZPRACOVÁNÍ ---
+        processed_now = 0
+        limiter = AdaptivniLimiter()
+        if total_count:
+            # Starší duplicitní spisy v různých dávkách lease sdílí odpověď přes celý běh
+            odpovedi = OdpovediBehu(duplicitni_dotazy())
+            zapisova_fronta = ZapisovaFronta(stats=stats).start()
+            odesilac = OdesilacOutboxu(stats=stats).start()
+            # Progres se drží v paměti, do DB jde jen občas (ne po každém případu)
+            reporter = ReporterPostupu(broadcast, 0, rezim_text, stats=stats,
+                                       na_postup=zamek.heartbeat if zamek else None).start()
+            heartbeat = HeartbeatLeasu(worker_id).start()
+            # Spisy tečou po dávkách přes omezenou frontu, enginy je berou průběžně
+            proud = ProudSpisu(worker_id, stats, na_davku=reporter.pridej_celkem).start()
+            if zamek: zamek.na_ztratu = proud.preruse
+            try:
+                if engine == "async":
+                    processed_now = _spust_engine_async(proud, reporter.aktualizuj, limiter, stats, zapisova_fronta, concurrency,
+                                                        odpovedi=odpovedi)
+                else:
+                    processed_now = _spust_engine_vlakna(proud, reporter.aktualizuj, limiter, stats, zapisova_fronta,
+                                                         odpovedi=odpovedi)
+                if proud.chyba: raise proud.chyba
+                if zamek and zamek.ztracen:
+                    raise ZamekZtracen(f"Zámek '{zamek.nazev}' převzal jiný běh")
+            finally:
+                proud.zavri()
+                # Finální flush - zbytek výsledků, čekající notifikace a poslední stav progresu
+                zapisova_fronta.zavri()
+                heartbeat.zavri()
+                # Co nebylo zapsáno (přeskočené po opakováních), vrátíme ostatním workerům
+                uvolni_lease(worker_id)
+                odesilac.zavri()
+                reporter.zavri()
+            print(f"DB: výsledky zapsány v {zapisova_fronta.pocet_davek} dávkách, progres v {reporter.pocet_zapisu} zápisech; "
+                  f"notifikace: {odesilac.odeslano}")
+        print(f"API: {stats.pozadavky} dotazů, {stats.opakovani} opakování, "
+              f"{stats.throttling}x 429, {stats.chyby_api}x chyba, {stats.preskoceno} přeskočeno, {stats.sdileno} sdíleno, "
+              f"{stats.chyby_zapisu}x chyba zápisu")
+        casovani = stats.casovani()["useky"]
+        if casovani:
+            print("Časování: " + ", ".join(f"{n} {u['soucet_ms'] / 1000:.1f} s/{u['pocet']}x" for n, u in casovani.items()))
+        nezname = vyber_nezname_kody()
+        if nezname:
+            print(f"Nepřeložené kódy událostí (doplnit přes registruj_kody_udalosti): {', '.join(nezname)}")
+
+        # --- 4. FINÁLNÍ LOGOVÁNÍ A ÚKLID ---
+        # Záznam o úspěšné kontrole do historie logů
+        with db_spojeni() as conn, conn.cursor() as c:
+            c.execute("""
+                INSERT INTO system_logs (start_time, end_time, mode, processed_count,
+                                         request_count, retry_count, throttled_count, error_count, skipped_count,
+                                         success_count, failure_count, exception_count, change_count, casovani_json) 
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (start_ts, get_now(), f"{rezim_text} · {worker_id}", processed_now,
+                  stats.pozadavky, stats.opakovani, stats.throttling, stats.chyby_api + stats.chyby_zapisu, stats.preskoceno,
+                  stats.uspechy, stats.vypadky, stats.vyjimky, stats.zmeny, json.dumps(stats.casovani())))
+            zvys_verzi_dat(c)
+            conn.commit()
+        
+        # Automatický úklid starých záznamů (historie > 30 dní)
+        vycistit_stare_logy(dny=30)
+
+    except Exception as e:
+        error_msg = f"CHYBA: {str(e)[:50]}"
+        print(f"Kritická chyba v monitor_job: {e}")
+        broadcast(False, 0, 0, error_msg)
+    finally:
+        M_BEH_BEZI.set(0)
+        M_BEH_DOBA.observe((get_now() - start_ts).total_seconds())
+        M_BEH_KONEC.set_to_current_time()
+        # Vždy přepneme stav do "Spí", i když to spadlo
+        broadcast(False, 0, 0, "Spí (Dokončeno)")
@@ -1,40 +1,66 @@
 # worker.py
-import app
-from app import get_db_connection, get_now
+# Importuje jen jádro (monitor.py) - žádný Streamlit, pandas ani UI kód
+import monitor
+from monitor import db_spojeni, get_now, zapis_stav
 import datetime
 import time
 import sys
+import argparse
 
 def set_db_status(is_running, progress=0, total=0, mode="Čekám..."):
-    """Zapíše aktuální stav workeru do sdílené tabulky v DB."""
-    conn = None; db_pool = None
+    """Zapíše aktuální stav workeru do sdílené tabulky v DB a pošle ho posluchačům v UI."""
     try:
-        conn, db_pool = get_db_connection()
-        with conn.cursor() as c:
-            c.execute("""
-                UPDATE system_status 
-                SET is_running = %s, progress = %s, total = %s, mode = %s, last_update = %s 
-                WHERE id = 1
-            """, (is_running, progress, total, mode, get_now()))
-            conn.commit()
+        with db_spojeni() as conn:
+            with conn.cursor() as c:
+                # Zápis + NOTIFY -> otevřené prohlížeče dostanou stav bez pollingu DB
+                zapis_stav(c, is_running, progress, total, mode)
+                conn.commit()
     except Exception as e:
         print(f"⚠️ Chyba při zápisu stavu do DB: {e}")
-    finally:
-        if conn and db_pool: 
-            db_pool.putconn(conn)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Infosoud Monitor - kontrola spisů")
+    parser.add_argument("--engine", choices=monitor.MONITOR_ENGINES, default=None,
+                        help="threads (výchozí) nebo async; jinak env MONITOR_ENGINE")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Max. souběžných dotazů pro async engine; jinak env MONITOR_CONCURRENCY")
+    parser.add_argument("--pri-souberu", choices=monitor.POLITIKY_ZAMKU, default=None,
+                        help="Když předchozí běh ještě běží: skip, queue nebo takeover (jen zaseknutý); jinak env MONITOR_LOCK_POLITIKA")
+    parser.add_argument("--init-db", action="store_true",
+                        help="Před kontrolou provede migrace schématu (jinak je dělá webová aplikace)")
+    parser.add_argument("--metriky-port", type=int, default=None,
+                        help="Port pro /metrics (Prometheus) po dobu běhu workeru; jinak env METRICS_PORT")
+    parser.add_argument("--jen-outbox", action="store_true",
+                        help="Jen odešle čekající notifikace z outboxu (bez kontroly spisů)")
+    return parser.parse_args()
 
 if __name__ == "__main__":
+    args = parse_args()
+    port = monitor.spust_exporter_metrik(args.metriky_port)
+    if port:
+        print(f"📊 Metriky: http://0.0.0.0:{port}/metrics")
+    if args.init_db:
+        monitor.init_db()
+    if args.jen_outbox:
+        celkem = monitor.odesli_outbox()
+        print(f"📮 Outbox: odesláno {celkem} notifikací.")
+        sys.exit(0)
+
     print(f"🚀 START WORKERU: {get_now().strftime('%d.%m.%Y %H:%M:%S')}")
     
     # 1. Označíme v DB, že začínáme
     set_db_status(True, 0, 0, "Inicializace...")
     
     try:
-        # 2. Spustíme hlavní logiku z app.py 
+        # 2. Spustíme hlavní logiku z monitor.py 
         # !!! KLÍČOVÁ ZMĚNA: Předáváme funkci set_db_status jako hook
-        app.monitor_job(status_hook=set_db_status)
+        probehlo = monitor.monitor_job(status_hook=set_db_status, engine=args.engine, concurrency=args.concurrency,
+                                   politika_zamku=args.pri_souberu)
         
-        print("✅ HOTOVO: Kontrola úspěšně dokončena.")
+        if probehlo:
+            print("✅ HOTOVO: Kontrola úspěšně dokončena.")
+        else:
+            print("⏭️ PŘESKOČENO: Předchozí běh ještě nedoběhl.")
     except Exception as e:
         print(f"❌ KRITICKÁ CHYBA: {e}")
         # Zapíšeme chybu do stavu, aby to uživatel viděl v UI
@@ -43,4 +69,9 @@ if __name__ == "__main__":
     finally:
         # 3. Označíme v DB, že jsme skončili (pokud se tak už nestalo uvnitř monitor_job)
         set_db_status(False, 0, 0, "Spí")
+        m = monitor.metriky_poolu()
+        if m:
+            print(f"🔌 DB pool: špička {m['spicka']}/{m['max']}, výpůjček {m['vypujcek']}, "
+                  f"čekání prům. {m['cekani_prumer_ms']} ms / max {m['cekani_max_ms']} ms, "
+                  f"timeoutů {m['timeoutu']}, neuvolněno {m['pujceno']}")
         print(f"🏁 KONEC WORKERU: {get_now().strftime('%H:%M:%S')}")